@@ -14,10 +14,13 @@ import salts_wf
 import initialize_BOC
 from initialize_BOC import BOC_core
 import numpy as np
-from numpy import genfromtxt
 import math
 import sys, re
 import subprocess
+from run_state import RunStateDB
+from deck_template import DeckTemplate
+import scale_output
+import retention
 
 SCALE_bin_path: str = os.getenv('SCALE_BIN', '/opt/scale6.3.1/bin/')
 
@@ -30,7 +33,7 @@ SCALE_bin_path: str = os.getenv('SCALE_BIN', '/opt/scale6.3.1/bin/')
 
 class EOC_Deck(object):
     'Initial EIRENE EOC KENO deck.'
-    def __init__(self):
+    def __init__(self, campaign_root: str = '~/EIRENE11/SD7pct'):
         ##################################
         # EOC core and running parameters
         ##################################
@@ -66,20 +69,38 @@ class EOC_Deck(object):
         self.queue:str = 'fill'                     # NECluster queue
         self.ppn:int = 64                           # ppn core count
         self.deck_name:str = 'EIRENE_EOC.inp'           # TRITON input file name
-        self.deck_path:str = os.path.expanduser('~/EIRENE11/SD7pct/BOC')                     # Where to run the TRITON deck
-        self.qsub_path:str = os.path.expanduser('~/EIRENE11/SD7pct/BOC/runEIRENE-Scale.sh')  # Full path to the qsub script
+        self.campaign_root:str = os.path.abspath(os.path.expanduser(campaign_root))   # Campaign directory; every file path is built from it
+        self.deck_path:str = os.path.join(self.campaign_root, 'BOC')                  # Where to run the TRITON deck
+        self.qsub_path:str = os.path.join(self.deck_path, 'runEIRENE-Scale.sh')       # Full path to the qsub script
         self.power:float = 400.0                    # Power in MW
         self.MTiHM:float = 6.883864319048779        # Initial MTiHM for BOC core
-        self.qsub_name:str = 'runEIRENE-Scale.sh'
+        self.qsub_name:str = 'runEIRENE-EOC.sh'     # Not runEIRENE-Scale.sh: the EOC job shares the step directory with TRITON
+        self.out_name:str = 'EIRENE_EOC.out'        # KENO output of the EOC deck
+        self.run_state_file:str = os.path.join(self.campaign_root, 'run_state.db')   # Run-state database written by run_sourdough.py
+        self.run_state = None         # RunStateDB, opened on first use
+        self.deck_templates = {}      # Cached DeckTemplate of each deck type (core parameters bound on first use)
 
 
-    def get_EOC_burned_salt_adens(self):
+    def get_template(self, name, text):
+        'Returns the cached DeckTemplate of a deck, with the {self.*} core parameters rendered in on first use.'
+        if name not in self.deck_templates:
+            self.deck_templates[name] = DeckTemplate(text).bind(self=self)
+        return self.deck_templates[name]
+
+    def step_path(self, iter):
+        'Returns the absolute path of a depletion step directory.'
+        return os.path.join(self.campaign_root, 'dep_step_{}'.format(iter))
+
+    def get_EOC_burned_salt_adens(self, iter):
         'Returns the number of atoms for each constituent of the burned salt.'
-        output = subprocess.run([f"{SCALE_bin_path}/obiwan", "view", "-format=csv", "-prec=10", "-units=atom", "-idform='{:Ee}{:AAA}{:m}'", self.f71_name], capture_output=True)
+        f71_file = os.path.join(self.step_path(iter), self.f71_name)     # End-of-step TRITON output
+        with retention.local_copy(f71_file) as f71_local:     # The step may already be archived
+            output = subprocess.run([f"{SCALE_bin_path}/obiwan", "view", "-format=csv", "-prec=10", "-units=atom", "-idform='{:Ee}{:AAA}{:m}'", f71_local], capture_output=True)
         output = output.stdout.decode().split("\n")
         densities = {} # densities[nuclide] = (density at position 0 of f71 file)
         skip = ["case", "step", "time", "power", "flux", "volume"]
         regexp = re.compile(r"(?P<elem>[a-zA-Z]+)(?P<num>\d+)(?P<meta>m)?")
+        pos = scale_output.end_position(self.get_run_state().get(iter, 'nlib') or 1)    # End of the step (2 for a one-library step)
         for line in output:
             data = line.split(',')
             if data[0].strip() in skip:
@@ -92,7 +113,7 @@ class EOC_Deck(object):
                     nuclide = elem + "-" + str(num) + "m"   # for metastable isotopes
                 else:
                     nuclide = elem + "-" + str(num)
-                densities[nuclide] = float(data[2])  # The [2] here is what causes the code to return only the densities at position 2 of the f71 file (position 0 is isotope names, 1 is BOC data)
+                densities[nuclide] = float(data[pos])  # Only the densities at the end-of-step position of the f71 file (position 0 is isotope names, 1 is BOC data)
 
         # **** Extract Everything Listed Below: ****
         
@@ -668,16 +689,21 @@ class EOC_Deck(object):
         
         return burned_salt_vector
 
+    def get_run_state(self):
+        'Returns the run-state database of the campaign, opening it on first use.'
+        if self.run_state is None:
+            self.run_state = RunStateDB(self.run_state_file)
+        return self.run_state
+
     def read_TRITON_height(self, iter):
-        'Reads the refuel height file for the current depletion step (for depletion steps past the BOC run).'
-        filename = "TRITON_height_step_{}.out".format(iter)
-        salt_plenum_height = genfromtxt("{}".format(filename), delimiter='')
+        'Reads the refuel height for the current depletion step from the run-state database (for depletion steps past the BOC run).'
+        salt_plenum_height = self.get_run_state().get(iter, 'triton_height', self.step_path(iter))
         return salt_plenum_height
 
-    def write_EOC_scale_mat(self):
+    def write_EOC_scale_mat(self, iter):
         'Returns a SCALE material composition block for the refuel salt mixed in with the burned salt.'
         enrich_percent = self.renrich*100    # Enrichment percent for refuel
-        burned_salt_adens = self.get_EOC_burned_salt_adens()
+        burned_salt_adens = self.get_EOC_burned_salt_adens(iter)
         isotopes = ["li-6", "li-7", "be-9", "f-19", "u-234", "u-235", "u-236", "u-238", "h-1", "h-2", "h-3", "he-3", "he-4", "be-7",
                     "b-10", "b-11", "n-14", "n-15", "o-16", "o-17", "na-23", "mg-24", "mg-25", "mg-26",
                     "al-27", "si-28", "si-29", "si-30", "p-31", "s-32", "s-33", "cl-35", "cl-37",
@@ -720,11 +746,10 @@ class EOC_Deck(object):
     
     def write_EOC_KENO(self, iter):
         'Writes a new KENO deck for the EOC depletion.'
-        run_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
-        os.chdir(run_path)
-        scale_fuel = self.write_EOC_scale_mat()
+        run_path = self.step_path(iter)
+        scale_fuel = self.write_EOC_scale_mat(iter)
         h = self.read_TRITON_height(iter)
-        keno_deck = f'''=csas6 parm=(   )
+        keno_deck = self.get_template('keno', '''=csas6 parm=(   )
 EIRENE SCALE/CSAS model, UF4 mol% = {self.UF4molpct} and refuel enrichment {self.renrich}
 ce_v7.1
 
@@ -1024,23 +1049,32 @@ end array
 end data
 
 end
-        '''
+        ''')
 
-        fout = open(self.deck_name, "w")  # Dump deck into file
-        fout.write(keno_deck)
-        fout.close()
+        keno_deck.write(os.path.join(run_path, self.deck_name), scale_fuel=scale_fuel, h=h)  # Dump deck into file
 
     def run_SCALE(self, iter):
       'Submits SCALE job.'
-      run_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))            # Make the depletion step directory
-      os.chdir(run_path)
-      os.system('qsub runEIRENE-Scale.sh')
+      subprocess.run(['qsub', self.qsub_name], cwd=self.step_path(iter))
+
+    def submitted(self, iter) -> bool:
+        'Checks whether the EOC deck of a depletion step was already written and submitted.'
+        return os.path.exists(os.path.join(self.step_path(iter), self.qsub_name))
+
+    def done(self, iter) -> bool:
+        'Checks whether the EOC KENO run of a depletion step has finished.'
+        return scale_output.keno_finished(os.path.join(self.step_path(iter), self.out_name))
+
+    def submit(self, iter):
+        'Writes and submits the EOC deck of a depletion step whose .f71 file is ready.'
+        self.write_EOC_KENO(iter)
+        self.write_qsub_file(iter)
+        self.run_SCALE(iter)
 
 
     def write_qsub_file(self, iter):
         'Writes a single qsub file outside of the refuel directories.'
-        deck_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
-        os.chdir(deck_path)
+        deck_path = self.step_path(iter)
         shell_content = '''
 #!/bin/bash
 
@@ -1059,8 +1093,8 @@ export DATA=/opt/scale6.3_data
 
 export HDF5_USE_FILE_LOCKING=FALSE
 
-scalerte -m -N 32 EIRENE.inp'''
-        s = open(self.qsub_name, 'w')
+scalerte -m -N 32 ''' + self.deck_name
+        s = open(os.path.join(deck_path, self.qsub_name), 'w')
         s.write(shell_content)
         s.close()
 
@@ -22,18 +22,24 @@ import sys, re
 import subprocess
 import EOC_deck
 from EOC_deck import EOC_Deck
+import dry_run
 
 if __name__ == '__main__':
     print("This master EOC script creates and runs an EOC deck for each depletion step (BOC excluded).")
-    input("Press Ctrl+C to quit, or press enter to run it.")
-    eoc = EOC_Deck()
+    dry = '--dry-run' in sys.argv      # Fake SCALE and qsub, see dry_run.py
+    args = [a for a in sys.argv[1:] if a != '--dry-run']
+    if not dry:
+        input("Press Ctrl+C to quit, or press enter to run it.")
+    elif not args:
+        args = [os.path.join(dry_run.ROOT, 'SD7pct')]
+    eoc = EOC_Deck(*args[:1])    # Optional campaign root directory (default ~/EIRENE11/SD7pct)
+    if dry:
+        dry_run.enable(eoc.campaign_root)
     iter = np.arange(1, 301, 1)        # Depletion steps
     for i in iter:
-        run_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(i))
-        os.chdir(run_path)
-        eoc.write_EOC_KENO(i)
-        eoc.write_qsub_file(i)
-        eoc.run_SCALE(i)
+        if eoc.submitted(i):
+            continue                   # Already submitted by the orchestrator or master script while the step ran
+        eoc.submit(i)
     print("*******************************************")
     print("All done! The atoms are very happy now :D")
     print("*******************************************")
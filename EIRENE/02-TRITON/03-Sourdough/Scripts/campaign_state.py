@@ -0,0 +1,60 @@
+# ******************************************************************************************************
+#
+#                       Sourdough Campaign Checkpoint / Resume State
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  Records the last completed stage of every depletion step in a small JSON file, so a master
+#  script that crashed or was killed picks up from where it stopped instead of from step 1.
+#
+# *******************************************************************************************************
+
+import json
+import os
+
+# Stages of a single depletion step, in the order they complete
+STAGES = ['decks_written',       # Refuel KENO decks written and submitted
+          'keno_done',           # k-eff data extracted to data-temp.out
+          'crit_found',          # Critical refuel saved to the run-state database
+          'triton_submitted',    # TRITON deck written and submitted
+          'f71_ready']           # TRITON finished; .f71 available for the next step
+
+
+class CampaignState(object):
+    'Per-step stage record of a Sourdough campaign, saved to state_file after every change.'
+    def __init__(self, state_file: str):
+        self.state_file:str = state_file
+        self.steps = {}          # steps[step] = last completed stage
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r') as f:
+                self.steps = {int(k): v for k, v in json.load(f).items()}
+
+    def stage(self, step):
+        'Returns the last completed stage of a depletion step (None if nothing is done yet).'
+        return self.steps.get(int(step))
+
+    def done(self, step, stage: str) -> bool:
+        'Checks whether a depletion step has completed the given stage.'
+        last = self.stage(step)
+        if last is None:
+            return False
+        return STAGES.index(last) >= STAGES.index(stage)
+
+    def mark(self, step, stage: str):
+        'Records a completed stage and saves the state file atomically.'
+        if stage not in STAGES:
+            raise ValueError("Unknown depletion step stage: " + stage)
+        self.steps[int(step)] = stage
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({str(k): v for k, v in sorted(self.steps.items())}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.state_file)    # Never leaves a half-written state file behind
+
+    def resume_step(self) -> int:
+        'Returns the first depletion step that has not finished (1 for a new campaign).'
+        step = 1
+        while self.done(step, 'f71_ready'):
+            step += 1
+        return step
@@ -0,0 +1,71 @@
+# ******************************************************************************************************
+#
+#                       SCALE Deck Templates Assembled From Cached Fragments
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  A deck template is split once into its static text and the few fields that change from deck to
+#  deck (fuel composition, plenum height h, power density, npg/gen). The core parameters are rendered
+#  into the static text once per campaign with bind(), so each new deck is just the cached fragments
+#  joined around the variable blocks and written to disk in one buffered write.
+#
+# *******************************************************************************************************
+
+from string import Formatter
+
+_formatter = Formatter()
+
+
+class DeckTemplate(object):
+    'SCALE deck text with {field} placeholders, split into static fragments once.'
+    def __init__(self, text: str = None):
+        self.literals = []       # Static text before each field, plus the text after the last field
+        self.fields = []         # (field name, format spec, conversion) of each field
+        if text is None:
+            return
+        for literal, field, spec, conv in _formatter.parse(text):
+            self._append(literal, None if field is None else (field, spec, conv))
+        if len(self.literals) == len(self.fields):
+            self.literals.append('')
+
+    def _append(self, literal, field=None):
+        'Adds static text (merged into the previous fragment if there is no field between them) and a field.'
+        if len(self.literals) > len(self.fields):
+            self.literals[-1] += literal
+        else:
+            self.literals.append(literal)
+        if field is not None:
+            self.fields.append(field)
+
+    def _value(self, field, values) -> str:
+        'Formats one field from the values passed to bind() or render().'
+        name, spec, conv = field
+        obj = _formatter.get_field(name, (), values)[0]
+        return _formatter.format_field(_formatter.convert_field(obj, conv), spec)
+
+    def bind(self, /, **values):
+        '''Returns a new template with every field whose root name is in values rendered into the static text
+           (e.g. bind(self=deck) fills all {self.*} core parameters).'''
+        bound = DeckTemplate()
+        for literal, field in zip(self.literals, self.fields):
+            root = field[0].split('.')[0].split('[')[0]
+            if root in values:
+                bound._append(literal + self._value(field, values))
+            else:
+                bound._append(literal, field)
+        bound._append(self.literals[-1])
+        return bound
+
+    def render(self, /, **values) -> str:
+        'Returns the deck text with the remaining fields filled in from values.'
+        parts = []
+        for literal, field in zip(self.literals, self.fields):
+            parts.append(literal)
+            parts.append(self._value(field, values))
+        parts.append(self.literals[-1])
+        return ''.join(parts)
+
+    def write(self, filename: str, /, **values):
+        'Writes the rendered deck to filename in a single buffered write.'
+        with open(filename, 'w', buffering=1 << 20) as f:
+            f.write(self.render(**values))
@@ -0,0 +1,362 @@
+# ******************************************************************************************************
+#
+#                       Sourdough Dry Run: Fake scalerte, obiwan and qsub
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  Replays a Sourdough campaign without a cluster or SCALE, to benchmark the orchestration overhead
+#  of the drivers (deck writing, parsing, polling, database, archiving) and to test their restarts.
+#  The fake queue wait and run times (DEFAULT_LATENCY, or the DRY_RUN_QUEUE, DRY_RUN_KENO,
+#  DRY_RUN_TRITON and DRY_RUN_POLL environment variables, in seconds) set how long a step takes.
+#  enable() writes small wrapper scripts named qsub, qdel, scalerte, obiwan and module into a stub
+#  directory and puts it first on PATH and in SCALE_BIN; the wrappers call this module back, except
+#  qsub and module, which are plain shell scripts (called for every job, so they start no Python).
+#
+#    qsub      prints a job ID and runs the job script in the background after the queue latency
+#    qdel      kills a job started by the fake qsub and appends its ID to the qdel log
+#    scalerte  csas6 decks: streams a KENO generation table into the .out file, then the k-eff summary
+#              t6-depl decks: writes a TRITON .out file and a fake .f71 file (JSON, read by the fake obiwan)
+#    obiwan    prints the nuclide table of a fake .f71 file in the obiwan CSV layout
+#
+#  k-eff comes from a toy model of the fissile fraction of the heavy metal in fuel mixture 1, so
+#  the refuel search, fits and TRITON steps behave like a real campaign. The KENO noise is seeded
+#  from the deck, so a deck always gives the same k-eff and a resumed campaign ends where an
+#  uninterrupted one does. ORIGEN decks are not faked.
+#
+#  DRY_RUN_CRASH=step:stage makes the master script exit hard right after it records that stage
+#  of that depletion step (see crash_after), like a killed job would.
+#
+#  Usage:  python master_cluster.py [campaign root] --dry-run
+#          python orchestrator.py [enrichments] --dry-run
+#
+# *******************************************************************************************************
+
+import os
+import re
+import sys
+import json
+import time
+import signal
+import zlib
+import numpy as np
+
+ROOT = '~/sourdough-dry-run'      # Default root directory of dry-run campaigns
+STUBS = ['qsub', 'qdel', 'scalerte', 'obiwan', 'module']
+JOBS_DIR = 'jobs'                 # Process group of each fake job, in the stub directory
+QDEL_LOG = 'qdel.log'             # IDs of the jobs removed with the fake qdel, in the stub directory
+NUCLIDE_FILE = 'nuclides.json'    # Every nuclide the drivers look up in obiwan output, in the stub directory
+CRASH_EXIT: int = 75              # Exit code of a master script stopped by DRY_RUN_CRASH
+
+# Shell stubs: qsub prints a job ID and runs the job script from the current directory in its own process group
+# after the queue latency (qdel kills that group); environment modules do nothing in a dry run
+SHELL_STUBS = {'qsub': '''#!/bin/sh
+for script; do :; done
+job_id="$(date +%s%N | cut -c7-16).dryrun"
+PBS_O_WORKDIR="$PWD" PBS_JOBID="$job_id" setsid /bin/sh -c 'sleep "$DRY_RUN_QUEUE"; exec bash "$0" > "$1" 2>&1' \\
+    "$script" "$(basename "$script").o${{job_id%.dryrun}}" < /dev/null > /dev/null 2>&1 &
+echo $! > "$DRY_RUN_DIR/{jobs}/$job_id"
+echo "$job_id"
+'''.format(jobs=JOBS_DIR),
+               'module': '#!/bin/sh\nexit 0\n'}
+
+# Fake latencies in seconds (queue wait, KENO and TRITON run time, driver polling interval)
+DEFAULT_LATENCY = {'queue': 0.2, 'keno': 0.5, 'triton': 1.0, 'poll': 0.2}
+
+# Toy physics
+K_SLOPE = 8.0                     # d(k-eff)/d(fissile fraction of the heavy metal)
+FISSILE_CRIT = 0.0265             # Critical fissile fraction (the BOC core is just critical)
+FISSILE = ['u-233', 'u-235', 'pu-239', 'pu-241']
+HM_ELEMENTS = ['th', 'pa', 'u', 'np', 'pu', 'am', 'cm', 'bk', 'cf', 'es', 'fm']   # SCALE leaves actinium out of MTHM
+CONVERSION = 0.3                  # Pu-239 bred from U-238 per fission
+FISSIONS_PER_MWD = 86400e6 / 3.204e-11    # Fissions per MW-day
+SIG_GEN = 0.5                     # k-eff std. dev. of a single generation times sqrt(npg)
+CHUNKS = 20                       # Number of pieces a KENO generation table is written in
+
+# BOC fuel salt for seed_boc, FLiBe-UF4 (5 mol% UF4, 2.65 % enriched) in atoms/barn-cm
+BOC_ADENS = {'li-6': 1.0e-6, 'li-7': 1.96e-2, 'be-9': 9.8e-3, 'f-19': 4.9e-2,
+             'u-234': 2.0e-7, 'u-235': 3.975e-5, 'u-238': 1.46e-3}
+
+# Material line of mixture 1 in the decks Refuel_Deck and EOC_Deck write: nuclide 1 0 atom-density temperature end
+MAT_RE = re.compile(r'^\s*([a-z]+-\d+m?)\s+1\s+0\s+([-+.0-9Ee]+)\s+[.0-9]+\s+end', re.M | re.I)
+FEED_RE = re.compile(r'^\s*([a-z]+-\d+m?)\s+13\s+0\s+([-+.0-9Ee]+)\s+[.0-9]+\s+end', re.M | re.I)    # Feed tank (FEED_MIX)
+FEED_RATE_RE = re.compile(r'^\s*rates\s+([-+.0-9Ee]+)', re.M)
+NUCLIDE_RE = re.compile(r"densities\['([^']+)'\]")
+
+
+def stub_dir(campaign_root):
+    'Returns the directory of the stub executables of a dry-run campaign.'
+    return os.path.join(os.path.abspath(os.path.expanduser(campaign_root)), 'dry_run_bin')
+
+
+def latency(name: str, value=None) -> float:
+    'Returns a fake latency in seconds: value if given, else the DRY_RUN_<NAME> environment variable, else DEFAULT_LATENCY.'
+    if value is not None:
+        return float(value)
+    return float(os.environ.get('DRY_RUN_' + name.upper(), DEFAULT_LATENCY[name]))
+
+
+def enable(campaign_root, *drivers, queue: float = None, keno: float = None, triton: float = None, poll: float = None):
+    '''Sets up the stub executables of a dry-run campaign and puts them in front of the real ones for this process
+       and everything it starts. queue, keno and triton are the fake queue wait and job run times and poll the
+       polling interval of the given Refuel_Deck drivers, in seconds (see latency for the defaults).'''
+    queue, keno, triton, poll = [latency(n, v) for n, v in zip(['queue', 'keno', 'triton', 'poll'], [queue, keno, triton, poll])]
+    bin_dir = stub_dir(campaign_root)
+    os.makedirs(os.path.join(bin_dir, JOBS_DIR), exist_ok=True)
+    for name in STUBS:
+        filename = os.path.join(bin_dir, name)
+        with open(filename, 'w') as f:
+            if name in SHELL_STUBS:
+                f.write(SHELL_STUBS[name])
+            else:
+                f.write('#!/bin/sh\nexec "{}" "{}" {} "$@"\n'.format(sys.executable, os.path.abspath(__file__), name))
+        os.chmod(filename, 0o755)
+    with open(os.path.join(bin_dir, NUCLIDE_FILE), 'w') as f:
+        json.dump(driver_nuclides(), f)
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ.get('PATH', '')
+    os.environ['SCALE_BIN'] = bin_dir
+    os.environ['DRY_RUN_DIR'] = bin_dir
+    os.environ['DRY_RUN_QUEUE'] = str(queue)
+    os.environ['DRY_RUN_KENO'] = str(keno)
+    os.environ['DRY_RUN_TRITON'] = str(triton)
+    os.environ['DRY_RUN_POLL'] = str(poll)
+    for name in ['run_sourdough', 'EOC_deck', 'scale_output', 'initialize_BOC']:
+        if name in sys.modules:                 # SCALE_BIN was read when they were imported
+            sys.modules[name].SCALE_bin_path = bin_dir
+    for decks in drivers:
+        if hasattr(decks, 'poll_wait'):
+            decks.poll_wait = poll
+    print("Dry run: fake SCALE and qsub in {} ({} s queue, {} s KENO, {} s TRITON).".format(bin_dir, queue, keno, triton))
+    return bin_dir
+
+
+def driver_nuclides():
+    'Returns every nuclide the drivers read out of obiwan output, so that the fake .f71 files have all of them.'
+    here = os.path.dirname(os.path.abspath(__file__))
+    nuclides = set(BOC_ADENS)
+    for name in ['run_sourdough.py', 'EOC_deck.py']:
+        with open(os.path.join(here, name), 'r') as f:
+            nuclides.update(NUCLIDE_RE.findall(f.read()))
+    return sorted(nuclides)
+
+
+def crash_after(state):
+    '''Makes a CampaignState exit the process hard (exit code CRASH_EXIT, no clean-up) right after it records the
+       step:stage given in DRY_RUN_CRASH. Does nothing if that is not set.'''
+    if not os.environ.get('DRY_RUN_CRASH'):
+        return
+    step, stage = os.environ['DRY_RUN_CRASH'].split(':')
+    mark = state.mark
+
+    def mark_and_crash(s, st):
+        mark(s, st)
+        if int(s) == int(step) and st == stage:
+            print("Dry run: crashing after stage '{}' of depletion step {}.".format(st, s), flush=True)
+            os._exit(CRASH_EXIT)
+    state.mark = mark_and_crash
+
+
+def seed_boc(decks):
+    'Writes the BOC .f71 file a dry-run campaign starts from, unless the campaign already has one.'
+    f71_file = os.path.join(decks.BOC_f71_path, decks.f71_name)
+    if os.path.exists(f71_file):
+        return
+    os.makedirs(decks.BOC_f71_path, exist_ok=True)
+    with open(os.path.join(os.environ['DRY_RUN_DIR'], NUCLIDE_FILE), 'r') as f:
+        nuclides = json.load(f)
+    adens = [BOC_ADENS.get(n, 0.0) for n in nuclides]
+    write_f71(f71_file, nuclides, [adens, adens], [0.0, 0.0])
+    print("Dry run: seeded BOC fuel salt in {}".format(f71_file))
+
+#####################################################
+#                   Toy Physics
+#####################################################
+
+def is_hm(nuclide) -> bool:
+    'Checks whether a nuclide counts as heavy metal.'
+    return nuclide.split('-')[0] in HM_ELEMENTS
+
+
+def mass_number(nuclide) -> int:
+    'Returns the mass number of a nuclide such as am-242m.'
+    return int(re.sub(r'\D', '', nuclide.split('-')[1]))
+
+
+def fissile_fraction(adens) -> float:
+    'Returns the fissile fraction of the heavy metal atoms in {nuclide: atom density}.'
+    hm = sum(a for n, a in adens.items() if is_hm(n))
+    return sum(adens.get(n, 0.0) for n in FISSILE) / hm if hm > 0 else 0.0
+
+
+def toy_keff(adens) -> float:
+    'Returns the toy k-eff of a fuel salt.'
+    return 1.0 + K_SLOPE*(fissile_fraction(adens) - FISSILE_CRIT)
+
+
+def deplete(adens, power: float, days: float):
+    '''Returns the fuel salt after burning at power MW/MTiHM for days: the fissions take fissile atoms in proportion
+       to their share, and some U-238 is converted to Pu-239.'''
+    hm_mass = sum(a*mass_number(n) for n, a in adens.items() if is_hm(n))
+    fissile = sum(adens.get(n, 0.0) for n in FISSILE)
+    if fissile <= 0:
+        return dict(adens)
+    # Fissions per barn-cm: the heavy metal weighs hm_mass*1e24/N_A g (1e-6 t) per cm^3
+    burned = min(power*days*FISSIONS_PER_MWD * hm_mass / 6.02214076e29, 0.5*fissile)
+    out = dict(adens)
+    for n in FISSILE:
+        out[n] = adens.get(n, 0.0) * (1.0 - burned/fissile)
+    bred = min(CONVERSION*burned, adens.get('u-238', 0.0))
+    out['u-238'] = adens.get('u-238', 0.0) - bred
+    out['pu-239'] = out.get('pu-239', 0.0) + bred
+    return out
+
+
+def read_deck(inp_file):
+    'Returns the sequence name (csas6, t6-depl, origen...) and the text of a SCALE input deck.'
+    with open(inp_file, 'r') as f:
+        text = f.read()
+    m = re.search(r'^=(\S+)', text, re.M)
+    return (m.group(1) if m else None), text
+
+
+def deck_value(text, name, default=None):
+    'Returns a name=value number from a SCALE deck (npg, gen, sig, power, burn...).'
+    m = re.search(r'\b' + name + r'\s*=\s*([-+.0-9Ee]+)', text)
+    return float(m.group(1)) if m else default
+
+#####################################################
+#                  Fake Executables
+#####################################################
+
+def write_f71(f71_file, nuclides, positions, times):
+    'Writes a fake .f71 file: atom densities of mixture 1 at each position.'
+    with open(f71_file, 'w') as f:
+        json.dump({'dry_run': True, 'nuclides': nuclides, 'positions': positions, 'times': times}, f)
+
+
+def keno_rows(k: float, npg: float, nsk: int, gen: int, sig: float, seed: int = None):
+    '''Returns the rows (generation, k-eff, elapsed, average k-eff, deviation) of a KENO generation table,
+       ending at the generation the target deviation sig is reached (or at gen).'''
+    sig_gen = SIG_GEN / np.sqrt(npg)
+    nactive = max(int(np.ceil((sig_gen/sig)**2)) if sig > 0 else gen, 2)
+    ngen = min(nsk + nactive, gen)
+    kgen = k + sig_gen*np.random.default_rng(seed).standard_normal(ngen)
+    n = np.arange(1, ngen+1)
+    # Averages over all generations until the skipped ones are done, over the active ones after that
+    active = n > nsk
+    count = np.where(active, n - nsk, n).astype(float)
+    ksum = np.where(active, np.cumsum(np.where(active, kgen, 0.0)), np.cumsum(kgen))
+    k2sum = np.where(active, np.cumsum(np.where(active, kgen**2, 0.0)), np.cumsum(kgen**2))
+    avg = ksum / count
+    var = np.maximum(k2sum/count - avg**2, 0.0) * count / np.maximum(count - 1, 1)
+    dev = np.where(count > 1, np.sqrt(var/count), sig_gen)
+    return list(zip(n, kgen, n*1e-3, avg, dev))
+
+
+def fake_keno(text, out_file, latency: float):
+    'Streams a KENO generation table into out_file over latency seconds, then the final k-eff summary.'
+    adens = {n.lower(): float(a) for n, a in MAT_RE.findall(text)}
+    rows = keno_rows(toy_keff(adens), deck_value(text, 'npg', 1000), int(deck_value(text, 'nsk', 20)),
+                     int(deck_value(text, 'gen', 520)), deck_value(text, 'sig', 50e-5), zlib.crc32(text.encode()))
+    start = time.time()
+    with open(out_file, 'w') as f:
+        f.write(" dry run: fake csas6 (KENO) output\n\n  generation   k-effective   elapsed time   average k-effective   deviation\n")
+        for chunk in np.array_split(np.arange(len(rows)), min(CHUNKS, len(rows))):
+            f.write(''.join("{:12d} {:13.5f} {:14.5f} {:21.5f} {:11.5f}\n".format(*rows[j]) for j in chunk))
+            f.flush()
+            time.sleep(latency/CHUNKS)
+        gen, _, _, k, sigma = rows[-1]
+        f.write("\n   total number of generations run {}\n".format(gen))
+        f.write(" ***   best estimate system k-eff          {:.5f} + or - {:.5f}   ***\n".format(k, sigma))
+        f.write(" csas6 finished. used {:.2f} seconds.\n".format(time.time() - start))
+
+
+def fake_triton(text, out_file, f71_file, latency: float):
+    '''Depletes fuel mixture 1 of a TRITON deck with the toy model, one library (nlib) at a time, feeding it from the
+       feed tank of a continuous-feed deck; writes the .out file and the fake .f71 file with the start and the end of
+       every library.'''
+    with open(os.path.join(os.environ['DRY_RUN_DIR'], NUCLIDE_FILE), 'r') as f:
+        nuclides = json.load(f)
+    salts = [{n.lower(): float(a) for n, a in MAT_RE.findall(text)}]
+    days = deck_value(text, 'burn', 7.0)
+    nlib = int(deck_value(text, 'nlib', 1))
+    tank = {n.lower(): float(a) for n, a in FEED_RE.findall(text)}
+    m = FEED_RATE_RE.search(text)
+    fed = 1.0 - np.exp(-float(m.group(1))*days/nlib*86400) if m else 0.0    # Fraction of the tank fed per library
+    for _ in range(nlib):
+        salt = deplete(salts[-1], deck_value(text, 'power', 58.1), days/nlib)
+        for n, a in tank.items():
+            salt[n] = salt.get(n, 0.0) + a*fed
+            tank[n] = a*(1.0 - fed)
+        salts.append(salt)
+    nuclides = sorted(set(nuclides) | set(salts[0]))
+    time.sleep(latency)
+    with open(out_file, 'w') as f:
+        f.write(" dry run: fake t6-depl (TRITON) output\n")
+        for adens in salts:
+            f.write(" ***   best estimate system k-eff          {:.5f} + or - {:.5f}   ***\n".format(toy_keff(adens), 5e-4))
+        f.write(" t6-depl finished. used {:.2f} seconds.\n".format(latency))
+    write_f71(f71_file, nuclides, [[adens.get(n, 0.0) for n in nuclides] for adens in salts],
+              [j*days/nlib*86400 for j in range(nlib + 1)])
+
+
+def scalerte(args):
+    'Fake scalerte: runs the KENO or TRITON deck given as the last argument.'
+    inp_file = args[-1]
+    base = os.path.splitext(inp_file)[0]
+    sequence, text = read_deck(inp_file)
+    if sequence == 'csas6':
+        fake_keno(text, base + '.out', latency('keno'))
+    elif sequence == 't6-depl':
+        fake_triton(text, base + '.out', base + '.f71', latency('triton'))
+    else:
+        print("Dry run: sequence {} of {} is not faked.".format(sequence, inp_file), file=sys.stderr)
+        return 1
+    return 0
+
+
+def obiwan(args):
+    'Fake obiwan view -format=csv: prints the nuclide table of a fake .f71 file (-units=atom or gram).'
+    with open(args[-1], 'r') as f:
+        f71 = json.load(f)
+    units = 'gram' if '-units=gram' in args else 'atom'
+    positions = np.array(f71['positions'], dtype=float)
+    if units == 'gram':       # TRITON normalises the masses to 1 MTiHM at the start of the step
+        a = np.array([mass_number(n) for n in f71['nuclides']], dtype=float)
+        hm = np.array([is_hm(n) for n in f71['nuclides']])
+        positions = positions * a * 1e6 / (positions[0]*a)[hm].sum()
+    npos = len(positions)
+    lines = ['case,' + ','.join(['1']*npos), 'step,' + ','.join(str(j) for j in range(npos)),
+             'time,' + ','.join(str(t) for t in f71['times'])]
+    for j, n in enumerate(f71['nuclides']):
+        elem, num = n.split('-')
+        name = elem.capitalize() + '{:03d}'.format(mass_number(n)) + ('m' if num.endswith('m') else '')
+        lines.append(name + ',' + ','.join('{:.10e}'.format(p[j]) for p in positions))
+    print('\n'.join(lines))
+    return 0
+
+
+def qdel(args):
+    'Fake qdel: kills the jobs started by the fake qsub and logs their IDs.'
+    for job_id in args:
+        filename = os.path.join(os.environ['DRY_RUN_DIR'], JOBS_DIR, job_id)
+        if not os.path.exists(filename):
+            print("qdel: Unknown Job Id {}".format(job_id), file=sys.stderr)
+            continue
+        with open(os.path.join(os.environ['DRY_RUN_DIR'], QDEL_LOG), 'a') as f:
+            f.write(job_id + '\n')
+        with open(filename, 'r') as f:
+            pid = int(f.read())
+        try:
+            os.killpg(pid, signal.SIGTERM)
+        except ProcessLookupError:      # Already finished
+            pass
+    return 0
+
+#################################################################################################
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in STUBS or sys.argv[1] in SHELL_STUBS:
+        print("This module fakes SCALE and qsub for a Sourdough dry run; use --dry-run with master_cluster.py or orchestrator.py.")
+        sys.exit(1)
+    tool, args = sys.argv[1], sys.argv[2:]
+    sys.exit(globals()[tool](args))
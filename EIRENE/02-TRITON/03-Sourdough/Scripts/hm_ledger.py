@@ -0,0 +1,138 @@
+# ******************************************************************************************************
+#
+#                       Sourdough Heavy Metal and Salt Volume Ledger
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  Keeps the heavy metal and fuel salt volume balance of a campaign in one place: per depletion step
+#  the salt volume, the salt taken out when the volume doubled and was halved, the refuel blended in
+#  and fed, the true heavy metal of the burned salt, the MTiHM and the power density. The rows live
+#  in the run-state database, so the whole history is one table() query away.
+#
+#  The heavy metal of the burned salt is taken from its atom densities (the end-of-step nuclide
+#  vector the run-state database caches) with a weight vector that is the molar mass of each heavy
+#  metal nuclide and zero for everything else, so no separate obiwan gram read is needed. The molar
+#  masses are the AME2016 atomic masses (MOLAR_MASS) that obiwan's gram output is based on too, so
+#  both give the same grams; only actinides too rare to matter fall back to the mass number.
+#
+#  MTiHM basis: the drivers used to read the heavy metal as obiwan grams per MTiHM and scale them
+#  with the MTiHM of the step before, starting from init_MTiHM. The ledger MTiHM is the true heavy
+#  metal mass instead: the densities are per the salt volume of the TRITON geometry, so there is no
+#  normalisation to carry from step to step. init_MTiHM is now only the MTiHM of the BOC core (step
+#  0); step 1 starts from the heavy metal of the BOC salt as TRITON burned it. The MTiHM and power
+#  density of a campaign run before the ledger can differ from a new run by the gap between
+#  init_MTiHM and that true mass.
+#
+# *******************************************************************************************************
+
+import numpy as np
+
+HM_ELEMENTS = ('th', 'pa', 'u', 'np', 'pu', 'am', 'cm', 'bk', 'cf', 'es')    # MTHM actinides (SCALE does not count Ac)
+MASS_EXCESS: float = 2.0e-4           # Actinide atomic masses are 1.6e-4 to 2.4e-4 (relative) above the mass number (nuclides not in MOLAR_MASS)
+AVOGADRO: float = 0.6022140857        # Avogadro's number times 1e-24: (mol/cm3) -> (atoms/barn-cm)
+
+# Atomic masses (g/mol, AME2016) of the heavy metal nuclides; metastable states use the ground state mass
+MOLAR_MASS = {'th-228': 228.0287411, 'th-229': 229.0317627, 'th-230': 230.0331338, 'th-231': 231.0363043,
+              'th-232': 232.0380558, 'th-233': 233.0415818, 'th-234': 234.0436012,
+              'pa-231': 231.0358842, 'pa-232': 232.0385917, 'pa-233': 233.0402473, 'pa-234': 234.0433081,
+              'u-232': 232.0371562, 'u-233': 233.0396352, 'u-234': 234.0409523, 'u-235': 235.0439301,
+              'u-236': 236.0455682, 'u-237': 237.0487302, 'u-238': 238.0507884, 'u-239': 239.0542933,
+              'np-236': 236.0465700, 'np-237': 237.0481736, 'np-238': 238.0509466, 'np-239': 239.0529391,
+              'pu-236': 236.0460580, 'pu-238': 238.0495599, 'pu-239': 239.0521634, 'pu-240': 240.0538135,
+              'pu-241': 241.0568515, 'pu-242': 242.0587426, 'pu-243': 243.0620031, 'pu-244': 244.0642044,
+              'am-241': 241.0568291, 'am-242': 242.0595492, 'am-243': 243.0613811,
+              'cm-242': 242.0588358, 'cm-243': 243.0613891, 'cm-244': 244.0627526, 'cm-245': 245.0654912,
+              'cm-246': 246.0672237, 'cm-247': 247.0703540, 'cm-248': 248.0723490,
+              'bk-249': 249.0749867, 'cf-249': 249.0748535, 'cf-250': 250.0764061, 'cf-251': 251.0795887,
+              'cf-252': 252.0816265}
+
+# Ledger columns of the run-state database
+LEDGER_COLUMNS = ['salt_volume', 'removed_volume', 'crit_refuel', 'feed_volume', 'hm_burned', 'mtihm', 'power_dens']
+
+WEIGHTS = {}     # WEIGHTS[tuple of nuclides] = molar mass (g/mol) of each heavy metal nuclide, 0 for the others
+
+
+def molar_mass(nuclide) -> float:
+    'Returns the molar mass in g/mol of a heavy metal nuclide such as am-242m, from MOLAR_MASS or else the mass number.'
+    elem, _, num = nuclide.partition('-')
+    ground = elem + '-' + num.rstrip('m')
+    if ground in MOLAR_MASS:
+        return MOLAR_MASS[ground]
+    return int(num.rstrip('m'))*(1.0 + MASS_EXCESS)
+
+
+def hm_weights(nuclides):
+    'Returns the heavy metal weight vector of a nuclide order, building it once.'
+    key = tuple(nuclides)
+    if key not in WEIGHTS:
+        w = np.zeros(len(key))
+        for i, n in enumerate(key):
+            if n.partition('-')[0] in HM_ELEMENTS:
+                w[i] = molar_mass(n)
+        WEIGHTS[key] = w
+    return WEIGHTS[key]
+
+
+def hm_grams(densities, volume: float) -> float:
+    'Returns the heavy metal mass in grams of volume cm^3 of a material with {nuclide: atoms/barn-cm}.'
+    adens = np.fromiter(densities.values(), dtype=float, count=len(densities))
+    return float(hm_weights(densities) @ adens)*volume/AVOGADRO
+
+
+def hm_grams_matrix(nuclides, adens, volumes):
+    'Returns the heavy metal masses in grams of the rows of an atom density matrix (nuclides as columns) and their volumes in cm^3.'
+    return np.asarray(adens, dtype=float) @ hm_weights(nuclides) * np.asarray(volumes, dtype=float)/AVOGADRO
+
+
+class HeavyMetalLedger(object):
+    'Heavy metal and fuel salt volume balance of a campaign, one run-state row per depletion step.'
+    def __init__(self, run_state, V0: float, init_MTiHM: float):
+        self.run_state = run_state          # RunStateDB of the campaign
+        self.V0:float = V0                  # BOC fuel salt volume in cm^3
+        self.init_MTiHM:float = init_MTiHM  # BOC MTiHM
+
+    def balance(self, volume: float, rvol: float):
+        '''Returns (salt volume, removed volume) in cm^3 after adding rvol to volume. Once the salt has doubled
+           from V0, half of it is taken out.'''
+        total = volume + rvol
+        if total >= 2*self.V0:
+            return total/2, total/2
+        return total, 0.0
+
+    def record_volume(self, step, volume: float, rvol: float, fed: float = 0.0) -> float:
+        '''Saves the salt volume balance of a depletion step that starts from volume and adds rvol (and fed
+           through the timetable) and returns the salt volume at the start of the step.'''
+        new_vol, removed = self.balance(volume, rvol)
+        self.run_state.set(step, salt_volume=new_vol + fed, removed_volume=removed, vol_doubled=removed > 0, feed_volume=fed)
+        return new_vol
+
+    def record_mtihm(self, step, burned_MTHM: float, refuel_MTHM: float, power: float) -> float:
+        '''Saves the true MTHM of the burned salt, the MTiHM after refuel (halved with the salt, except in the
+           first step) and the power density in MW/MTiHM of a depletion step. Returns the MTiHM.'''
+        mtihm = burned_MTHM + refuel_MTHM
+        if step > 1 and self.run_state.get(step, 'vol_doubled'):
+            mtihm = mtihm/2
+        self.run_state.set(step, hm_burned=burned_MTHM, mtihm=mtihm, power_dens=power/mtihm)
+        return mtihm
+
+    def mtihm(self, step) -> float:
+        'Returns the MTiHM after refuel of a depletion step (init_MTiHM for the BOC core).'
+        if step == 0:
+            return self.init_MTiHM
+        return self.run_state.get(step, 'mtihm')
+
+    def end_of_step_MTHM(self):
+        '''Returns (steps, true MTHM at the end of each step) of every step with a saved nuclide vector, in one
+           matrix product over the steps.'''
+        steps, nuclides, adens = self.run_state.nuclide_matrix()
+        volumes = [self.V0 if s == 0 else self.run_state.get(s, 'salt_volume') - (self.run_state.get(s, 'feed_volume') or 0.0)
+                   for s in steps]      # Salt volume of the TRITON geometry, which the densities are per
+        return np.array(steps), hm_grams_matrix(nuclides, adens, volumes)*1e-6
+
+    def arrays(self, columns=None):
+        'Returns {column: array over the recorded depletion steps} of the ledger columns, with the step numbers under "step".'
+        columns = LEDGER_COLUMNS if columns is None else columns
+        table = self.run_state.table(*columns)
+        if len(table) == 0:
+            return {c: np.zeros(0) for c in ['step'] + list(columns)}
+        return dict(zip(['step'] + list(columns), table.T))
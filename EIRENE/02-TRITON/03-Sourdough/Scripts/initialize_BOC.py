@@ -10,6 +10,8 @@ import time
 import os
 import shutil
 import salts_wf
+import subprocess
+from deck_template import DeckTemplate
 
 #####################################################
 #           Initialize BOC TRITON Core
@@ -19,7 +21,7 @@ import salts_wf
 
 class BOC_core(object):
     'Initial EIRENE TRITON deck.'
-    def __init__(self):
+    def __init__(self, campaign_root: str = '~/EIRENE11/SD7pct'):
         ##################################
         # BOC core and running parameters
         ##################################
@@ -53,8 +55,17 @@ class BOC_core(object):
         self.queue:str = 'fill'                     # NECluster queue
         self.ppn:int = 64                           # ppn core count
         self.deck_name:str = 'EIRENE.inp'           # TRITON input file name
-        self.deck_path:str = '.'                    # Where to run the TRITON deck
+        self.campaign_root:str = os.path.abspath(os.path.expanduser(campaign_root))   # Campaign directory
+        self.deck_path:str = os.path.join(self.campaign_root, 'BOC')                  # Where to run the TRITON deck
+        self.qsub_name:str = 'runEIRENE-Scale.sh'   # Name of the qsub file
         self.qsub_path:str = os.path.expanduser('~/EIRENE/Scripts/Sourdough/runEIRENE-Scale.sh')  # Full path to the qsub script
+        self.deck_templates = {}      # Cached DeckTemplate of each deck type (core parameters bound on first use)
+
+    def get_template(self, name, text):
+        'Returns the cached DeckTemplate of a deck, with the {self.*} core parameters rendered in on first use.'
+        if name not in self.deck_templates:
+            self.deck_templates[name] = DeckTemplate(text).bind(self=self)
+        return self.deck_templates[name]
 
     def saltmix(self, mU: float = 5) -> str:
         """Calculates salt mixture, assuming the MSRR salt is a melt of two salts,
@@ -78,7 +89,7 @@ class BOC_core(object):
     def write_deck(self) -> str:
         'Writes a SCALE input deck for the initial BOC core'
         scale_fuel = self.write_scale_mat()
-        triton_deck = f'''=t6-depl parm=(addnux=4)
+        triton_deck = self.get_template('triton', '''=t6-depl parm=(addnux=4)
 EIRENE SCALE/TRITON model, UF4 mol% = {self.UF4molpct}
 ce_v7.1
 
@@ -427,8 +438,8 @@ end data
 end model
 
 end
-'''
-        return triton_deck
+''')
+        return triton_deck.render(scale_fuel=scale_fuel)
     
   
     def save_deck(self):
@@ -443,10 +454,12 @@ end
                   self.deck_path + '/' + self.deck_name)
             print(e)
     
-    def write_qsub_file(self, iter):
-        'Writes a single qsub file outside of the refuel directories.'
-        deck_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
-        os.chdir(deck_path)
+    def write_qsub_file(self, iter=0):
+        'Writes a single qsub file outside of the refuel directories (into the BOC directory for iter 0).'
+        if iter == 0:
+            deck_path = self.deck_path
+        else:
+            deck_path = os.path.join(self.campaign_root, 'dep_step_{}'.format(iter))
         shell_content = '''
 #!/bin/bash
 
@@ -467,17 +480,16 @@ export DATA=/opt/scale6.3_data
 export HDF5_USE_FILE_LOCKING=FALSE
 
 scalerte -m -N 32 EIRENE.inp'''
-        s = open(self.qsub_name, 'w')
+        s = open(os.path.join(deck_path, self.qsub_name), 'w')
         s.write(shell_content)
         s.close()
         
     def run_deck(self):
         'Runs the deck using qsub_path script'
         if self.queue == 'local':    # Run the deck locally
-            os.chdir(self.deck_path)
-            os.system(self.qsub_path)
+            subprocess.run([self.qsub_path], cwd=self.deck_path)
         else:               # Submit the job on the cluster
-            os.system('cd ' + self.deck_path + ' && qsub ' + self.qsub_path)
+            subprocess.run(['qsub', self.qsub_path], cwd=self.deck_path)
 
 if __name__ == '__main__':
     print("This module generates and runs a BOC EIRENE core for TRITON.")
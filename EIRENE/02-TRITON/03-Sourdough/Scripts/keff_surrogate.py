@@ -0,0 +1,124 @@
+# ******************************************************************************************************
+#
+#                       Sourdough Surrogate k-eff Model for the Refuel Search
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  Bayesian linear regression of KENO k-eff on the mixed fuel salt atom densities of a few key
+#  nuclides. It is trained incrementally on each depletion step's (refuel volume, k, sigma k) points
+#  and predicts k-eff(V) with an uncertainty, so KENO only has to run when the model is not sure.
+#
+#  Within a step all key nuclide densities change linearly with V, so the features are nearly
+#  collinear and the coefficient posterior alone is too sure of itself. Before a step is added,
+#  the model predicts that step's KENO points it has not seen yet; what the residuals hold beyond
+#  the KENO and coefficient variances is kept as a model discrepancy variance and added to every
+#  prediction.
+#
+# *******************************************************************************************************
+
+import os
+import numpy as np
+
+# Nuclides whose mixed salt atom densities drive the model (fissile, fertile, main poisons, Li-6)
+KEY_NUCLIDES = ["u-235", "u-238", "u-234", "u-236", "pu-239", "pu-240", "pu-241", "np-237",
+                "xe-135", "sm-149", "sm-151", "nd-143", "rh-103", "gd-155", "li-6"]
+
+
+class SurrogateKeff(object):
+    'Incrementally trained linear-in-key-nuclides k-eff model with posterior uncertainty.'
+    def __init__(self, isotopes, model_file: str = 'keff_surrogate.npz'):
+        self.model_file:str = model_file     # Where the sufficient statistics are saved between steps
+        self.prior_prec:float = 1e-4         # Ridge prior precision on the (scaled) coefficients
+        self.forget:float = 0.9              # Weight kept by older steps each time a new step is added
+        self.idx = [isotopes.index(n) for n in KEY_NUCLIDES]   # Positions of the key nuclides in the material vector
+        self.nfeat:int = len(self.idx) + 1   # Key nuclides plus a constant
+        self.x_ref = None                    # Reference atom densities used to scale the features
+        self.XtWX = np.zeros((self.nfeat, self.nfeat))
+        self.XtWy = np.zeros(self.nfeat)
+        self.nsteps:int = 0                  # Number of depletion steps trained on
+        self.disc_ss:float = 0.0             # Weighted sum of held-out squared residuals beyond the KENO and coefficient variances
+        self.disc_w:float = 0.0              # Weighted number of held-out points in disc_ss
+        if os.path.exists(self.model_file):
+            self.load()
+
+    ##################################
+    #        Save / Load Model
+    ##################################
+
+    def save(self):
+        'Saves the model sufficient statistics to model_file.'
+        np.savez(self.model_file, x_ref=self.x_ref, XtWX=self.XtWX, XtWy=self.XtWy, nsteps=self.nsteps,
+                 disc_ss=self.disc_ss, disc_w=self.disc_w)
+
+    def load(self):
+        'Loads the model sufficient statistics from model_file.'
+        data = np.load(self.model_file)
+        self.x_ref = data['x_ref']
+        self.XtWX = data['XtWX']
+        self.XtWy = data['XtWy']
+        self.nsteps = int(data['nsteps'])
+        if 'disc_ss' in data:       # Models saved before the discrepancy term start without it
+            self.disc_ss = float(data['disc_ss'])
+            self.disc_w = float(data['disc_w'])
+
+    ##################################
+    #       Training / Prediction
+    ##################################
+
+    def features(self, mixed_adens):
+        'Returns the scaled feature rows for one or more mixed salt atom density vectors.'
+        adens = np.atleast_2d(np.asarray(mixed_adens, dtype=float))[:, self.idx]
+        if self.x_ref is None:
+            self.x_ref = np.where(adens[0] > 0.0, adens[0], 1.0)
+        return np.hstack([adens / self.x_ref, np.ones((adens.shape[0], 1))])
+
+    def add_step(self, mixed_adens, keff, kerr):
+        '''Adds one depletion step worth of KENO points (one mixed salt vector per refuel volume) to the model,
+           after using them as held-out points for the model discrepancy.'''
+        keff = np.asarray(keff, dtype=float)
+        kerr = np.asarray(kerr, dtype=float)
+        if self.nsteps >= 2:        # One step's points fix no more than a line in V; its predictions say nothing yet
+            pred, pstd = self.predict(mixed_adens, discrepancy=False)
+            self.disc_ss = self.forget * self.disc_ss + np.sum((keff - pred)**2 - kerr**2 - pstd**2)
+            self.disc_w = self.forget * self.disc_w + len(keff)
+        X = self.features(mixed_adens)
+        w = 1.0 / kerr**2
+        self.XtWX = self.forget * self.XtWX + (X.T * w) @ X
+        self.XtWy = self.forget * self.XtWy + (X.T * w) @ np.asarray(keff, dtype=float)
+        self.nsteps += 1
+
+    def discrepancy(self) -> float:
+        'Returns the model discrepancy variance estimated from the held-out KENO points (0 before there are any).'
+        if self.disc_w <= 0.0:
+            return 0.0
+        return max(self.disc_ss / self.disc_w, 0.0)
+
+    def predict(self, mixed_adens, discrepancy: bool = True):
+        '''Returns the predicted k-eff and its standard deviation for each mixed salt vector. The standard deviation
+           holds the coefficient uncertainty and, unless discrepancy is False, the model discrepancy.'''
+        X = self.features(mixed_adens)
+        cov = np.linalg.inv(self.XtWX + self.prior_prec * np.eye(self.nfeat))
+        coef = cov @ self.XtWy
+        keff = X @ coef
+        kvar = np.einsum('ij,jk,ik->i', X, cov, X)
+        if discrepancy:
+            kvar = kvar + self.discrepancy()
+        return keff, np.sqrt(kvar)
+
+    def predict_crit_refuel(self, rvols, mixed_adens):
+        '''Predicts k-eff along a grid of refuel volumes and returns
+           (critical refuel volume, k-eff standard deviation at that volume, dk/dV there).
+           Returns None if the predicted k-eff does not cross 1 on the grid.'''
+        rvols = np.asarray(rvols, dtype=float)
+        keff, kstd = self.predict(mixed_adens)
+        for x in range(len(rvols) - 1):
+            if (keff[x] - 1.0) * (keff[x+1] - 1.0) <= 0.0:
+                slope = (keff[x+1] - keff[x]) / (rvols[x+1] - rvols[x])
+                frac = (1.0 - keff[x]) / (keff[x+1] - keff[x]) if keff[x+1] != keff[x] else 0.0
+                crit = rvols[x] + frac * (rvols[x+1] - rvols[x])
+                std = kstd[x] + frac * (kstd[x+1] - kstd[x])
+                return crit, std, slope
+        if keff[0] > 1.0:       # Already supercritical with the smallest refuel: no refuel needed
+            slope = (keff[-1] - keff[0]) / (rvols[-1] - rvols[0])
+            return 0.0, kstd[0], slope
+        return None
@@ -0,0 +1,100 @@
+# ******************************************************************************************************
+#
+#                       Live KENO Convergence Monitor
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  Tails the outputs of running refuel KENO decks and follows their running k-eff and standard
+#  deviation. A candidate near k-eff = 1 is stopped once it reaches the target deviation; one that is
+#  clearly off the bracket only sets the slope of the fit, so a looser deviation is enough for it.
+#  Stopped jobs are removed with qdel and their running estimate is saved next to the deck, where
+#  scale_output.py picks it up in place of the final k-eff summary. Runs that are no longer needed
+#  (rejected speculative decks) are removed with qdel and marked as cancelled instead.
+#
+# *******************************************************************************************************
+
+import os
+import subprocess
+import scale_output
+
+JOB_ID_FILE = 'job_id'       # qsub job ID, saved in each KENO run directory by Refuel_Deck.submit
+CANCELLED_FILE = 'job_cancelled'    # Left in a KENO run directory whose job was removed before it finished
+
+
+class KenoMonitor(object):
+    'Follows running KENO decks and stops the ones that already have the statistics they need.'
+    def __init__(self, sig_target: float, sig_far: float, near_dk: float = 0.01, nsig: float = 3.0,
+                 min_gen: int = 120, files=('EIRENE.msg', 'EIRENE.out')):
+        self.sig_target:float = sig_target    # k-eff std. dev. a candidate near k-eff = 1 needs
+        self.sig_far:float = sig_far          # k-eff std. dev. enough for a candidate clearly off the bracket
+        self.near_dk:float = near_dk          # |k-eff - 1| beyond which (plus nsig std. devs.) a candidate is off the bracket
+        self.nsig:float = nsig                # Number of std. devs. a candidate must be clear of near_dk
+        self.min_gen:int = min_gen            # Generations (skipped ones included) before a run may be stopped
+        self.files = files                    # Files tailed for the KENO generation table, in each run directory
+        self.offsets = {}                     # offsets[file] = bytes of the file already read
+        self.estimates = {}                   # estimates[run_dir] = (generation, k-eff, std. dev.) of the last row seen
+
+    def update(self, run_dir):
+        'Reads the generation rows written since the last poll and returns the latest (generation, k-eff, std. dev.), or None.'
+        for name in self.files:
+            filename = os.path.join(run_dir, name)
+            if not os.path.exists(filename):
+                continue
+            offset = self.offsets.get(filename, 0)
+            with open(filename, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+            end = data.rfind(b'\n') + 1           # Leave a half-written last line for the next poll
+            self.offsets[filename] = offset + end
+            row = scale_output.read_generations(data[:end])
+            if row is not None:
+                self.estimates[run_dir] = row
+        return self.estimates.get(run_dir)
+
+    def stop_reason(self, k, sigma):
+        'Returns why a run with running k-eff +- sigma can stop (converged or off_bracket), or None to keep it going.'
+        if sigma <= self.sig_target:
+            return 'converged'
+        if abs(k - 1.0) - self.nsig*sigma > self.near_dk and sigma <= self.sig_far:
+            return 'off_bracket'
+        return None
+
+    def stop_job(self, run_dir) -> bool:
+        'Removes the queued KENO job of a run directory with qdel. Returns False if its job ID is unknown.'
+        filename = os.path.join(run_dir, JOB_ID_FILE)
+        if not os.path.exists(filename):
+            return False
+        with open(filename, 'r') as f:
+            job_id = f.read().strip()
+        subprocess.run(['qdel', job_id])
+        return True
+
+    def cancel_job(self, run_dir) -> bool:
+        '''Removes the job of a KENO run that is no longer needed with qdel and marks its directory, so that it no
+           longer counts as running. Returns False if its job ID is unknown (the deck was never submitted).'''
+        stopped = self.stop_job(run_dir)
+        with open(os.path.join(run_dir, CANCELLED_FILE), 'w') as f:
+            f.write('cancelled\n')
+        return stopped
+
+    def poll(self, path, prefix='refuel'):
+        'Checks every running {prefix}_* KENO deck under path and stops the ones that can stop. Returns their directories.'
+        stopped = []
+        if not os.path.isdir(path):
+            return stopped
+        for d in sorted(os.listdir(path)):
+            run_dir = os.path.join(path, d)
+            if not d.startswith(prefix + '_') or scale_output.run_finished(run_dir):
+                continue
+            est = self.update(run_dir)
+            if est is None or est[0] < self.min_gen:
+                continue
+            gen, k, sigma = est
+            reason = self.stop_reason(k, sigma)
+            if reason is None or not self.stop_job(run_dir):
+                continue
+            with open(os.path.join(run_dir, scale_output.ESTIMATE_FILE), 'w') as f:
+                f.write('{} {} {} {}\n'.format(k, sigma, gen, reason))
+            print("Stopped KENO run {} after {} generations ({}: k-eff {:.5f} +- {:.5f}).".format(run_dir, gen, reason, k, sigma))
+            stopped.append(run_dir)
+        return stopped
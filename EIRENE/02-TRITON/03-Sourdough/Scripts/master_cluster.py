@@ -6,10 +6,10 @@
 #
 # *****************************************************************************************************
 
-import initialize_BOC_local
-from initialize_BOC_local import BOC_core
 import run_sourdough
 from run_sourdough import Refuel_Deck
+from campaign_state import CampaignState
+from EOC_deck import EOC_Deck
 import time
 import os
 import shutil
@@ -20,12 +20,18 @@ from numpy import genfromtxt
 import math
 import sys, re
 import subprocess
+import dry_run
 
 #################################################################################################
 
 if __name__ == '__main__':
     print("This master script runs a full sourdough depletion simulation for EIRENE.")
-    input("Press Ctrl+C to quit, or enter else to test it.")
+    dry = '--dry-run' in sys.argv      # Fake SCALE and qsub (see dry_run.py) to time the driver itself
+    args = [a for a in sys.argv[1:] if a != '--dry-run']
+    if not dry:
+        input("Press Ctrl+C to quit, or enter else to test it.")
+    elif not args:
+        args = [os.path.join(dry_run.ROOT, 'SD7pct')]
 
     ##################################################################
     #        Initialize the BOC Core and Run the TRITON Deck
@@ -33,6 +39,7 @@ if __name__ == '__main__':
     
     # NOTE: Uncomment the lines in this section to also run a BOC deck.
 
+#    from initialize_BOC import BOC_core
 #    boc = BOC_core()
 #    print("Writing BOC EIRENE TRITON deck...")
 #    boc.save_deck()
@@ -45,36 +52,91 @@ if __name__ == '__main__':
     #                  Cycle Through Depletion Steps 
     ###################################################################
 
-    decks = Refuel_Deck()
+    decks = Refuel_Deck(*args[:1])    # Optional campaign root directory (default ~/EIRENE11/SD7pct)
+    state = CampaignState(decks.deck_path + 'campaign_state.json')     # Resumes an interrupted campaign
+    eoc = EOC_Deck(*args[:1])     # EOC deck of each step is submitted as soon as its .f71 file is ready
+    if dry:
+        dry_run.enable(decks.campaign_root, decks)
+        dry_run.seed_boc(decks)
+        dry_run.crash_after(state)     # DRY_RUN_CRASH=step:stage, for restart tests
     iter = np.arange(1, 301, 1)        # Depletion steps
     for i in iter:
-        decks.write_KENO_decks(i)
-        decks.write_conv_data(i)
-        decks.add_shell_permission_cd(i)
-        time.sleep(1700)
-        print("Extracting k-eff data for depletion step {}...".format(i))
-        decks.convert_data(i)
-        print("Data written to data-temp.out file.")
-        decks.read_outfile(i)
-        decks.get_crit_refuel(i)
-        print("Critical refuel amount for depletion step {}:".format(i))
-        print(decks.crit_refuel)
-        print("Writing new TRITON deck with critical refuel amount...")
-        decks.write_new_TRITON_deck(i)
-        decks.write_qsub_file(i)
-        print("Running TRITON deck...")
-        decks.run_SCALE(i)
-        main_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(i))
-        os.chdir(main_path)
-        check = False       # Initialize check
-        while check == False:
-          if os.path.exists('./EIRENE.f71'):
-            check = True
+        if decks.horizon_reached(i-1):
+            print("Reached {:g} days after depletion step {}.".format(decks.campaign_days(i-1), i-1))
             break
-          else:                 
-              check = False
-              print("The atoms are still working; please stand by...")
-              time.sleep(10.0)
+        if state.done(i, 'f71_ready'):
+            continue
+        if state.stage(i) is not None:
+            print("Resuming depletion step {} after stage '{}'...".format(i, state.stage(i)))
+        if not state.done(i, 'decks_written') and decks.speculated(i):
+            if decks.validate_speculation(i):           # Decks written while the last TRITON step ran
+                state.mark(i, 'decks_written')
+                decks.wait_for_keno(i)
+        if not state.done(i, 'crit_found'):
+            # Skip KENO when no refuel is needed or the surrogate is confident (unless decks are already out)
+            if state.done(i, 'decks_written') or (decks.refuel_needed(i) and not decks.reuse_feed_rate(i) and decks.keno_needed(i)):
+                if not state.done(i, 'decks_written'):
+                    if decks.multifidelity:
+                        decks.write_KENO_decks(i, stage='screen')    # Cheap screening runs over all candidates
+                        decks.write_conv_data(i, stage='screen')
+                        decks.add_shell_permission_cd(i)
+                        decks.wait_for_keno(i, stage='screen')     # Refine only from finished screening runs
+                        decks.record_keno_jobs(i, stage='screen')
+                        decks.convert_data(i, stage='screen')
+                        decks.write_KENO_decks(i, decks.get_refine_rvols(i))   # Full statistics for the bracketing pair only
+                    else:
+                        decks.write_KENO_decks(i)
+                    decks.write_conv_data(i)
+                    decks.add_shell_permission_cd(i)
+                    state.mark(i, 'decks_written')
+                if not state.done(i, 'keno_done'):
+                    decks.wait_for_keno(i)
+                    print("Extracting k-eff data for depletion step {}...".format(i))
+                    decks.record_keno_jobs(i)
+                    decks.convert_data(i)
+                    print("Data written to data-temp.out file.")
+                    decks.read_outfile(i)
+                    state.mark(i, 'keno_done')
+                decks.get_crit_refuel(i)
+                if decks.search_mode == 'adaptive' and not decks.crit_bracketed:
+                    print("Critical refuel escaped the adaptive bracket; running the wide bracket for depletion step {}...".format(i))
+                    decks.write_KENO_decks(i, decks.rvols)
+                    decks.wait_for_keno(i)
+                    decks.record_keno_jobs(i)
+                    decks.convert_data(i)
+                    decks.read_outfile(i)
+                    decks.get_crit_refuel(i)
+                decks.train_surrogate(i)
+            state.mark(i, 'crit_found')
+        if not state.done(i, 'triton_submitted'):
+            decks.read_crit_refuel(i)
+            print("Critical refuel amount for depletion step {}:".format(i))
+            print(decks.crit_refuel)
+            print("Writing new TRITON deck with critical refuel amount...")
+            decks.write_new_TRITON_deck(i)
+            decks.write_qsub_file(i)
+            print("Running TRITON deck...")
+            decks.run_SCALE(i)
+            state.mark(i, 'triton_submitted')
+        if i < iter[-1] and decks.can_speculate(i+1):
+            print("Launching speculative KENO decks for depletion step {}...".format(i+1))
+            decks.write_speculative_decks(i+1)
+        check = False       # Initialize check
+        with decks.timer.stage('idle', i, cores=0):
+          while check == False:
+            if os.path.exists(os.path.join(decks.step_path(i), decks.f71_name)):
+              check = True
+              break
+            else:
+                check = False
+                print("The atoms are still working; please stand by...")
+                time.sleep(decks.poll_wait)
+        decks.record_triton_job(i)
+        state.mark(i, 'f71_ready')
+        if not eoc.submitted(i):
+            print("Submitting EOC KENO deck for depletion step {}...".format(i))
+            eoc.submit(i)
+        decks.archive_steps(i - decks.archive_lag, eoc.done)   # Raw outputs of older steps, once their EOC run is done
     print("*******************************************")
     print("All done! The atoms are very happy now :D")
     print("*******************************************")
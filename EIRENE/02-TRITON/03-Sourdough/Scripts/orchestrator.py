@@ -0,0 +1,252 @@
+# ****************************************************************************************************
+#
+#                     EIRENE Sourdough Multi-Campaign Orchestrator (Cluster)
+#
+#    By C. Erika Moss and Dr. Ondrej Chvala
+#
+#    Advances the Sourdough campaigns of every refuel enrichment from one process. Each campaign is
+#    stepped through the same stages as master_cluster.py, but nothing sleeps on a single campaign:
+#    the orchestrator polls all of them and only submits new KENO/TRITON jobs while the shared job
+#    and core budget allows it, giving the free slots to the campaigns furthest behind first.
+#    The EOC KENO deck of a step is submitted as soon as its .f71 file appears, so it runs next to
+#    the refuel search of the following step instead of in a separate EOC_master.py pass.
+#
+# *****************************************************************************************************
+
+import os
+import sys
+import time
+import dry_run
+from run_sourdough import Refuel_Deck
+from EOC_deck import EOC_Deck
+from campaign_state import CampaignState
+
+# Refuel enrichment (%) and campaign root directory of each Sourdough campaign
+CAMPAIGNS = {3.5: '~/EIRENE13/3.5', 5: '~/EIRENE13/5', 6: '~/EIRENE13/6', 7: '~/EIRENE13/7',
+             9: '~/EIRENE13/9', 10: '~/EIRENE13/10', 15: '~/EIRENE13/15', 19.75: '~/EIRENE13/19.75'}
+
+
+class Campaign(object):
+    'One Sourdough campaign, advanced one non-blocking stage at a time.'
+    def __init__(self, enrich: float, campaign_root: str, nsteps: int = 300, pipeline_eoc: bool = True):
+        self.enrich:float = enrich                         # Refuel enrichment in %
+        self.decks = Refuel_Deck(campaign_root)
+        self.decks.renrich = enrich/100                    # Refuel enrichment fraction
+        self.eoc = EOC_Deck(campaign_root)
+        self.eoc.renrich = enrich/100
+        self.state = CampaignState(self.decks.deck_path + 'campaign_state.json')
+        self.nsteps:int = nsteps                           # Number of depletion steps in the campaign
+        self.step:int = self.state.resume_step()           # Depletion step being worked on
+        self.needs_search = None                           # Whether this step needs a KENO refuel search (None until decided)
+        self.job_cores:int = self.decks.ppn                # Cores requested by each KENO/TRITON job
+        self.pipeline_eoc:bool = pipeline_eoc              # Submit EOC decks while the campaign runs
+        self.eoc_waiting = []                              # Steps with a .f71 file and no EOC deck submitted yet
+        self.eoc_running = []                              # Steps whose EOC KENO run is submitted and not finished
+        if self.pipeline_eoc:
+            for i in range(1, self.step):                  # Picks up EOC runs of a resumed campaign
+                if not self.eoc.submitted(i):
+                    self.eoc_waiting.append(i)
+                elif not self.eoc.done(i):
+                    self.eoc_running.append(i)
+
+    def steps_done(self) -> bool:
+        'Checks whether the campaign ran all its depletion steps (or reached the horizon_days of its decks).'
+        return self.step > self.nsteps or self.decks.horizon_reached(self.step-1)
+
+    def finished(self) -> bool:
+        'Checks whether every depletion step has its .f71 file and every EOC deck is submitted.'
+        return self.steps_done() and not self.eoc_waiting
+
+    def running_jobs(self) -> int:
+        'Returns the number of jobs of this campaign that are submitted and not finished yet.'
+        self.eoc_running = [i for i in self.eoc_running if not self.eoc.done(i)]
+        if self.steps_done():
+            return len(self.eoc_running)
+        return len(self.eoc_running) + self.step_jobs()
+
+    def step_jobs(self) -> int:
+        'Returns the number of unfinished jobs of the depletion step being worked on.'
+        i = self.step
+        if self.state.done(i, 'triton_submitted'):
+            if os.path.exists(self.decks.burned_f71(i+1)):
+                return 0
+            submitted, done = self.decks.keno_jobs(i+1)      # Speculative refuel search of the next step
+            return 1 + submitted - done
+        running = 0
+        for stage in ['screen', 'refuel', 'rejected']:     # Rejected speculative runs not cancelled yet
+            submitted, done = self.decks.keno_jobs(i, stage)
+            running += submitted - done
+        return running
+
+    def keno_done(self, stage='refuel') -> bool:
+        'Checks whether all KENO runs of the current step in the {stage}_* directories have finished.'
+        self.decks.monitor_keno_runs(self.step, stage)     # Stops runs that already have enough statistics
+        submitted, done = self.decks.keno_jobs(self.step, stage)
+        return submitted > 0 and submitted == done
+
+    def submit_eoc(self, free_jobs: int) -> int:
+        'Submits the EOC decks of finished depletion steps that fit in free_jobs; returns how many.'
+        n = 0
+        while self.eoc_waiting and n < free_jobs:
+            i = self.eoc_waiting.pop(0)
+            print("[{}%] Submitting EOC KENO deck for depletion step {}...".format(self.enrich, i))
+            self.eoc.submit(i)
+            self.eoc_running.append(i)
+            n += 1
+        return n
+
+    def advance(self, free_jobs: int) -> int:
+        '''Moves the current depletion step forward by at most one stage.
+           Submits jobs only if they fit in free_jobs; returns the number of jobs submitted.'''
+        if self.finished():
+            return 0
+        if self.eoc_waiting and free_jobs > 0:
+            return self.submit_eoc(free_jobs)
+        if self.steps_done():
+            return 0
+        i = self.step
+        decks = self.decks
+
+        # ----- Refuel search -----
+        if not self.state.done(i, 'decks_written') and decks.speculated(i):
+            if decks.validate_speculation(i):          # Decks written while the last TRITON step ran
+                self.state.mark(i, 'decks_written')
+                return 0
+        if not self.state.done(i, 'decks_written'):
+            if self.needs_search is None:          # Decided once per step, even if the budget delays the search
+                self.needs_search = self.state.stage(i) is not None or (decks.refuel_needed(i) and not decks.reuse_feed_rate(i) and decks.keno_needed(i))
+            if not self.needs_search:
+                self.state.mark(i, 'crit_found')       # refuel_needed/keno_needed already saved the critical refuel
+                return 0
+            if decks.multifidelity:
+                if decks.keno_jobs(i, 'screen')[0] == 0:
+                    rvols = decks.get_search_rvols(i)
+                    if len(rvols) > free_jobs:
+                        return 0
+                    decks.write_KENO_decks(i, rvols, stage='screen')   # Cheap screening runs over all candidates
+                    decks.write_conv_data(i, stage='screen')
+                    decks.add_shell_permission_cd(i)
+                    return len(rvols)
+                if not self.keno_done('screen') or 2 > free_jobs:
+                    return 0
+                decks.record_keno_jobs(i, stage='screen')
+                decks.convert_data(i, stage='screen')
+                rvols = decks.get_refine_rvols(i)      # Full statistics for the bracketing pair only
+            else:
+                rvols = decks.get_search_rvols(i)
+            if len(rvols) > free_jobs:
+                return 0
+            decks.write_KENO_decks(i, rvols)
+            decks.write_conv_data(i)
+            decks.add_shell_permission_cd(i)
+            self.state.mark(i, 'decks_written')
+            return len(rvols)
+
+        if not self.state.done(i, 'crit_found'):
+            if not self.keno_done():
+                return 0
+            print("[{}%] Extracting k-eff data for depletion step {}...".format(self.enrich, i))
+            decks.record_keno_jobs(i)
+            decks.convert_data(i)
+            decks.read_outfile(i)
+            self.state.mark(i, 'keno_done')
+            decks.get_crit_refuel(i)
+            if decks.search_mode == 'adaptive' and not decks.crit_bracketed:
+                wide = decks.unwritten_rvols(i, decks.rvols)   # Empty once the bracket was widened, also after a restart
+                if len(wide) > free_jobs:
+                    return 0                           # Refit and retry once the budget frees up
+                if wide:
+                    print("[{}%] Critical refuel escaped the adaptive bracket; running the wide bracket for depletion step {}...".format(self.enrich, i))
+                    decks.write_KENO_decks(i, decks.rvols)
+                    return len(wide)
+            decks.train_surrogate(i)
+            self.state.mark(i, 'crit_found')
+            return 0
+
+        # ----- TRITON depletion -----
+        if not self.state.done(i, 'triton_submitted'):
+            if free_jobs < 1:
+                return 0
+            decks.read_crit_refuel(i)
+            print("[{}%] Critical refuel amount for depletion step {}: {}".format(self.enrich, i, decks.crit_refuel))
+            decks.write_new_TRITON_deck(i)
+            decks.write_qsub_file(i)
+            decks.run_SCALE(i)
+            self.state.mark(i, 'triton_submitted')
+            return 1
+
+        if not os.path.exists(decks.burned_f71(i+1)) and i < self.nsteps and decks.can_speculate(i+1):
+            if len(decks.get_search_rvols(i+1)) > free_jobs:
+                return 0
+            print("[{}%] Launching speculative KENO decks for depletion step {}...".format(self.enrich, i+1))
+            return len(decks.write_speculative_decks(i+1))
+        if os.path.exists(decks.burned_f71(i+1)):    # This step's .f71 is where the next step starts from
+            decks.record_triton_job(i)
+            self.state.mark(i, 'f71_ready')
+            if self.pipeline_eoc:
+                self.eoc_waiting.append(i)             # Runs next to the refuel search of step i+1
+            decks.archive_steps(i - decks.archive_lag, self.eoc.done if self.pipeline_eoc else None)
+            self.step += 1
+            self.needs_search = None
+        return 0
+
+
+class Orchestrator(object):
+    'Advances several Sourdough campaigns at once under a shared cluster job and core budget.'
+    def __init__(self, campaigns, max_jobs: int = 24, max_cores: int = 1536, poll: float = 60.0):
+        self.campaigns = campaigns         # List of Campaign objects
+        self.max_jobs:int = max_jobs       # Largest number of KENO/TRITON jobs in the queue at once
+        self.max_cores:int = max_cores     # Largest number of cores requested by those jobs
+        self.poll:float = poll             # Seconds between polls of the campaign directories
+
+    def free_jobs(self, campaign, running_jobs, running_cores) -> int:
+        'Returns how many more jobs of a campaign fit in the shared budget.'
+        free_cores = (self.max_cores - running_cores) // campaign.job_cores
+        return max(min(self.max_jobs - running_jobs, free_cores), 0)
+
+    def run(self):
+        'Polls and advances all campaigns until every one of them has finished.'
+        while not all(c.finished() for c in self.campaigns):
+            running = [c.running_jobs() for c in self.campaigns]
+            running_jobs = sum(running)
+            running_cores = sum(n * c.job_cores for n, c in zip(running, self.campaigns))
+            # Campaigns furthest behind get the free slots first
+            for c in sorted(self.campaigns, key=lambda c: c.step):
+                while not c.finished():
+                    step, stage = c.step, c.state.stage(c.step)
+                    free = self.free_jobs(c, running_jobs, running_cores)
+                    if running_jobs == 0 and free == 0:
+                        free = self.max_jobs           # A batch larger than the budget still has to run once
+                    n = c.advance(free)
+                    running_jobs += n
+                    running_cores += n * c.job_cores
+                    if (c.step, c.state.stage(c.step)) == (step, stage) and n == 0:
+                        break                          # Waiting on the cluster or on the budget
+            print("{} jobs / {} cores in use; steps: {}".format(running_jobs, running_cores,
+                  ", ".join("{}%: {}".format(c.enrich, c.step) for c in self.campaigns)))
+            time.sleep(self.poll)
+
+#################################################################################################
+
+if __name__ == '__main__':
+    print("This script runs the Sourdough depletion of every refuel enrichment campaign at once.")
+    dry = '--dry-run' in sys.argv      # Fake SCALE and qsub (see dry_run.py) to time the orchestrator itself
+    args = [a for a in sys.argv[1:] if a != '--dry-run']
+    if not dry:
+        input("Press Ctrl+C to quit, or enter else to run it.")
+    enrichments = [float(e) for e in args] or list(CAMPAIGNS)
+    if dry:
+        campaigns = [Campaign(e, os.path.join(dry_run.ROOT, str(e))) for e in enrichments]
+        dry_run.enable(dry_run.ROOT, *[c.decks for c in campaigns])
+        for c in campaigns:
+            dry_run.seed_boc(c.decks)
+            dry_run.crash_after(c.state)
+        Orchestrator(campaigns, poll=dry_run.latency('poll')).run()
+    else:
+        campaigns = [Campaign(e, CAMPAIGNS[e]) for e in enrichments]
+        Orchestrator(campaigns).run()
+    print("*******************************************")
+    print("All done! The atoms are very happy now :D")
+    print("*******************************************")
+
+#################################################################################################
@@ -0,0 +1,453 @@
+# ******************************************************************************************************
+#
+#                       Sourdough Refuel-Burn Engine and Campaign Spec
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  The EIRENE (Refuel_Deck) and Th-EIRENE (ThEIRENE_Deck) drivers run the same refuel-burn cycle:
+#  search the critical refuel with KENO, add it to the salt (halving the salt once it has doubled),
+#  keep the heavy metal and salt volume ledger (hm_ledger.py) and write the TRITON deck. RefuelBurnEngine holds
+#  the parts of that cycle they share; the drivers keep what differs (salt and nuclide vector,
+#  how burned salt and refuel are blended, deck text).
+#
+#  A campaign is described by a declarative spec: a JSON file (campaign_spec.json in the campaign
+#  root, read automatically) or a dict of sections, for example
+#
+#      {"salt":   {"ThF4molpct": 6.58, "fuelmolpct": 8.0},
+#       "refuel": {"UF4molpct": 5.0, "enrichment": 0.195, "rvols": [100, 7000, 15000, 30000, 60000, 120000]},
+#       "burn":   {"dep_step": 7, "power": 400.0},
+#       "blend":  "numpy"}
+#
+#  Values not in the spec keep the driver defaults.
+#
+# *******************************************************************************************************
+
+import os
+import json
+import math
+import stat
+import numpy as np
+import salts_wf
+import refuel_search
+import scale_output
+import hm_ledger
+from run_state import RunStateDB
+
+SPEC_FILE = 'campaign_spec.json'      # Campaign spec read from the campaign root when it exists
+
+REFUEL_NUCLIDES = ['li-6', 'li-7', 'be-9', 'f-19', 'u-234', 'u-235', 'u-236', 'u-238']    # Order of get_refuel_wf
+FEED_MIX: int = 13                    # TRITON mixture of the refuel salt feed tank
+
+# SPEC_KEYS[(section, key)] = driver attribute the spec value sets (key None: the section is the value)
+SPEC_KEYS = {('salt', 'UF4molpct'): 'UF4molpct',            # Core salt UF4 mol % (FLiBe-U)
+             ('salt', 'ThF4molpct'): 'ThF4molpct',          # Core salt ThF4 mol % (FLiBe-U-Th)
+             ('salt', 'fuelmolpct'): 'fuelmolpct',          # Core salt UF4 + ThF4 mol % (FLiBe-U-Th)
+             ('salt', 'enrichment_pct'): 'Uenrichpct',      # Core salt uranium enrichment %
+             ('salt', 'V0'): 'V0',                          # BOC fuel salt volume in cm^3
+             ('salt', 'init_MTiHM'): 'init_MTiHM',          # BOC MTiHM
+             ('refuel', 'UF4molpct'): 'refuelUF4molpct',    # Refuel salt UF4 mol %
+             ('refuel', 'enrichment'): 'renrich',           # Refuel enrichment fraction
+             ('refuel', 'rvols'): 'rvols',                  # Refuel volumes of the wide KENO bracket in cm^3
+             ('refuel', 'search_mode'): 'search_mode',      # 'fixed' or 'adaptive' KENO bracket
+             ('refuel', 'feed_mode'): 'feed_mode',          # 'discrete' blends only; 'continuous' also feeds through the TRITON timetable
+             ('burn', 'dep_step'): 'dep_step',              # Depletion step length in days
+             ('burn', 'power'): 'power',                    # TRITON power in MW
+             ('burn', 'adaptive_steps'): 'adaptive_steps',  # Let step_control.py choose the step lengths
+             ('burn', 'lib_days'): 'lib_days',              # Longest burn per TRITON cross section library in days
+             ('burn', 'horizon_days'): 'horizon_days',      # Simulated days after which the campaign stops
+             ('keno', 'sig'): 'sig',                        # KENO k-eff target standard deviation
+             ('blend', None): 'blend_engine'}               # 'numpy' or 'origen' (Th-EIRENE)
+
+
+def load_spec(spec):
+    'Returns a campaign spec as a dict of sections, from a dict or the path of a JSON file.'
+    if isinstance(spec, dict):
+        return spec
+    with open(os.path.expanduser(spec), 'r') as f:
+        return json.load(f)
+
+
+def spec_attributes(spec):
+    'Returns {driver attribute: value} of a campaign spec. Raises ValueError on keys the engine does not know.'
+    attrs = {}
+    for section, value in spec.items():
+        if (section, None) in SPEC_KEYS:
+            attrs[SPEC_KEYS[(section, None)]] = value
+            continue
+        if not isinstance(value, dict):
+            raise ValueError("Unknown campaign spec section: " + section)
+        for key, v in value.items():
+            if (section, key) not in SPEC_KEYS:
+                raise ValueError("Unknown campaign spec key: {}.{}".format(section, key))
+            attrs[SPEC_KEYS[(section, key)]] = v
+    return attrs
+
+
+class RefuelBurnEngine(object):
+    '''Refuel-burn bookkeeping shared by the Sourdough drivers. A driver sets deck_path, V0, init_MTiHM, power,
+       renrich, refuelUF4molpct, fs_tempK, dep_step, adaptive_steps, step_control, lib_days, horizon_days, deck_name,
+       feed_mode, feed_keff_tol, feed_tank_factor, f71_name, the KENO search parameters, run_state_file and ledger in its __init__.'''
+
+    def apply_spec(self, spec=None):
+        '''Sets the driver parameters from a campaign spec (dict or JSON file; by default campaign_spec.json in the
+           campaign root if there is one). Raises ValueError for parameters this driver does not have or modes it
+           cannot run together.'''
+        if spec is None:
+            spec = os.path.join(self.deck_path, SPEC_FILE)
+            if not os.path.exists(spec):
+                self.check_feed_mode()
+                return
+        for attr, value in spec_attributes(load_spec(spec)).items():
+            if not hasattr(self, attr):
+                raise ValueError("The {} driver has no '{}' to set from the campaign spec".format(type(self).__name__, attr))
+            setattr(self, attr, value)
+        self.Uenrichfrac = self.Uenrichpct / 100.0
+        if hasattr(self, 'fuelmolpct'):
+            self.UF4molpct = self.fuelmolpct - self.ThF4molpct      # FLiBe-U-Th: the UF4 share follows from the total
+        self.search_rvols = self.rvols
+        self.check_feed_mode()
+
+    def check_feed_mode(self):
+        '''Raises ValueError for an unknown feed_mode, or for continuous feed with the ORIGEN blend, which blends the
+           burned salt of the .f71 file without the refuel fed through the timetable.'''
+        if self.feed_mode not in ('discrete', 'continuous'):
+            raise ValueError("Unknown feed_mode '{}' (use 'discrete' or 'continuous')".format(self.feed_mode))
+        if self.feed_mode == 'continuous' and getattr(self, 'blend_engine', 'numpy') == 'origen':
+            raise ValueError("feed_mode 'continuous' needs the NumPy blend; the ORIGEN blend (blend_engine 'origen') does not count the fed refuel")
+
+    def step_path(self, iter):
+        'Returns the absolute path of a depletion step directory (the BOC directory for step 0).'
+        if iter == 0:
+            return os.path.join(self.deck_path, 'BOC')
+        return os.path.join(self.deck_path, 'dep_step_{}'.format(iter))
+
+    def add_exec_permission(self, filename):
+        'Gives permission to execute a shell script.'
+        os.chmod(filename, os.stat(filename).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    def get_run_state(self):
+        'Returns the run-state database of the campaign, opening it on first use.'
+        if self.run_state is None:
+            self.run_state = RunStateDB(self.run_state_file)
+        return self.run_state
+
+    def get_ledger(self):
+        'Returns the heavy metal and salt volume ledger of the campaign.'
+        if self.ledger is None:
+            self.ledger = hm_ledger.HeavyMetalLedger(self.get_run_state(), self.V0, self.init_MTiHM)
+        return self.ledger
+
+    ################################
+    #       Refuel Salt
+    ################################
+
+    def refuelsaltmix(self, mU: float = 5) -> str:
+        """Calculates salt mixture, assuming the MSRR salt is a melt of two salts,
+        UF4 salt and a 66.6% LiF 33.3%BeF2 eutectic FLiBe.
+        input: UF4 mol%
+        output: salt name string"""
+
+        mLi: float = (100.0 - mU) * 2.0 / 3.0
+        mBe: float = mLi / 2.0
+        mysalt = f'{mLi:5.3f}%LiF + {mBe:5.3f}%BeF2 + {mU:5.3f}%UF4'
+        if True:
+            print("Salt: ", mysalt)
+            print("Molar percent sum: ", mBe + mLi + mU)
+        return mysalt
+
+    def get_refuel_wf(self):
+        'Returns the weight fractions of each isotope component of the refuel salt.'
+        s = salts_wf.Salt(self.refuelsaltmix(self.refuelUF4molpct), self.renrich)
+        iso_list = s.wf_gen()
+        return iso_list
+
+    def get_refuel_den(self):
+        'Returns the density of the refuel salt.'
+        s = salts_wf.Salt(self.refuelsaltmix(self.refuelUF4molpct), self.renrich)
+        dens = float(s.densityK(self.fs_tempK))
+        return dens
+
+    def get_refuel_MTHM(self, rvol):
+        'Returns the MTHM of uranium in a refuel volume rvol (cm^3).'
+        refuel_wf = self.get_refuel_wf()             # Isotopic weight fraction list for refuel salt
+        refuel_dens = self.get_refuel_den()          # Density of refuel salt in g/cm3
+        total_refuel_mass = rvol*refuel_dens         # Total mass of refuel salt in grams
+        refuel_HM = sum(refuel_wf[4:8])*total_refuel_mass    # u-234, u-235, u-236 and u-238 mass in grams
+        return refuel_HM*1e-6
+
+    ##################################
+    #     Salt Volume and MTiHM
+    ##################################
+
+    def read_salt_volume(self, iter):
+        'Returns the total fuel salt volume saved for a depletion step (V0 for the BOC core).'
+        if iter == 0:
+            return self.V0
+        return self.get_run_state().get(iter, 'salt_volume', self.step_path(iter))
+
+    def new_salt_volume(self, rvol, iter):
+        'Returns the total fuel salt volume after adding rvol to the previous depletion step, halved if it has doubled.'
+        return self.get_ledger().balance(self.read_salt_volume(iter-1), rvol)[0]
+
+    def write_fuel_salt_volume(self, rvol, iter, fed: float = 0.0):
+        '''Saves the salt volume balance of the current depletion step to the ledger and returns the volume at the
+           start of the step (the one in the TRITON geometry). With a continuous feed, the saved volume also holds
+           the fed volume, which comes in after the start of the step.'''
+        return self.get_ledger().record_volume(iter, self.read_salt_volume(iter-1), rvol, fed)
+
+    def get_feed_volume(self, iter):
+        'Returns the refuel volume in cm^3 fed continuously during depletion step iter (0 for discrete steps).'
+        if iter < 1:
+            return 0.0
+        return self.get_run_state().get(iter, 'feed_volume') or 0.0
+
+    def triton_salt_volume(self, iter):
+        'Returns the fuel salt volume in the TRITON geometry of depletion step iter, which its atom densities are per.'
+        return self.read_salt_volume(iter) - self.get_feed_volume(iter)
+
+    def add_refuel_volume(self, volume):
+        'Returns h, the total fuel salt height in the gas plenum after refuel salt has been added.'
+        'The V0 variable is the initial volume from the BOC core.'
+        total_refuel_vol = volume - self.V0
+        h = (total_refuel_vol)/(math.pi*200**2)
+        return h
+
+    def read_burned_densities(self, iter):
+        'Reads {nuclide: atoms/barn-cm} of the burned salt depletion step iter starts from out of the previous .f71 file.'
+        return scale_output.read_f71_densities(os.path.join(self.step_path(iter-1), self.f71_name), self.end_position(iter-1))
+
+    def get_burned_densities(self, iter):
+        'Returns {nuclide: atoms/barn-cm} of the burned salt depletion step iter starts from, saved in the run-state database after the first read.'
+        densities = self.get_run_state().get_nuclides(iter-1)
+        if densities is None:
+            densities = self.read_burned_densities(iter)
+            self.get_run_state().set_nuclides(iter-1, densities)
+        return densities
+
+    def get_burned_salt_MTHM(self, iter):
+        'Returns the true MTHM of the actinides (not Ac, which SCALE does not count as MTHM) in the burned salt depletion step iter starts from.'
+        return hm_ledger.hm_grams(self.get_burned_densities(iter), self.triton_salt_volume(iter-1))*1e-6
+
+    def write_MTiHM_file(self, iter):
+        'Saves the MTiHM after refuel and the power density of the current depletion step to the ledger.'
+        refuel_MTHM = self.get_refuel_MTHM(self.read_crit_refuel(iter))
+        self.get_ledger().record_mtihm(iter, self.get_burned_salt_MTHM(iter), refuel_MTHM, self.power)
+
+    def write_new_power_dens(self, iter):
+        'Returns the power density in MW/MTiHM of the current depletion step.'
+        power_dens = self.get_run_state().get(iter, 'power_dens')
+        if power_dens is None:      # Step written before the ledger existed
+            power_dens = self.power/self.get_run_state().get(iter, 'mtihm', self.step_path(iter))
+        return power_dens
+
+    ##################################
+    #     Critical Refuel Search
+    ##################################
+
+    def get_search_rvols(self, iter):
+        '''Returns the refuel volumes to run KENO for in this depletion step. They follow the length of the step
+           the refuel makes up for, so a step twice as long gets a bracket around twice the refuel.'''
+        if self.search_mode != 'adaptive' or iter == 1:
+            return self.scale_rvols(self.rvols, self.get_step_days(iter-1)/self.dep_step)
+        m = self.get_run_state().get(iter-1, 'fit_slope')        # Slope and critical refuel of the previous step
+        crit = self.get_run_state().get(iter-1, 'crit_refuel')
+        if m is None or crit is None:
+            return self.scale_rvols(self.rvols, self.get_step_days(iter-1)/self.dep_step)
+        if iter > 2:
+            crit = crit*self.get_step_days(iter-1)/self.get_step_days(iter-2)
+        return refuel_search.adaptive_rvols(max(crit, 0.0), m, self.sig, self.adaptive_npts,
+                                            self.adaptive_nsig, self.adaptive_min_width, self.rvol_min)
+
+    def scale_rvols(self, rvols, factor: float):
+        'Returns the refuel volumes scaled by factor, in whole cm^3 and no less than rvol_min (unchanged for factor 1).'
+        if factor == 1:
+            return rvols
+        return [float(max(round(v*factor), self.rvol_min)) for v in rvols]
+
+    def fit_crit_refuel(self, iter, data, weighted: bool = False):
+        '''Fits k-eff against refuel volume (columns refuel, k-eff, k-eff error of data), saves the critical refuel
+           and the fit to the run-state database and returns the critical refuel (0 if none is needed).'''
+        refuel = data[:,0]     # Refuel amounts in cm3
+        keff = data[:,1]       # k-eff data
+        kerr = data[:,2]       # k-eff error
+        if weighted:
+            m, b, self.crit_refuel = refuel_search.fit_crit_refuel(refuel, keff, kerr)
+        else:
+            m, b, self.crit_refuel = refuel_search.fit_crit_refuel(refuel, keff)
+        self.crit_bracketed = refuel_search.root_in_bracket(self.crit_refuel, refuel, self.rvol_min)
+        if self.crit_refuel < 1:
+            self.crit_refuel = 0      # Negative critical refuel: nothing to add
+        # Save the fit too, so the next step's adaptive search can centre its bracket on it
+        self.get_run_state().set(iter, crit_refuel=self.crit_refuel, fit_slope=m, fit_intercept=b)
+        return self.crit_refuel
+
+    def read_crit_refuel(self, iter):
+        'Reads the critical refuel amount saved for the current depletion step (by get_crit_refuel or refuel_needed).'
+        self.crit_refuel = float(self.get_run_state().get(iter, 'crit_refuel', self.step_path(iter)))
+        return self.crit_refuel
+
+    ##################################
+    #     Depletion Step Length
+    ##################################
+
+    def get_step_days(self, iter):
+        'Returns the length in days of depletion step iter (dep_step for the BOC step), choosing and saving it on first use.'
+        if iter < 1:
+            return self.dep_step
+        days = self.get_run_state().get(iter, 'step_days')
+        if days is not None:
+            return days
+        if self.adaptive_lengths() and iter > 1 and self.get_run_state().get(iter, 'crit_refuel', self.step_path(iter)) is None:
+            return self.get_step_days(iter-1)     # Not chosen yet: the critical refuel of the step is still being searched
+        days = self.choose_step_days(iter)
+        self.get_run_state().set(iter, step_days=days)
+        return days
+
+    def adaptive_lengths(self) -> bool:
+        'Checks whether the step lengths are chosen step by step: with adaptive_steps, and always with continuous feed.'
+        return self.adaptive_steps or self.feed_mode == 'continuous'
+
+    def choose_step_days(self, iter):
+        '''Returns the length of depletion step iter: dep_step, or with adaptive_steps what the step controller makes of
+           the refuel rates and TRITON k-eff drifts of the steps before it (needs the critical refuel of step iter).
+           With continuous feed, a step that keeps the last feed rate (the core stayed critical) grows by
+           step_control.grow up to max_days, so one TRITON run feeds for as long as the feed rate holds.'''
+        if not self.adaptive_lengths() or iter == 1:
+            return self.dep_step
+        last = self.get_step_days(iter-1)
+        if self.feed_mode == 'continuous' and self.feed_critical(iter):
+            new_days = min(last*self.step_control.grow, self.step_control.max_days)
+        else:
+            steps = range(max(2, iter - self.step_control.window + 1), iter + 1)    # Refuels of these steps, burnup of the ones before
+            days = [self.get_step_days(j-1) for j in steps]
+            refuels = [self.get_run_state().get(j, 'crit_refuel', self.step_path(j)) for j in steps]
+            drifts = [self.triton_keff_drift(j-1) for j in steps]
+            new_days = self.step_control.next_days(days, refuels, drifts, self.read_salt_volume(iter-1))
+        if new_days != last:
+            print("Depletion step {} will burn for {:g} days instead of {:g}.".format(iter, new_days, last))
+        return new_days
+
+    def choose_nlib(self, iter) -> int:
+        '''Returns the number of TRITON cross section libraries of depletion step iter and saves it with the step: one
+           per lib_days of burn or less, so a long adaptive step updates its cross sections as often as a short one.'''
+        nlib = max(1, math.ceil(self.get_step_days(iter)/self.lib_days - 1e-9))
+        self.get_run_state().set(iter, nlib=nlib)
+        return nlib
+
+    def get_nlib(self, iter) -> int:
+        'Returns the number of TRITON cross section libraries depletion step iter was written with (1 for the BOC step and older campaigns).'
+        nlib = self.get_run_state().get(iter, 'nlib') if iter > 0 else None
+        return int(nlib) if nlib else 1
+
+    def end_position(self, iter, mixture: int = 1) -> int:
+        'Returns the .f71 position of the end-of-step composition of the mixture-th depleted mixture of depletion step iter.'
+        return scale_output.end_position(self.get_nlib(iter), mixture)
+
+    def triton_keff_drift(self, iter):
+        'Returns |k-eff at the end - k-eff at the start| of the TRITON run of a depletion step (inf if it cannot be read).'
+        out_name = os.path.splitext(self.deck_name)[0] + '.out'
+        keff, kerr = scale_output.read_triton_keff(os.path.join(self.step_path(iter), out_name))
+        if len(keff) < 2:
+            return np.inf
+        return abs(keff[-1] - keff[0])
+
+    def campaign_days(self, iter):
+        'Returns the simulated days at the end of depletion step iter.'
+        return sum(self.get_step_days(j) for j in range(1, iter + 1))
+
+    def horizon_reached(self, iter) -> bool:
+        'Checks whether depletion step iter ended at or after horizon_days (never, if there is no horizon).'
+        return self.horizon_days is not None and iter > 0 and self.campaign_days(iter) >= self.horizon_days
+
+    ##################################
+    #     Continuous Refuel Feed
+    ##################################
+
+    def get_refuel_adens(self):
+        'Returns {nuclide: atoms/barn-cm} of the refuel salt.'
+        dens = self.get_refuel_den()
+        return {n: float(wf)*dens/float(n.split('-')[1])*0.6022140857 for n, wf in zip(REFUEL_NUCLIDES, self.get_refuel_wf())}
+
+    def get_feed_rate(self, iter):
+        'Returns the continuous refuel feed rate in cm^3/day of depletion step iter (None if not decided yet).'
+        if iter < 1:
+            return None
+        return self.get_run_state().get(iter, 'feed_rate')
+
+    def update_feed_rate(self, iter):
+        '''Returns the feed rate of depletion step iter and saves it. The critical refuel found at the start of the step
+           is what the last feed rate fell short by over the step before (negative if it overshot), so that much per day
+           is added to it. The critical refuel itself is still blended in at the start of the step.'''
+        rate = self.get_feed_rate(iter)
+        if rate is not None:
+            return rate       # Kept by reuse_feed_rate, or already saved before a restart
+        rate = self.get_feed_rate(iter-1) or 0.0
+        fit = [self.get_run_state().get(iter, k) for k in ['fit_slope', 'fit_intercept']]
+        if fit[0] and fit != [self.get_run_state().get(iter-1, k) for k in ['fit_slope', 'fit_intercept']]:
+            deficit = (1.0 - fit[1])/fit[0]               # Unclamped root of this step's k-eff fit
+        else:
+            deficit = self.read_crit_refuel(iter)         # No KENO search this step (the last fit was carried forward)
+        rate = max(rate + deficit/self.get_step_days(iter-1), 0.0)
+        self.get_run_state().set(iter, feed_rate=rate)
+        print("Refuel feed rate for depletion step {}: {:.1f} cm3/day".format(iter, rate))
+        return rate
+
+    def reuse_feed_rate(self, iter) -> bool:
+        '''Checks whether depletion step iter can keep the last feed rate without a KENO search: the TRITON run of the
+           previous step ended within feed_keff_tol of critical. If so, saves a zero critical refuel and the last fit.'''
+        if self.feed_mode != 'continuous' or iter == 1:
+            return False
+        if self.get_feed_rate(iter) is not None:
+            return True       # Decided before a restart
+        rate = self.get_feed_rate(iter-1)
+        if rate is None or not self.feed_critical(iter):
+            return False
+        print("TRITON ended critical; depletion step {} keeps feeding {:.1f} cm3/day.".format(iter, rate))
+        os.makedirs(self.step_path(iter), exist_ok=True)     # No KENO decks make the step directory
+        m = self.get_run_state().get(iter-1, 'fit_slope')
+        b = self.get_run_state().get(iter-1, 'fit_intercept')
+        self.crit_refuel = 0
+        self.get_run_state().set(iter, crit_refuel=0.0, fit_slope=m, fit_intercept=b, feed_rate=rate)
+        return True
+
+    def feed_critical(self, iter) -> bool:
+        'Checks whether the TRITON run of the step before depletion step iter ended within feed_keff_tol of critical.'
+        out_name = os.path.splitext(self.deck_name)[0] + '.out'
+        keff, kerr = scale_output.read_triton_keff(os.path.join(self.step_path(iter-1), out_name))
+        return len(keff) > 0 and abs(keff[-1] - 1.0) <= self.feed_keff_tol
+
+    def plan_feed_volume(self, iter):
+        'Returns the refuel volume in cm^3 to feed continuously during depletion step iter (0 for discrete steps).'
+        if self.feed_mode != 'continuous':
+            return 0.0
+        return self.update_feed_rate(iter)*self.get_step_days(iter)
+
+    def write_feed(self, iter, fed: float, salt_volume: float):
+        '''Returns the (material block, depletion list entry, timetable flow) that feed the refuel volume fed (cm^3)
+           during depletion step iter in its TRITON deck; empty strings if there is nothing to feed. salt_volume is
+           the fuel salt volume of the TRITON geometry that the atom densities are per.
+
+           The feed tank (mixture FEED_MIX) holds feed_tank_factor times the refuel of the step and feeds the fuel salt
+           by fractional removal at the rate that empties exactly the refuel volume into it over the step, so the
+           feed rate falls by 1/feed_tank_factor over the step.'''
+        if fed <= 0:
+            return '', '', ''
+        days = self.get_step_days(iter)
+        tank = fed*self.feed_tank_factor
+        mat = "' Refuel salt feed tank ({:.1f} cm3 of refuel)\n".format(tank)
+        for n, adens in self.get_refuel_adens().items():
+            mat += "{:10s} {} 0  {:>5e} 923.15 end \n".format(n, FEED_MIX, adens*tank/salt_volume)
+        rate = -math.log(1.0 - 1.0/self.feed_tank_factor)/(days*86400.0)
+        flow = ''''continuous refuel salt feed
+'feed: {fed:.1f} cm3 of refuel salt over {days:g} days ({rate_day:.1f} cm3/day)
+  flow
+    from {mix} to 1
+    type fractional_removal
+    units pers
+    nuclides   Li          Be          F           U           end
+    rates      {r:.5E} {r:.5E} {r:.5E} {r:.5E} end
+    time       0.0 end
+    multiplier 1.0 end
+  end flow
+'''.format(fed=fed, days=days, rate_day=fed/days, mix=FEED_MIX, r=rate)
+        return mat, ' {}'.format(FEED_MIX), flow
@@ -0,0 +1,98 @@
+# ******************************************************************************************************
+#
+#                       Sourdough Critical Refuel Search Helpers
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  Shared by the EIRENE (run_sourdough.py) and Th-EIRENE (batchfeed_ORIGEN_ThEIRENE.py) refuel drivers.
+#
+# *******************************************************************************************************
+
+import numpy as np
+
+
+#####################################################
+#          Linear k-eff vs. Refuel Volume Fit
+#####################################################
+
+def fit_crit_refuel(refuel, keff, kerr=None):
+    '''Fits k-eff against refuel volume with a straight line. Returns (slope, intercept, critical refuel volume).
+       If the KENO uncertainties kerr are given, each point is weighted by 1/kerr.'''
+    refuel = np.asarray(refuel, dtype=float)
+    keff = np.asarray(keff, dtype=float)
+    if kerr is None:
+        m, b = np.polyfit(refuel, keff, 1)
+    else:
+        m, b = np.polyfit(refuel, keff, 1, w=1.0/np.asarray(kerr, dtype=float))
+    crit = (1.0 - b) / m         # Refuel amount for which k-eff = 1
+    return m, b, crit
+
+
+def bracketing_pair(refuel, keff):
+    '''Returns the two refuel volumes worth rerunning at full statistics: the neighbouring pair
+       whose k-eff values straddle 1, or the two points closest to k-eff = 1 if none do.'''
+    refuel = np.asarray(refuel, dtype=float)
+    keff = np.asarray(keff, dtype=float)
+    order = np.argsort(refuel)
+    refuel = refuel[order]
+    keff = keff[order]
+    for x in range(len(refuel) - 1):
+        if (keff[x] - 1.0) * (keff[x+1] - 1.0) <= 0.0:
+            return [float(refuel[x]), float(refuel[x+1])]
+    nearest = np.argsort(np.abs(keff - 1.0))[:2]
+    return sorted(float(refuel[x]) for x in nearest)
+
+
+#####################################################
+#        Adaptive Bracket Around k-eff = 1
+#####################################################
+
+def adaptive_rvols(crit_guess: float, slope: float, sig: float, npts: int = 3,
+                   nsig: float = 3.0, min_width: float = 2000.0, rmin: float = 100.0):
+    '''Returns a tight set of refuel volumes (cm^3) centred on the predicted critical refuel volume.
+
+       The half-width of the bracket is the refuel volume that moves k-eff by nsig KENO standard
+       deviations (nsig*sig/|dk/dV|), but never less than min_width. Volumes are kept above rmin.'''
+    if slope == 0 or not np.isfinite(slope):
+        half = min_width
+    else:
+        half = max(nsig * sig / abs(slope), min_width)
+    lo = max(crit_guess - half, rmin)
+    hi = max(crit_guess + half, lo + 2.0 * half)    # Keep the full width if the low end got clamped
+    vols = np.linspace(lo, hi, npts)
+    return [float(round(v)) for v in vols]          # Whole cm^3 keeps the refuel_* directory names tidy
+
+
+def root_in_bracket(crit: float, rvols, rmin: float = 100.0) -> bool:
+    '''Checks whether the fitted critical refuel volume lies inside the sampled refuel volumes.
+       A root below the sampled range still counts when the bracket already starts at rmin,
+       since get_crit_refuel clamps such roots to zero refuel anyway.'''
+    lo = min(rvols)
+    hi = max(rvols)
+    if lo <= crit <= hi:
+        return True
+    if crit < lo and lo <= rmin:
+        return True
+    return False
+
+
+#####################################################
+#        Skip the Search When No Refuel Is Needed
+#####################################################
+
+def predict_no_refuel(k_traj, kerr, slope: float, nsig: float = 3.0,
+                      margin: float = 0.002, rmin: float = 100.0):
+    '''Predicts the critical refuel volume of the next step from the last TRITON step's k-eff trajectory.
+
+       The burned salt the next step starts from is the end-of-step TRITON composition, so k-eff with no
+       refuel is taken as the last TRITON k-eff, lowered by nsig standard deviations, by the k-eff drift
+       seen over the last step, and by a KENO/TRITON bias margin. The stored dk/dV slope converts the
+       remaining reactivity deficit into a refuel volume.
+       Returns (skip, predicted critical refuel volume); skip is True when that volume is below rmin.'''
+    k_traj = np.asarray(k_traj, dtype=float)
+    drift = max(k_traj[0] - k_traj[-1], 0.0) if len(k_traj) > 1 else 0.0
+    k_low = k_traj[-1] - nsig * kerr - drift - margin     # Conservative k-eff with zero refuel
+    if slope <= 0 or not np.isfinite(slope):
+        return False, float('nan')
+    crit = (1.0 - k_low) / slope
+    return bool(crit < rmin), float(crit)
@@ -0,0 +1,147 @@
+# ******************************************************************************************************
+#
+#                       Sourdough Step Output Retention and Compression
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  Once the driver and the analytics have what they need from a finished depletion step (scalars and
+#  the nuclide vector in the run-state database), the bulky raw SCALE outputs of the step are pruned
+#  or compressed: zstd if the zstandard module is installed, gzip otherwise. Files matching the
+#  keep-list are left alone. KENO run directories whose job may still be writing to them (a job ID but
+#  no final k-eff, early-stop estimate or cancellation) are skipped whole, whichever step they are in.
+#  The readers below open an archived file as if it were still there.
+#
+# *******************************************************************************************************
+
+import os
+import gzip
+import shutil
+import tempfile
+from fnmatch import fnmatch
+from contextlib import contextmanager
+import scale_output
+import keno_monitor
+try:
+    import zstandard
+except ImportError:      # gzip is used instead
+    zstandard = None
+
+ARCHIVE_EXTS = ['.zst', '.gz']     # Extensions of archived files, in the order they are looked for
+
+# Paths relative to the step directory (fnmatch's * also matches /, so '*.h5' covers the sub-runs too)
+KEEP = ['*.inp', '*.sh', '*.npy', '*job_id', '*data-temp.out', '*screen-data.out', '*keno-estimate.out',
+        '*_dep_step_*']                                  # Left as they are
+PRUNE = ['*.h5', '*.f33', '*/*.msg', 'rejected_*']       # Deleted
+
+
+def archived_path(filename):
+    'Returns the path of the archived copy of a file, or None if there is none.'
+    for ext in ARCHIVE_EXTS:
+        if os.path.exists(filename + ext):
+            return filename + ext
+    return None
+
+
+def exists(filename) -> bool:
+    'Checks whether a file exists as it is or archived.'
+    return os.path.exists(filename) or archived_path(filename) is not None
+
+
+def open_archived(filename):
+    'Opens a file for binary reading, decompressing its archived copy on the fly if the file itself was archived.'
+    if os.path.exists(filename):
+        return open(filename, 'rb')
+    archive = archived_path(filename)
+    if archive is None:
+        raise FileNotFoundError(filename)
+    if archive.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError("The zstandard module is needed to read " + archive)
+        return zstandard.ZstdDecompressor().stream_reader(open(archive, 'rb'), closefd=True)
+    return gzip.open(archive, 'rb')
+
+
+def read_bytes(filename) -> bytes:
+    'Returns the contents of a file, archived or not.'
+    with open_archived(filename) as f:
+        return f.read()
+
+
+@contextmanager
+def local_copy(filename):
+    '''Yields a path to an uncompressed copy of a file, for programs such as obiwan that cannot read the archive.
+       This is the file itself if it was not archived; otherwise a temporary copy that is deleted afterwards.'''
+    if os.path.exists(filename) or archived_path(filename) is None:
+        yield filename
+        return
+    tmp_dir = tempfile.mkdtemp(prefix='sourdough_')
+    tmp_file = os.path.join(tmp_dir, os.path.basename(filename))
+    try:
+        with open_archived(filename) as src, open(tmp_file, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        yield tmp_file
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def job_running(run_dir) -> bool:
+    'Checks whether the job of a KENO run directory may still be going (it has a job ID but is neither finished nor cancelled).'
+    return (os.path.exists(os.path.join(run_dir, keno_monitor.JOB_ID_FILE)) and not scale_output.run_finished(run_dir)
+            and not os.path.exists(os.path.join(run_dir, keno_monitor.CANCELLED_FILE)))
+
+
+def compress_file(filename, level: int = 10) -> int:
+    'Replaces a file with its compressed copy (written atomically) and returns the number of bytes saved.'
+    ext = '.zst' if zstandard is not None else '.gz'
+    tmp_file = filename + ext + '.tmp'
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as src:
+        if zstandard is not None:
+            with open(tmp_file, 'wb') as dst:
+                zstandard.ZstdCompressor(level=level).copy_stream(src, dst)
+        else:
+            with gzip.open(tmp_file, 'wb', compresslevel=min(level, 9)) as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+    os.replace(tmp_file, filename + ext)
+    os.remove(filename)
+    return size - os.path.getsize(filename + ext)
+
+
+class RetentionPolicy(object):
+    'Which outputs of a finished depletion step are kept, deleted or compressed.'
+    def __init__(self, keep=None, prune=None, min_size: int = 65536, level: int = 10):
+        self.keep = KEEP if keep is None else keep        # Patterns of files left as they are
+        self.prune = PRUNE if prune is None else prune    # Patterns of files deleted
+        self.min_size:int = min_size                      # Smaller files are not worth compressing
+        self.level:int = level                            # zstd level (gzip uses at most 9)
+
+    def action(self, relpath, size):
+        'Returns keep, prune or compress for a file at relpath (relative to the step directory).'
+        if any(relpath.endswith(ext) for ext in ARCHIVE_EXTS) or any(fnmatch(relpath, p) for p in self.keep):
+            return 'keep'
+        if any(fnmatch(relpath, p) for p in self.prune):
+            return 'prune'
+        return 'compress' if size >= self.min_size else 'keep'
+
+    def apply(self, step_dir):
+        '''Prunes and compresses the outputs of a step directory, leaving the run directories of jobs still going alone.
+           Returns (files compressed, files deleted, bytes saved).'''
+        compressed = pruned = saved = 0
+        running = [os.path.join(step_dir, d) for d in os.listdir(step_dir) if job_running(os.path.join(step_dir, d))]
+        for root, dirs, files in os.walk(step_dir, topdown=False):
+            if any(root == d or root.startswith(d + os.sep) for d in running):
+                continue
+            for name in files:
+                filename = os.path.join(root, name)
+                size = os.path.getsize(filename)
+                action = self.action(os.path.relpath(filename, step_dir), size)
+                if action == 'prune':
+                    os.remove(filename)
+                    pruned += 1
+                    saved += size
+                elif action == 'compress':
+                    saved += compress_file(filename, self.level)
+                    compressed += 1
+            if root != step_dir and not os.listdir(root):
+                os.rmdir(root)        # Sub-run left empty by pruning
+        return compressed, pruned, saved
@@ -9,25 +9,69 @@
 import time
 import os
 import shutil
-import salts_wf
 import initialize_BOC
 from initialize_BOC import BOC_core
 import numpy as np
 from numpy import genfromtxt
 #import matplotlib.pyplot as plt
-import math
 import sys, re
 import subprocess
+import refuel_search
+import keff_surrogate
+import scale_output
+import keno_monitor
+import retention
+from stage_timing import StageTimer, timed
+from refuel_engine import RefuelBurnEngine
+from step_control import StepController
+from deck_template import DeckTemplate
 
 SCALE_bin_path: str = os.getenv('SCALE_BIN', '/opt/scale6.3.1/bin/')
 
+# Nuclides in the fuel salt material vector (same order as get_burned_salt_atoms and mix_salts)
+FUEL_ISOTOPES = ["li-6", "li-7", "be-9", "f-19", "u-234", "u-235", "u-236", "u-238", "h-1", "h-2", "h-3", "he-3", "he-4", "be-7",
+                 "b-10", "b-11", "n-14", "n-15", "o-16", "o-17", "na-23", "mg-24", "mg-25", "mg-26",
+                 "al-27", "si-28", "si-29", "si-30", "p-31", "s-32", "s-33", "cl-35", "cl-37",
+                 "ar-36", "ar-38", "ar-40", "as-74", "as-75", "k-39",
+                 "k-40", "k-41", "ca-40", "ca-42", "ca-43", "ca-44", "ca-46", "ca-48", "sc-45",
+                 "ti-46", "ti-47", "ti-48", "ti-49", "ti-50", "cr-50", "cr-52", "cr-53", "cr-54", "mn-55", "fe-54", "fe-56", "fe-57", "fe-58", 
+                 "co-58", "co-59", "ni-58", "ni-59", "ni-60", "ni-61", "ni-62", "ni-64", "cu-63", "cu-65", "ga-69", "ga-71", "ge-70", 
+                 "ge-72", "ge-73", "ge-74", "ge-76", "se-74", "se-76", "se-77", "se-78", "se-79", "se-80",
+                 "se-82", "br-79", "br-81", "kr-78", "kr-80", "kr-82", "kr-83", "kr-84", "kr-85", "kr-86", "rb-85",
+                 "rb-86", "rb-87", "sr-84", "sr-86", "sr-87", "sr-88", "sr-89", "sr-90", "y-89", "y-90", "y-91", "zr-90", "zr-91",
+                 "zr-92", "zr-93", "zr-94", "zr-95", "zr-96", "nb-93", "nb-94", "nb-95", "mo-92", "mo-94", "mo-95", "mo-96", "mo-97", "mo-98",
+                 "mo-99", "mo-100", "tc-99", "ru-96", "ru-98", "ru-99", "ru-100", "ru-101", "ru-102", "ru-103", "ru-104", "ru-105", "ru-106",
+                 "rh-103", "rh-105", "pd-102", "pd-104", "pd-105", "pd-106", "pd-107", "pd-108", "pd-110", "ag-107",
+                 "ag-109", "ag-111", "cd-106", "cd-108", "cd-110", "cd-111", "cd-112", "cd-113",
+                 "cd-114", "cd-116", "in-113", "in-115", "sn-112", "sn-113", "sn-114", "sn-115",
+                 "sn-116", "sn-117", "sn-118", "sn-119", "sn-120", "sn-122", "sn-123", "sn-124", "sn-125", "sn-126", "sb-121",
+                 "sb-123", "sb-124", "sb-125", "sb-126", "te-120", "te-122", "te-123", "te-124", "te-125", "te-126", "te-128",
+                 "te-130", "te-132", "i-127", "i-129", "i-130", "i-131", "i-135", "xe-123",
+                 "xe-124", "xe-126", "xe-128", "xe-129", "xe-130", "xe-131", "xe-132", "xe-133", "xe-134", "xe-135", "xe-136",
+                 "ce-136", "ce-138", "ce-139", "ce-140", "ce-141", "ce-142", "ce-143", "ce-144", "pr-141", "pr-142",
+                 "pr-143", "ba-130", "ba-132", "ba-133", "ba-134", "ba-135", "ba-136", "ba-137", "ba-138",
+                 "ba-140", "la-138", "la-139", "la-140", "nd-142", "nd-143", "nd-144", "nd-145", "nd-146", "nd-147", "sm-149", "sm-150", "sm-151",
+                 "sm-152", "sm-153", "sm-154", "eu-151", "eu-152", "eu-153", "eu-154", "eu-155", "eu-156", "eu-157", "gd-152", "gd-153", "gd-154",
+                 "gd-155", "gd-156", "gd-157", "gd-158", "gd-160", "tb-159", "tb-160", "dy-156", "dy-158", "dy-160",
+                 "dy-161", "dy-162", "dy-163", "dy-164", "ho-165", "er-162", "er-164", "er-166", "er-167", "er-168",
+                 "er-170", "lu-175", "lu-176", "hf-174", "hf-176", "hf-177", "hf-178", "hf-179", "hf-180", "ta-181", "ta-182", "w-182",
+                 "w-183", "w-184", "w-186", "re-185", "re-187", "ir-191", "ir-193", "au-197", "hg-196", "hg-198", "hg-199", "hg-200", "hg-201", "hg-202",
+                 "hg-204", "pb-204", "pb-206", "pb-207", "pb-208", "bi-209", "ra-223", "ra-224", "ra-225", "ra-226", "ac-225",
+                 "ac-226", "ac-227", "u-231", "u-232", "u-233", "u-237", "u-239", "th-227", "th-228", "th-229", "th-230", "th-231",
+                 "th-232", "th-233", "th-234", "pa-229", "pa-230", "pa-231", "pa-232", "pa-233", "pu-236", "pu-237",
+                 "pu-238", "pu-239", "pu-240", "pu-241", "pu-242", "pu-243", "pu-244", "pu-246", "np-234", "np-235", "np-236",
+                 "np-237", "np-238", "np-239", "cm-240", "cm-241", "cm-242", "cm-243", "cm-244", "cm-245", "cm-246", "cm-247",
+                 "cm-248", "cm-249", "cm-250", "es-251", "es-252", "es-253", "es-254", "es-255", "am-240", "am-241", "am-242",
+                 "am-243", "am-244", "bk-245", "bk-246", "bk-247", "bk-248", "bk-249", "bk-250", "cf-246",
+                 "cf-248", "cf-249", "cf-250", "cf-251", "cf-252", "cf-253", "cf-254"]
+
 #####################################################
 #     Write KENO Decks Based on Refuel Parameters
 #####################################################
 
-class Refuel_Deck(object):
+class Refuel_Deck(RefuelBurnEngine):
     'Create parallel KENO decks for EIRENE for different refuel volume additions. After obtaining critical refuel amount, writes and runs a new TRITON deck.'
-    def __init__(self):
+    def __init__(self, campaign_root: str = '~/EIRENE11/SD7pct', spec=None):
         # ************************
         #   Set Material Params.
         # ************************
@@ -46,8 +90,30 @@ class Refuel_Deck(object):
         #    Set Refuel Params.
         # ************************
         self.renrich = 0.07                                    # Refuel enrichment fraction
+        self.refuelUF4molpct:float = 5.0                       # Refuel salt UF4 mol % (same FLiBe-U salt as the core)
         self.rvols = [1000, 30000, 70000, 110000, 160000]      # Refuel volumes in cm^3
         self.V0 = 1.0700515E+07                                # Total fuel salt volume for BOC core in cm^3
+        self.search_mode:str = 'fixed'     # 'fixed' runs every volume in rvols; 'adaptive' brackets the last step's critical refuel
+        self.adaptive_npts:int = 3         # Number of KENO points in the adaptive bracket
+        self.adaptive_nsig:float = 3.0     # Bracket half-width in KENO standard deviations of k-eff
+        self.adaptive_min_width:float = 2000.0   # Minimum bracket half-width in cm^3
+        self.rvol_min:float = 100.0        # Smallest refuel volume the adaptive bracket may place in cm^3
+        self.skip_search:bool = False      # Skip the KENO search when the last TRITON step shows clear excess reactivity
+        self.skip_nsig:float = 3.0         # Number of k-eff standard deviations required below the predicted k-eff
+        self.skip_margin:float = 0.002     # Extra k-eff margin for KENO/TRITON bias
+        self.use_surrogate:bool = False    # Let the surrogate k-eff model stand in for the KENO search when it is confident
+        self.surrogate_tol:float = 0.001   # Largest k-eff half-width (surrogate_nsig std. devs.) accepted at the predicted root
+        self.surrogate_nsig:float = 2.0    # Number of standard deviations in the surrogate confidence interval
+        self.surrogate_min_steps:int = 5   # KENO-trained steps needed before the surrogate is trusted
+        self.surrogate_max_skips:int = 4   # Force a KENO search after this many surrogate steps in a row
+        self.surrogate_npts:int = 9        # Refuel volume grid points the surrogate is evaluated on
+        self.surrogate = None              # SurrogateKeff model, loaded on first use
+        self.search_rvols = self.rvols     # Refuel volumes used in the current step's KENO search
+        self.speculative:bool = False      # Launch the next step's KENO search from an extrapolated burned salt while TRITON runs
+        self.speculative_tol:float = 0.005       # Largest relative deviation of a major nuclide accepted at validation
+        self.speculative_min_frac:float = 1e-4   # Nuclides above this fraction of the total atom density are checked
+        self.speculative_file:str = 'speculative_adens.npy'    # Extrapolated burned salt, kept in the step directory until validated
+        self.speculative_adens = {}        # speculative_adens[step] = extrapolated burned salt used while writing its decks
 
         # ************************
         #    Set KENO Params.
@@ -56,34 +122,85 @@ class Refuel_Deck(object):
         self.nsk:float = 20              # Number of skipped generations (nsk)
         self.gen:float = 5020            # Number of generations (gen)
         self.sig:float = 50e-5           # (sig)
-        self.dep_step:float = 21          # Length of single depletion step in days
+        self.dep_step:float = 7           # Length of single depletion step in days (first step, or every step without adaptive_steps)
+        self.adaptive_steps:bool = False  # Lengthen/shorten the steps with the refuel rate and k-eff drift (see step_control.py)
+        self.step_control = StepController()    # Step length limits and tolerances of adaptive_steps
+        self.lib_days:float = 7           # Longest burn per TRITON cross section library in days (nlib grows with the step)
+        self.horizon_days = None          # Simulated days after which the master scripts stop (None: run every step)
+        self.feed_mode:str = 'discrete'   # 'discrete' blends the critical refuel in; 'continuous' also feeds it through the TRITON timetable (with adaptive step lengths)
+        self.feed_keff_tol:float = 0.002  # With 'continuous', keep the feed rate (no KENO search) while TRITON ends this close to critical
+        self.feed_tank_factor:float = 20.0     # Feed tank contents as a multiple of the refuel fed over a step
+        self.multifidelity:bool = False  # Screen all refuel candidates cheaply, then rerun only the bracketing pair at full npg/gen
+        self.screen_npg:float = 4000     # Screening run number per generation
+        self.screen_gen:float = 520      # Screening run number of generations
+        self.monitor_keno:bool = False   # Stop running KENO decks once they have the statistics they need (orchestrator)
+        self.monitor_sig_far:float = 300e-5   # k-eff std. dev. enough for a candidate clearly off the bracket
+        self.monitor_near_dk:float = 0.01     # |k-eff - 1| beyond which (plus monitor_nsig std. devs.) a candidate is off the bracket
+        self.monitor_nsig:float = 3.0         # Number of std. devs. an off-bracket candidate must be clear of monitor_near_dk
+        self.monitor_min_gen:int = 120        # Generations (skipped ones included) before a run may be stopped
+        self.keno_monitor = None         # KenoMonitor, created on first use
+        self.archive_outputs:bool = False     # Compress/prune the raw outputs of finished steps (see retention.py)
+        self.archive_lag:int = 3              # Most recent finished steps left untouched (read by the next steps and the EOC pass)
+        self.retention = retention.RetentionPolicy()    # Keep-list, prune list and compression level
 
         # ************************
         #    Running Parameters
         # ************************
         self.queue:str = 'fill'                     # NECluster queue
         self.ppn:int = 64                           # ppn core count
+        self.poll_wait:float = 10.0                 # Seconds between checks for finished jobs
         self.deck_name:str = 'EIRENE.inp'           # KENO input file name
         self.f71_name:str = 'EIRENE.f71'            # Name of .f71 TRITON file to read
         self.qsub_name:str = 'runEIRENE-Scale.sh'   # Name of each qsub file
-        self.qsub_path:str = os.path.expanduser('~/EIRENE11/SD7pct/runEIRENE-Scale.sh')     # Full path to the qsub script
-        self.conv_data_path:str = os.path.expanduser('~/EIRENE11/SD7pct/convert-data.sh')   # Full path to convert-data.sh script
-        self.deck_path:str = os.path.expanduser('~/EIRENE11/SD7pct/')                    # Path of main run directory
-        self.BOC_f71_path:str = os.path.expanduser('~/EIRENE11/SD7pct/BOC')
+        self.campaign_root:str = os.path.abspath(os.path.expanduser(campaign_root))   # Campaign directory; every file path is built from it
+        self.qsub_path:str = os.path.join(self.campaign_root, 'runEIRENE-Scale.sh')     # Full path to the qsub script
+        self.conv_data_path:str = os.path.join(self.campaign_root, 'convert-data.sh')   # Full path to convert-data.sh script
+        self.deck_path:str = self.campaign_root + '/'                                   # Path of main run directory
+        self.BOC_f71_path:str = os.path.join(self.campaign_root, 'BOC')
+        self.surrogate_file:str = os.path.join(self.campaign_root, 'keff_surrogate.npz')   # Surrogate k-eff model data
+        self.run_state_file:str = os.path.join(self.campaign_root, 'run_state.db')        # Per-step salt volume, MTiHM, crit. refuel, height
+        self.run_state = None         # RunStateDB, opened on first use
+        self.ledger = None            # hm_ledger.HeavyMetalLedger, made on first use
+        self.deck_templates = {}      # Cached DeckTemplate of each deck type (core parameters bound on first use)
+        self.timer = StageTimer(os.path.join(self.campaign_root, 'stage_timing.jsonl'), os.path.basename(self.campaign_root))
+        self.recorded_jobs = set()    # Run directories whose job timing is already in the stage timing log
         self.power:float = 400.0      # TRITON power in MW (used for calculating power density)
         self.init_MTiHM:float = 6.883864319048779        # Initial MTiHM for BOC core
+        self.apply_spec(spec)         # Campaign spec (dict or JSON file; default campaign_spec.json in the campaign root)
 
         ##################################
         #     
         ##################################
 
+    def get_template(self, name, text):
+        'Returns the cached DeckTemplate of a deck, with the {self.*} core parameters rendered in on first use.'
+        if name not in self.deck_templates:
+            self.deck_templates[name] = DeckTemplate(text).bind(self=self)
+        return self.deck_templates[name]
+
+    def burned_f71(self, iter):
+        'Returns the absolute path of the .f71 file holding the burned salt that depletion step iter starts from.'
+        return os.path.join(self.step_path(iter-1), self.f71_name)
+
+    def submit(self, path, script=None):
+        'Submits a qsub script from the directory path (the qsub_name script by default) and saves its job ID there.'
+        output = subprocess.run(['qsub', script or self.qsub_name], cwd=path, capture_output=True)
+        job_id = output.stdout.decode().strip()
+        if job_id:
+            with open(os.path.join(path, keno_monitor.JOB_ID_FILE), 'w') as f:
+                f.write(job_id + '\n')
+
     def get_burned_salt_atoms(self, iter):
         'Returns the number of atoms for each constituent of the burned salt.'
-        output = subprocess.run([f"{SCALE_bin_path}/obiwan", "view", "-format=csv", "-prec=10", "-units=atom", "-idform='{:Ee}{:AAA}{:m}'", self.f71_name], capture_output=True)
+        if iter in self.speculative_adens:      # Speculative decks: the .f71 file is not there yet
+            return list(self.speculative_adens[iter] * 1e24 * self.triton_salt_volume(iter-1))
+        with self.timer.stage('obiwan', iter), retention.local_copy(self.burned_f71(iter)) as f71_file:
+            output = subprocess.run([f"{SCALE_bin_path}/obiwan", "view", "-format=csv", "-prec=10", "-units=atom", "-idform='{:Ee}{:AAA}{:m}'", f71_file], capture_output=True)
         output = output.stdout.decode().split("\n")
         densities = {} # densities[nuclide] = (density at position 0 of f71 file)
         skip = ["case", "step", "time", "power", "flux", "volume"]
         regexp = re.compile(r"(?P<elem>[a-zA-Z]+)(?P<num>\d+)(?P<meta>m)?")
+        pos = self.end_position(iter-1)     # End of the previous step (2 for a one-library step)
         for line in output:
             data = line.split(',')
             if data[0].strip() in skip:
@@ -96,7 +213,7 @@ class Refuel_Deck(object):
                     nuclide = elem + "-" + str(num) + "m"   # for metastable isotopes
                 else:
                     nuclide = elem + "-" + str(num)
-                densities[nuclide] = float(data[2])  # The [2] here is what causes the code to return only the densities at position 2 of the f71 file (position 0 is isotope names, 1 is BOC data)
+                densities[nuclide] = float(data[pos])  # Only the densities at the end-of-step position of the f71 file (position 0 is isotope names, 1 is BOC data)
 
         # **** Extract Everything Listed Below: ****
         
@@ -671,17 +788,13 @@ class Refuel_Deck(object):
         
         atoms_cm3_vector = [i * 1e24 for i in burned_salt_vector]   # Converts atoms/barn-cm to atoms/cm3
         
-        last_dep_step_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter-1))
-
         # Multiply by salt volume in cm3 to get number of atoms:
 
         if iter == 1:
             salt_volume = self.V0
             bs_atoms = [i * salt_volume for i in atoms_cm3_vector]
         else:
-            os.chdir(last_dep_step_path)
-            filename = "Salt_volume_dep_step_{}.out".format(iter-1)
-            last_dep_step_vol = genfromtxt("{}".format(filename), delimiter='')   # MTiHM from the previous depletion step
+            last_dep_step_vol = self.triton_salt_volume(iter-1)   # Fuel salt volume of the previous depletion step's TRITON run
             bs_atoms = [i * last_dep_step_vol for i in atoms_cm3_vector]  # Actual burned salt gram quantities after multiplying by previous depletion step MTiHM value
         
         return bs_atoms
@@ -691,32 +804,6 @@ class Refuel_Deck(object):
     #     Write the Refuel Salt
     ################################
 
-    def saltmix(self, mU: float = 5) -> str:
-        """Calculates salt mixture, assuming the MSRR salt is a melt of two salts,
-        UF4 salt and a 66.6% LiF 33.3%BeF2 eutectic FLiBe.
-        input: UF4 mol%
-        output: salt name string"""
-
-        mLi: float = (100.0 - mU) * 2.0 / 3.0
-        mBe: float = mLi / 2.0
-        mysalt = f'{mLi:5.3f}%LiF + {mBe:5.3f}%BeF2 + {mU:5.3f}%UF4'
-        if True:
-            print("Salt: ", mysalt)
-            print("Molar percent sum: ", mBe + mLi + mU)
-        return mysalt
-    
-    def get_refuel_wf(self):
-        'Returns the weight fractions of each isotope component of the refuel salt.'
-        s = salts_wf.Salt(self.saltmix(self.UF4molpct), self.renrich)
-        iso_list = s.wf_gen()
-        return iso_list
-
-    def get_refuel_den(self):
-        'Returns the density of the refuel salt.'
-        s = salts_wf.Salt(self.saltmix(self.UF4molpct), self.renrich)
-        dens = float(s.densityK(self.fs_tempK))
-        return dens
-
     def get_refuel_atoms(self, rvol):
         'Returns the atom density vector of the refuel salt based on the weight fractions of each isotope.'
         refuel_wf = self.get_refuel_wf()
@@ -741,898 +828,43 @@ class Refuel_Deck(object):
     #    Mix Burned Salt w/ Refuel
     #####################################
 
+    def get_refuel_atoms_vector(self):
+        'Returns the refuel salt atoms per cm^3 of refuel, ordered like FUEL_ISOTOPES (only FLiBe and U are nonzero).'
+        refuel_atoms = np.zeros(len(FUEL_ISOTOPES))
+        refuel_atoms[:8] = self.get_refuel_atoms(1.0)      # Atoms scale linearly with the refuel volume
+        return refuel_atoms
+
+    def mix_salts_batch(self, rvols, iter):
+        '''Mixes the burned salt from the previous step with every refuel volume in rvols at once.
+           The burned salt, refuel salt and previous salt volume are read once; returns the
+           (len(rvols) x 376) matrix of mixed salt atom densities in atoms/barn-cm, ordered like FUEL_ISOTOPES.'''
+        rvols = np.asarray(rvols, dtype=float)
+        bs_atoms = np.array(self.get_burned_salt_atoms(iter))      # Number of atoms for each isotope in burned salt mat
+        refuel_atoms = self.get_refuel_atoms_vector()               # Number of atoms per cm^3 of refuel salt
+        bs_vol = self.read_salt_volume(iter-1)                      # Total fuel salt volume of the previous step (V0 for step 1)
+        mixed_atoms = bs_atoms[np.newaxis,:] + rvols[:,np.newaxis]*refuel_atoms[np.newaxis,:]
+        return mixed_atoms / (bs_vol + rvols)[:,np.newaxis] * 1e-24
+
     def mix_salts(self, rvol, iter):
         'Mix the burned salt from the previous step with the refuel salt.'
+        return list(self.mix_salts_batch([rvol], iter)[0])
 
-        # ***** Sum Burned Salt and Refuel Salt Atoms *****
-
-        bs_atoms = self.get_burned_salt_atoms(iter)       # Number of atoms for each isotope in burned salt mat
-        refuel_atoms = self.get_refuel_atoms(rvol)    # Number of atoms for each isotope in refuel salt mat
-
-        # Burned Salt FLiBe Constituents:
-
-        Li6_bs = bs_atoms[0]
-        Li7_bs = bs_atoms[1]
-        Be9_bs = bs_atoms[2]
-        F19_bs = bs_atoms[3]
-        U234_bs = bs_atoms[4]
-        U235_bs = bs_atoms[5]
-        U236_bs = bs_atoms[6]
-        U238_bs = bs_atoms[7]
-        h1 = bs_atoms[8]
-        h2 = bs_atoms[9]
-        h3 = bs_atoms[10]
-        he3 = bs_atoms[11]
-        he4 = bs_atoms[12]
-        be7 = bs_atoms[13]
-      #  be8 = bs_atoms[14]
-        b10 = bs_atoms[14]
-        b11 = bs_atoms[15]
-        #b12 = bs_atoms[17]
-        n14 = bs_atoms[16]
-        n15 = bs_atoms[17]
-        #n16 = bs_atoms[20]
-        o16 = bs_atoms[18]
-        o17 = bs_atoms[19]
-        #f20 = bs_atoms[23]
-        na23 = bs_atoms[20]
-        mg24 = bs_atoms[21]
-        mg25 = bs_atoms[22]
-        mg26 = bs_atoms[23]
-        al27 = bs_atoms[24]
-        si28 = bs_atoms[25]
-        si29 = bs_atoms[26]
-        si30 = bs_atoms[27]
-        p31 = bs_atoms[28]
-        s32 = bs_atoms[29]
-        s33 = bs_atoms[30]
-       # s35 = bs_atoms[32]
-        #s34 = bs_atoms[36]
-        cl35 = bs_atoms[31]
-        #cl36 = bs_atoms[38]
-        cl37 = bs_atoms[32]
-        #cl38 = bs_atoms[40]
-        ar36 = bs_atoms[33]
-        #ar37 = bs_atoms[42]
-        ar38 = bs_atoms[34]
-        #ar39 = bs_atoms[44]
-        ar40 = bs_atoms[35]
-        #ar41 = bs_atoms[46]
-        #as72 = bs_atoms[47]
-        #as73 = bs_atoms[48]
-        as74 = bs_atoms[36]
-        as75 = bs_atoms[37]
-        #as76 = bs_atoms[51]
-        #as77 = bs_atoms[52]
-        #as78 = bs_atoms[53]
-        #as79 = bs_atoms[54]
-        #as80 = bs_atoms[55]
-        #as81 = bs_atoms[56]
-        #as82 = bs_atoms[57]
-        #as83 = bs_atoms[58]
-        #as84 = bs_atoms[59]
-        #as85 = bs_atoms[60]
-        #as86 = bs_atoms[61]
-        #as87 = bs_atoms[62]
-        #as88 = bs_atoms[63]
-        #as89 = bs_atoms[64]
-        #as90 = bs_atoms[65]
-        k39 = bs_atoms[38]
-        k40 = bs_atoms[39]
-        k41 = bs_atoms[40]
-        ca40 = bs_atoms[41]
-        #ca41 = bs_atoms[70]
-        ca42 = bs_atoms[42]
-        ca43 = bs_atoms[43]
-        ca44 = bs_atoms[44]
-        #ca45 = bs_atoms[74]
-        ca46 = bs_atoms[45]
-        #ca47 = bs_atoms[76]
-        ca48 = bs_atoms[46]
-        #ca49 = bs_atoms[78]
-        sc45 = bs_atoms[47]
-        ti46 = bs_atoms[48]
-        ti47 = bs_atoms[49]
-        ti48 = bs_atoms[50]
-        ti49 = bs_atoms[51]
-        ti50 = bs_atoms[52]
-        cr50 = bs_atoms[53]
-        cr52 = bs_atoms[54]
-        cr53 = bs_atoms[55]
-        cr54 = bs_atoms[56]
-        mn55 = bs_atoms[57]
-        fe54 = bs_atoms[58]
-        fe56 = bs_atoms[59]
-        fe57 = bs_atoms[60]
-        fe58 = bs_atoms[61]
-        co58 = bs_atoms[62]
-        co59 = bs_atoms[63]
-        ni58 = bs_atoms[64]
-        ni59 = bs_atoms[65]
-        ni60 = bs_atoms[66]
-        ni61 = bs_atoms[67]
-        ni62 = bs_atoms[68]
-        ni64 = bs_atoms[69]
-        cu63 = bs_atoms[70]
-        #cu64 = bs_atoms[103]
-        cu65 = bs_atoms[71]
-        ga69 = bs_atoms[72]
-        ga71 = bs_atoms[73]
-        ge70 = bs_atoms[74]
-        #ge71 = bs_atoms[108]
-        ge72 = bs_atoms[75]
-        ge73 = bs_atoms[76]
-        ge74 = bs_atoms[77]
-        #ge75 = bs_atoms[112]
-        ge76 = bs_atoms[78]
-        se74 = bs_atoms[79]
-        #se75 = bs_atoms[115]
-        se76 = bs_atoms[80]
-        se77 = bs_atoms[81]
-        se78 = bs_atoms[82]
-        se79 = bs_atoms[83]
-        se80 = bs_atoms[84]
-        #se81 = bs_atoms[121]
-        se82 = bs_atoms[85]
-        br79 = bs_atoms[86]
-        #br80 = bs_atoms[124]
-        br81 = bs_atoms[87]
-        kr78 = bs_atoms[88]
-        #kr79 = bs_atoms[127]
-        kr80 = bs_atoms[89]
-        #kr81 = bs_atoms[129]
-        kr82 = bs_atoms[90]
-        kr83 = bs_atoms[91]
-        kr84 = bs_atoms[92]
-        kr85 = bs_atoms[93]
-        kr86 = bs_atoms[94]
-        rb85 = bs_atoms[95]
-        rb86 = bs_atoms[96]
-        rb87 = bs_atoms[97]
-        sr84 = bs_atoms[98]
-        #sr85 = bs_atoms[139]
-        sr86 = bs_atoms[99]
-        sr87 = bs_atoms[100]
-        sr88 = bs_atoms[101]
-        sr89 = bs_atoms[102]
-        sr90 = bs_atoms[103]
-        y89 = bs_atoms[104]
-        y90 = bs_atoms[105]
-        y91 = bs_atoms[106]
-        #zr89 = bs_atoms[148]
-        zr90 = bs_atoms[107]
-        zr91 = bs_atoms[108]
-        zr92 = bs_atoms[109]
-        zr93 = bs_atoms[110]
-        zr94 = bs_atoms[111]
-        zr95 = bs_atoms[112]
-        zr96 = bs_atoms[113]
-        nb93 = bs_atoms[114]
-        nb94 = bs_atoms[115]
-        nb95 = bs_atoms[116]
-        mo92 = bs_atoms[117]
-        #mo93 = bs_atoms[160]
-        mo94 = bs_atoms[118]
-        mo95 = bs_atoms[119]
-        mo96 = bs_atoms[120]
-        mo97 = bs_atoms[121]
-        mo98 = bs_atoms[122]
-        mo99 = bs_atoms[123]
-        mo100 = bs_atoms[124]
-        tc99 = bs_atoms[125]
-        ru96 = bs_atoms[126]
-        #ru97 = bs_atoms[170]
-        ru98 = bs_atoms[127]
-        ru99 = bs_atoms[128]
-        ru100 = bs_atoms[129]
-        ru101 = bs_atoms[130]
-        ru102 = bs_atoms[131]
-        ru103 = bs_atoms[132]
-        ru104 = bs_atoms[133]
-        ru105 = bs_atoms[134]
-        ru106 = bs_atoms[135]
-        rh103 = bs_atoms[136]
-        #rh104 = bs_atoms[181]
-        rh105 = bs_atoms[137]
-        pd102 = bs_atoms[138]
-        #pd103 = bs_atoms[184]
-        pd104 = bs_atoms[139]
-        pd105 = bs_atoms[140]
-        pd106 = bs_atoms[141]
-        pd107 = bs_atoms[142]
-        pd108 = bs_atoms[143]
-        #pd109 = bs_atoms[190]
-        pd110 = bs_atoms[144]
-        ag107 = bs_atoms[145]
-        #ag108 = bs_atoms[193]
-        ag109 = bs_atoms[146]
-        #ag110 = bs_atoms[195]
-        ag111 = bs_atoms[147]
-        #cd105 = bs_atoms[197]
-        cd106 = bs_atoms[148]
-        #cd107 = bs_atoms[199]
-        cd108 = bs_atoms[149]
-        #cd109 = bs_atoms[201]
-        cd110 = bs_atoms[150]
-        cd111 = bs_atoms[151]
-        cd112 = bs_atoms[152]
-        cd113 = bs_atoms[153]
-        cd114 = bs_atoms[154]
-        #cd115 = bs_atoms[207]
-        cd116 = bs_atoms[155]
-        #cd117 = bs_atoms[209]
-        #cd118 = bs_atoms[210]
-        #cd119 = bs_atoms[211]
-        #cd120 = bs_atoms[212]
-        #cd121 = bs_atoms[213]
-        #cd122 = bs_atoms[214]
-        #cd123 = bs_atoms[215]
-        #cd124 = bs_atoms[216]
-        #cd125 = bs_atoms[217]
-        #cd126 = bs_atoms[218]
-        #cd127 = bs_atoms[219]
-        #cd128 = bs_atoms[220]
-        #cd129 = bs_atoms[221]
-        #cd130 = bs_atoms[222]
-        #cd131 = bs_atoms[223]
-        #cd132 = bs_atoms[224]
-        in113 = bs_atoms[156]
-        #in114 = bs_atoms[226]
-        in115 = bs_atoms[157]
-        sn112 = bs_atoms[158]
-        sn113 = bs_atoms[159]
-        sn114 = bs_atoms[160]
-        sn115 = bs_atoms[161]
-        sn116 = bs_atoms[162]
-        sn117 = bs_atoms[163]
-        sn118 = bs_atoms[164]
-        sn119 = bs_atoms[165]
-        sn120 = bs_atoms[166]
-        #sn121 = bs_atoms[237]
-        sn122 = bs_atoms[167]
-        sn123 = bs_atoms[168]
-        sn124 = bs_atoms[169]
-        sn125 = bs_atoms[170]
-        sn126 = bs_atoms[171]
-        sb121 = bs_atoms[172]
-        #sb122 = bs_atoms[244]
-        sb123 = bs_atoms[173]
-        sb124 = bs_atoms[174]
-        sb125 = bs_atoms[175]
-        sb126 = bs_atoms[176]
-        te120 = bs_atoms[177]
-        #te121 = bs_atoms[250]
-        te122 = bs_atoms[178]
-        te123 = bs_atoms[179]
-        te124 = bs_atoms[180]
-        te125 = bs_atoms[181]
-        te126 = bs_atoms[182]
-        #te127 = bs_atoms[256]
-        te128 = bs_atoms[183]
-        #te129 = bs_atoms[258]
-        te130 = bs_atoms[184]
-        #te131 = bs_atoms[260]
-        te132 = bs_atoms[185]
-        i127 = bs_atoms[186]
-        #i128 = bs_atoms[263]
-        i129 = bs_atoms[187]
-        i130 = bs_atoms[188]
-        i131 = bs_atoms[189]
-        #i132 = bs_atoms[267]
-        #i133 = bs_atoms[268]
-        #i134 = bs_atoms[269]
-        i135 = bs_atoms[190]
-        xe123 = bs_atoms[191]
-        xe124 = bs_atoms[192]
-        #xe125 = bs_atoms[273]
-        xe126 = bs_atoms[193]
-        #xe127 = bs_atoms[275]
-        xe128 = bs_atoms[194]
-        xe129 = bs_atoms[195]
-        xe130 = bs_atoms[196]
-        xe131 = bs_atoms[197]
-        xe132 = bs_atoms[198]
-        xe133 = bs_atoms[199]
-        xe134 = bs_atoms[200]
-        xe135 = bs_atoms[201]
-        xe136 = bs_atoms[202]
-        #ba128 = bs_atoms[285]
-        #ba129 = bs_atoms[286]
-        ba130 = bs_atoms[203]
-        #ba131 = bs_atoms[288]
-        ba132 = bs_atoms[204]
-        ba133 = bs_atoms[205]
-        ba134 = bs_atoms[206]
-        ba135 = bs_atoms[207]
-        ba136 = bs_atoms[208]
-        ba137 = bs_atoms[209]
-        ba138 = bs_atoms[210]
-        #ba139 = bs_atoms[296]
-        ba140 = bs_atoms[211]
-        #ba141 = bs_atoms[298]
-        #ba142 = bs_atoms[299]
-        #ba143 = bs_atoms[300]
-        #ba144 = bs_atoms[301]
-        #ba145 = bs_atoms[302]
-        #ba146 = bs_atoms[303]
-        #ba147 = bs_atoms[304]
-        #ba148 = bs_atoms[305]
-        #ba149 = bs_atoms[306]
-        #ba150 = bs_atoms[307]
-        #ba151 = bs_atoms[308]
-        #ba152 = bs_atoms[309]
-        #ba153 = bs_atoms[310]
-        la138 = bs_atoms[212]
-        la139 = bs_atoms[213]
-        la140 = bs_atoms[214]
-        #ce134 = bs_atoms[314]
-        #ce135 = bs_atoms[315]
-        ce136 = bs_atoms[215]
-        #ce137 = bs_atoms[218]
-        ce138 = bs_atoms[216]
-        ce139 = bs_atoms[217]
-        ce140 = bs_atoms[218]
-        ce141 = bs_atoms[219]
-        ce142 = bs_atoms[220]
-        ce143 = bs_atoms[221]
-        ce144 = bs_atoms[222]
-        #ce145 = bs_atoms[325]
-        #ce146 = bs_atoms[326]
-        #ce147 = bs_atoms[327]
-        #ce148 = bs_atoms[328]
-        #ce149 = bs_atoms[329]
-        #ce150 = bs_atoms[330]
-        #ce151 = bs_atoms[331]
-        #ce152 = bs_atoms[332]
-        #ce153 = bs_atoms[333]
-        #ce154 = bs_atoms[334]
-        #ce155 = bs_atoms[335]
-        #ce156 = bs_atoms[336]
-        #ce157 = bs_atoms[337]
-        pr141 = bs_atoms[223]
-        pr142 = bs_atoms[224]
-        pr143 = bs_atoms[225]
-        nd142 = bs_atoms[226]
-        nd143 = bs_atoms[227]
-        nd144 = bs_atoms[228]
-        nd145 = bs_atoms[229]
-        nd146 = bs_atoms[230]
-        nd147 = bs_atoms[231]
-        sm149 = bs_atoms[232]
-        sm150 = bs_atoms[233]
-        sm151 = bs_atoms[234]
-        sm152 = bs_atoms[235]
-        sm153 = bs_atoms[236]
-        sm154 = bs_atoms[237]
-        eu151 = bs_atoms[238]
-        eu152 = bs_atoms[239]
-        eu153 = bs_atoms[240]
-        eu154 = bs_atoms[241]
-        eu155 = bs_atoms[242]
-        eu156 = bs_atoms[243]
-        eu157 = bs_atoms[244]
-        gd152 = bs_atoms[245]
-        gd153 = bs_atoms[246]
-        gd154 = bs_atoms[247]
-        gd155 = bs_atoms[248]
-        gd156 = bs_atoms[249]
-        gd157 = bs_atoms[250]
-        gd158 = bs_atoms[251]
-        #gd159 = bs_atoms[367]
-        gd160 = bs_atoms[252]
-        tb159 = bs_atoms[253]
-        tb160 = bs_atoms[254]
-        dy156 = bs_atoms[255]
-        #dy157 = bs_atoms[372]
-        dy158 = bs_atoms[256]
-        #dy159 = bs_atoms[374]
-        dy160 = bs_atoms[257]
-        dy161 = bs_atoms[258]
-        dy162 = bs_atoms[259]
-        dy163 = bs_atoms[260]
-        dy164 = bs_atoms[261]
-        ho165 = bs_atoms[262]
-        er162 = bs_atoms[263]
-        #er163 = bs_atoms[382]
-        er164 = bs_atoms[264]
-        #er165 = bs_atoms[384]
-        er166 = bs_atoms[265]
-        er167 = bs_atoms[266]
-        er168 = bs_atoms[267]
-        #er169 = bs_atoms[388]
-        er170 = bs_atoms[268]
-        lu175 = bs_atoms[269]
-        lu176 = bs_atoms[270]
-        hf174 = bs_atoms[271]
-        #hf175 = bs_atoms[393]
-        hf176 = bs_atoms[272]
-        hf177 = bs_atoms[273]
-        hf178 = bs_atoms[274]
-        hf179 = bs_atoms[275]
-        hf180 = bs_atoms[276]
-        ta181 = bs_atoms[277]
-        ta182 = bs_atoms[278]
-        w182 = bs_atoms[279]
-        w183 = bs_atoms[280]
-        w184 = bs_atoms[281]
-        #w185 = bs_atoms[404]
-        w186 = bs_atoms[282]
-        re185 = bs_atoms[283]
-        #re186 = bs_atoms[407]
-        re187 = bs_atoms[284]
-        ir191 = bs_atoms[285]
-        #ir192 = bs_atoms[410]
-        ir193 = bs_atoms[286]
-        #au193 = bs_atoms[412]
-        #au194 = bs_atoms[413]
-        #au195 = bs_atoms[414]
-        #au196 = bs_atoms[415]
-        au197 = bs_atoms[287]
-        #au198 = bs_atoms[417]
-        #au199 = bs_atoms[418]
-        #au200 = bs_atoms[419]
-        hg196 = bs_atoms[288]
-        #hg197 = bs_atoms[421]
-        hg198 = bs_atoms[289]
-        hg199 = bs_atoms[290]
-        hg200 = bs_atoms[291]
-        hg201 = bs_atoms[292]
-        hg202 = bs_atoms[293]
-        #hg203 = bs_atoms[427]
-        hg204 = bs_atoms[294]
-        pb204 = bs_atoms[295]
-        #pb205 = bs_atoms[430]
-        pb206 = bs_atoms[296]
-        pb207 = bs_atoms[297]
-        pb208 = bs_atoms[298]
-        bi209 = bs_atoms[299]
-        ra223 = bs_atoms[300]
-        ra224 = bs_atoms[301]
-        ra225 = bs_atoms[302]
-        ra226 = bs_atoms[303]
-        #ac224 = bs_atoms[439]
-        ac225 = bs_atoms[304]
-        ac226 = bs_atoms[305]
-        ac227 = bs_atoms[306]
-        #ac228 = bs_atoms[443]
-        u231 = bs_atoms[307]
-        u232 = bs_atoms[308]
-        u233 = bs_atoms[309]
-        u237 = bs_atoms[310]
-        u239 = bs_atoms[311]
-        #th226 = bs_atoms[449]
-        th227 = bs_atoms[312]
-        th228 = bs_atoms[313]
-        th229 = bs_atoms[314]
-        th230 = bs_atoms[315]
-        th231 = bs_atoms[316]
-        th232 = bs_atoms[317]
-        th233 = bs_atoms[318]
-        th234 = bs_atoms[319]
-        #pa228 = bs_atoms[458]
-        pa229 = bs_atoms[320]
-        pa230 = bs_atoms[321]
-        pa231 = bs_atoms[322]
-        pa232 = bs_atoms[323]
-        pa233 = bs_atoms[324]
-        #pa234 = bs_atoms[464]
-        #pa235 = bs_atoms[465]
-        pu236 = bs_atoms[325]
-        pu237 = bs_atoms[326]
-        pu238 = bs_atoms[327]
-        pu239 = bs_atoms[328]
-        pu240 = bs_atoms[329]
-        pu241 = bs_atoms[330]
-        pu242 = bs_atoms[331]
-        pu243 = bs_atoms[332]
-        pu244 = bs_atoms[333]
-        #pu245 = bs_atoms[474]
-        pu246 = bs_atoms[334]
-        #pu247 = bs_atoms[476]
-        #pu238 = bs_atoms[336]
-        np234 = bs_atoms[335]
-        np235 = bs_atoms[336]
-        np236 = bs_atoms[337]
-        np237 = bs_atoms[338]
-        np238 = bs_atoms[339]
-        np239 = bs_atoms[340]
-        #np240 = bs_atoms[484]
-        #np241 = bs_atoms[485]
-        cm240 = bs_atoms[341]
-        cm241 = bs_atoms[342]
-        cm242 = bs_atoms[343]
-        cm243 = bs_atoms[344]
-        cm244 = bs_atoms[345]
-        cm245 = bs_atoms[346]
-        cm246 = bs_atoms[347]
-        cm247 = bs_atoms[348]
-        cm248 = bs_atoms[349]
-        cm249 = bs_atoms[350]
-        cm250 = bs_atoms[351]
-        #cm251 = bs_atoms[497]
-        es251 = bs_atoms[352]
-        es252 = bs_atoms[353]
-        es253 = bs_atoms[354]
-        es254 = bs_atoms[355]
-        es255 = bs_atoms[356]
-        #am239 = bs_atoms[503]
-        am240 = bs_atoms[357]
-        am241 = bs_atoms[358]
-        am242 = bs_atoms[359]
-        am243 = bs_atoms[360]
-        am244 = bs_atoms[361]
-        #am245 = bs_atoms[509]
-        #am246 = bs_atoms[510]
-        #am247 = bs_atoms[511]
-        bk245 = bs_atoms[362]
-        bk246 = bs_atoms[363]
-        bk247 = bs_atoms[364]
-        bk248 = bs_atoms[365]
-        bk249 = bs_atoms[366]
-        bk250 = bs_atoms[367]
-        #bk251 = bs_atoms[518]
-        cf246 = bs_atoms[368]
-        cf248 = bs_atoms[369]
-        cf249 = bs_atoms[370]
-        cf250 = bs_atoms[371]
-        cf251 = bs_atoms[372]
-        cf252 = bs_atoms[373]
-        cf253 = bs_atoms[374]
-        cf254 = bs_atoms[375]
-        #cf255 = bs_atoms[527]
-
-
-        # Refuel Salt FLiBe SConstituents:
-
-        Li6_rf = refuel_atoms[0]
-        Li7_rf = refuel_atoms[1]
-        Be9_rf = refuel_atoms[2]
-        F19_rf = refuel_atoms[3]
-        U234_rf = refuel_atoms[4]
-        U235_rf = refuel_atoms[5]
-        U236_rf = refuel_atoms[6]
-        U238_rf = refuel_atoms[7]
-
-        # Totals:
-
-        Li6_tot = Li6_bs + Li6_rf
-        Li7_tot = Li7_bs + Li7_rf
-        Be9_tot = Be9_bs + Be9_rf
-        F19_tot = F19_bs + F19_rf
-        U234_tot = U234_bs + U234_rf
-        U235_tot = U235_bs + U235_rf
-        U236_tot = U236_bs + U236_rf
-        U238_tot = U238_bs + U238_rf
-
-        # ***** New Total Fuel Salt Mixed Atom Matrix *****
-
-        mixed_atom_totals = [Li6_tot, Li7_tot, Be9_tot, F19_tot, U234_tot, U235_tot, U236_tot, U238_tot, h1, h2, h3, he3,
-                             he4, be7, b10, b11, n14, n15, o16, o17, na23, mg24, mg25, mg26, al27, si28,
-                             si29, si30, p31, s32, s33, cl35, cl37, ar36, ar38, ar40,
-                             as74, as75, k39, k40, k41, ca40, ca42, ca43, ca44, ca46, ca48, sc45,
-                             ti46, ti47, ti48, ti49, ti50, cr50, cr52, cr53, cr54, mn55, fe54, fe56, fe57, fe58, co58, co59,
-                             ni58, ni59, ni60, ni61, ni62, ni64, cu63, cu65, ga69, ga71, ge70, ge72, ge73, ge74,
-                             ge76, se74, se76, se77, se78, se79, se80, se82, br79, br81, kr78,
-                             kr80, kr82, kr83, kr84, kr85, kr86, rb85, rb86, rb87, sr84, sr86, sr87, sr88, sr89,
-                             sr90, y89, y90, y91, zr90, zr91, zr92, zr93, zr94, zr95, zr96, nb93, nb94, nb95, mo92,
-                             mo94, mo95, mo96, mo97, mo98, mo99, mo100, tc99, ru96, ru98, ru99, ru100, ru101, ru102,
-                             ru103, ru104, ru105, ru106, rh103, rh105, pd102, pd104, pd105, pd106, pd107, pd108,
-                             pd110, ag107, ag109, ag111, cd106, cd108, cd110, cd111, cd112,
-                             cd113, cd114, cd116, in113, in115, sn112, sn113, sn114,
-                             sn115, sn116, sn117, sn118, sn119, sn120, sn122, sn123, sn124, sn125, sn126, sb121,
-                             sb123, sb124, sb125, sb126, te120, te122, te123, te124, te125, te126,
-                             te128, te130, te132, i127, i129, i130, i131, i135,
-                             xe123, xe124, xe126, xe128, xe129, xe130, xe131, xe132, xe133, xe134, xe135,
-                             xe136, ce136, ce138, ce139, ce140, ce141, ce142, ce143, ce144, pr141,
-                             pr142, pr143, ba130, ba132, ba133, ba134, ba135, ba136, ba137, ba138,
-                             ba140, la138, la139, la140, nd142, nd143, nd144, nd145, nd146, nd147, sm149, sm150,
-                             sm151, sm152, sm153, sm154, eu151, eu152, eu153, eu154, eu155, eu156, eu157, gd152, gd153,
-                             gd154, gd155, gd156, gd157, gd158, gd160, tb159, tb160, dy156, dy158,
-                             dy160, dy161, dy162, dy163, dy164, ho165, er162, er164, er166, er167, er168,
-                             er170, lu175, lu176, hf174, hf176, hf177, hf178, hf179, hf180, ta181, ta182,
-                             w182, w183, w184, w186, re185, re187, ir191, ir193,
-                             au197, hg196, hg198, hg199, hg200, hg201, hg202,
-                             hg204, pb204, pb206, pb207, pb208, bi209, ra223, ra224, ra225, ra226, ac225,
-                             ac226, ac227, u231, u232, u233, u237, u239, th227, th228, th229, th230, th231,
-                             th232, th233, th234, pa229, pa230, pa231, pa232, pa233, pu236, pu237,
-                             pu238, pu239, pu240, pu241, pu242, pu243, pu244, pu246, np234, np235, np236,
-                             np237, np238, np239, cm240, cm241, cm242, cm243, cm244, cm245, cm246, cm247,
-                             cm248, cm249, cm250, es251, es252, es253, es254, es255, am240, am241, am242,
-                             am243, am244, bk245, bk246, bk247, bk248, bk249, bk250, cf246,
-                             cf248, cf249, cf250, cf251, cf252, cf253, cf254] 
-
-        last_dep_step = iter - 1
-        last_dep_step_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter-1))
-        filename = "Salt_volume_dep_step_{}.out".format(last_dep_step)
-        if iter == 1:
-            bs_vol = self.V0     # Initial volume of salt in cm3
-        else:
-            os.chdir(last_dep_step_path)
-            bs_vol = genfromtxt("{}".format(filename), delimiter='')   # Total fuel salt volume for previous depletion step
-
-        tot_salt_vol = bs_vol + rvol
+    def write_scale_mats(self, rvols, iter):
+        'Returns the SCALE material composition blocks of the burned salt mixed with each refuel volume in rvols.'
+        enrich_percent = self.renrich*100    # Enrichment percent for refuel
+        header = "' Burned EIRENE fuel salt " + "and mixed refuel with enrichment of " + str(enrich_percent) + "%" + "\n"
+        mixed = self.mix_salts_batch(rvols, iter)
+        return [header + "".join("{:10s} 1 0  {:>5e} 923.15 end \n".format(iso, aden) for iso, aden in zip(FUEL_ISOTOPES, row))
+                for row in mixed]
 
-        # Finding atom densities of each from total salt volume (tot_salt_vol):
-        mixed_atom_den_cm3 = [i / tot_salt_vol for i in mixed_atom_totals]    # Mixed salt atom density in atoms/cm3 for each isotope
-        mixed_atom_den = [i * 1e-24 for i in mixed_atom_den_cm3]       # Mixed salt atom density vector in atoms/barn-cm for each isotope
-        return mixed_atom_den
-    
     def write_scale_mat(self, rvol, iter):
         'Returns a SCALE material composition block for the refuel salt mixed in with the burned salt.'
-        enrich_percent = self.renrich*100    # Enrichment percent for refuel
-        mixed_salt_aden = self.mix_salts(rvol, iter)
-        isotopes = ["li-6", "li-7", "be-9", "f-19", "u-234", "u-235", "u-236", "u-238", "h-1", "h-2", "h-3", "he-3", "he-4", "be-7",
-                    "b-10", "b-11", "n-14", "n-15", "o-16", "o-17", "na-23", "mg-24", "mg-25", "mg-26",
-                    "al-27", "si-28", "si-29", "si-30", "p-31", "s-32", "s-33", "cl-35", "cl-37",
-                    "ar-36", "ar-38", "ar-40", "as-74", "as-75", "k-39",
-                    "k-40", "k-41", "ca-40", "ca-42", "ca-43", "ca-44", "ca-46", "ca-48", "sc-45",
-                    "ti-46", "ti-47", "ti-48", "ti-49", "ti-50", "cr-50", "cr-52", "cr-53", "cr-54", "mn-55", "fe-54", "fe-56", "fe-57", "fe-58", 
-                    "co-58", "co-59", "ni-58", "ni-59", "ni-60", "ni-61", "ni-62", "ni-64", "cu-63", "cu-65", "ga-69", "ga-71", "ge-70", 
-                    "ge-72", "ge-73", "ge-74", "ge-76", "se-74", "se-76", "se-77", "se-78", "se-79", "se-80",
-                    "se-82", "br-79", "br-81", "kr-78", "kr-80", "kr-82", "kr-83", "kr-84", "kr-85", "kr-86", "rb-85",
-                    "rb-86", "rb-87", "sr-84", "sr-86", "sr-87", "sr-88", "sr-89", "sr-90", "y-89", "y-90", "y-91", "zr-90", "zr-91",
-                    "zr-92", "zr-93", "zr-94", "zr-95", "zr-96", "nb-93", "nb-94", "nb-95", "mo-92", "mo-94", "mo-95", "mo-96", "mo-97", "mo-98",
-                    "mo-99", "mo-100", "tc-99", "ru-96", "ru-98", "ru-99", "ru-100", "ru-101", "ru-102", "ru-103", "ru-104", "ru-105", "ru-106",
-                    "rh-103", "rh-105", "pd-102", "pd-104", "pd-105", "pd-106", "pd-107", "pd-108", "pd-110", "ag-107",
-                    "ag-109", "ag-111", "cd-106", "cd-108", "cd-110", "cd-111", "cd-112", "cd-113",
-                    "cd-114", "cd-116", "in-113", "in-115", "sn-112", "sn-113", "sn-114", "sn-115",
-                    "sn-116", "sn-117", "sn-118", "sn-119", "sn-120", "sn-122", "sn-123", "sn-124", "sn-125", "sn-126", "sb-121",
-                    "sb-123", "sb-124", "sb-125", "sb-126", "te-120", "te-122", "te-123", "te-124", "te-125", "te-126", "te-128",
-                    "te-130", "te-132", "i-127", "i-129", "i-130", "i-131", "i-135", "xe-123",
-                    "xe-124", "xe-126", "xe-128", "xe-129", "xe-130", "xe-131", "xe-132", "xe-133", "xe-134", "xe-135", "xe-136",
-                    "ce-136", "ce-138", "ce-139", "ce-140", "ce-141", "ce-142", "ce-143", "ce-144", "pr-141", "pr-142",
-                    "pr-143", "ba-130", "ba-132", "ba-133", "ba-134", "ba-135", "ba-136", "ba-137", "ba-138",
-                    "ba-140", "la-138", "la-139", "la-140", "nd-142", "nd-143", "nd-144", "nd-145", "nd-146", "nd-147", "sm-149", "sm-150", "sm-151",
-                    "sm-152", "sm-153", "sm-154", "eu-151", "eu-152", "eu-153", "eu-154", "eu-155", "eu-156", "eu-157", "gd-152", "gd-153", "gd-154",
-                    "gd-155", "gd-156", "gd-157", "gd-158", "gd-160", "tb-159", "tb-160", "dy-156", "dy-158", "dy-160",
-                    "dy-161", "dy-162", "dy-163", "dy-164", "ho-165", "er-162", "er-164", "er-166", "er-167", "er-168",
-                    "er-170", "lu-175", "lu-176", "hf-174", "hf-176", "hf-177", "hf-178", "hf-179", "hf-180", "ta-181", "ta-182", "w-182",
-                    "w-183", "w-184", "w-186", "re-185", "re-187", "ir-191", "ir-193", "au-197", "hg-196", "hg-198", "hg-199", "hg-200", "hg-201", "hg-202",
-                    "hg-204", "pb-204", "pb-206", "pb-207", "pb-208", "bi-209", "ra-223", "ra-224", "ra-225", "ra-226", "ac-225",
-                    "ac-226", "ac-227", "u-231", "u-232", "u-233", "u-237", "u-239", "th-227", "th-228", "th-229", "th-230", "th-231",
-                    "th-232", "th-233", "th-234", "pa-229", "pa-230", "pa-231", "pa-232", "pa-233", "pu-236", "pu-237",
-                    "pu-238", "pu-239", "pu-240", "pu-241", "pu-242", "pu-243", "pu-244", "pu-246", "np-234", "np-235", "np-236",
-                    "np-237", "np-238", "np-239", "cm-240", "cm-241", "cm-242", "cm-243", "cm-244", "cm-245", "cm-246", "cm-247",
-                    "cm-248", "cm-249", "cm-250", "es-251", "es-252", "es-253", "es-254", "es-255", "am-240", "am-241", "am-242",
-                    "am-243", "am-244", "bk-245", "bk-246", "bk-247", "bk-248", "bk-249", "bk-250", "cf-246",
-                    "cf-248", "cf-249", "cf-250", "cf-251", "cf-252", "cf-253", "cf-254"]
-        scale_mat = "' Burned EIRENE fuel salt " + "and mixed refuel with enrichment of " + str(enrich_percent) + "%" + "\n"
-        for i in range(376):
-            scale_mat += "{:10s} 1 0  {:>5e} 923.15 end \n".format(isotopes[i], mixed_salt_aden[i])
-        return scale_mat
+        return self.write_scale_mats([rvol], iter)[0]
 
-    
-        ##################################
-        #     Get New MTiHM Value
-        ##################################
-
-    def get_burned_salt_MTHM(self):
-        'Returns the masses in grams of MTHM actinides (excluding Actinium - SCALE does not consider Actinium as part of MTHM) in the burned salt.'
-        output = subprocess.run([f"{SCALE_bin_path}/obiwan", "view", "-format=csv", "-prec=10", "-units=gram", "-idform='{:Ee}{:AAA}{:m}'", self.f71_name], capture_output=True)
-        output = output.stdout.decode().split("\n")
-        densities = {} # densities[nuclide] = (density at position 0 of f71 file)
-        skip = ["case", "step", "time", "power", "flux", "volume"]
-        regexp = re.compile(r"(?P<elem>[a-zA-Z]+)(?P<num>\d+)(?P<meta>m)?")
-        for line in output:
-            data = line.split(',')
-            if data[0].strip() in skip:
-                continue
-            elif len(data) > 1:
-                dummy = re.search(regexp, data[0].strip())
-                elem = dummy.group("elem").lower() # convert to all lower cases
-                num = int(dummy.group("num")) # to cut off leading zeros
-                if dummy.group("meta"):
-                    nuclide = elem + "-" + str(num) + "m"   # for metastable isotopes
-                else:
-                    nuclide = elem + "-" + str(num)
-                densities[nuclide] = float(data[2])  # The [2] here is what causes the code to return only the densities at position 2 of the f71 file (position 0 is isotope names, 1 is BOC data)
-        # **** Sum all Actinide HM masses: ****
-        u231 = densities['u-231']
-        u232 = densities['u-232']
-        u233 = densities['u-233']
-        u234 = densities['u-234']
-        u235 = densities['u-235']
-        u235m = densities['u-235m']
-        u236 = densities['u-236']
-        u237 = densities['u-237']
-        u238 = densities['u-238']
-        u239 = densities['u-239']
-        th226 = densities['th-226']
-        th227 = densities['th-227']
-        th228 = densities['th-228']
-        th229 = densities['th-229']
-        th230 = densities['th-230']
-        th231 = densities['th-231']
-        th232 = densities['th-232']
-        th233 = densities['th-233']
-        th234 = densities['th-234']
-        pa228 = densities['pa-228']
-        pa229 = densities['pa-229']
-        pa230 = densities['pa-230']
-        pa231 = densities['pa-231']
-        pa232 = densities['pa-232']
-        pa233 = densities['pa-233']
-        pa234 = densities['pa-234']
-        pa234m = densities['pa-234m']
-        pa235 = densities['pa-235']
-        pu236 = densities['pu-236']
-        pu237 = densities['pu-237']
-        pu237m = densities['pu-237m']
-        pu238 = densities['pu-238']
-        pu239 = densities['pu-239']
-        pu240 = densities['pu-240']
-        pu241 = densities['pu-241']
-        pu242 = densities['pu-242']
-        pu243 = densities['pu-243']
-        pu244 = densities['pu-244']
-        pu245 = densities['pu-245']
-        pu246 = densities['pu-246']
-        pu247 = densities['pu-247']
-        np234 = densities['np-234']
-        np235 = densities['np-235']
-        np236 = densities['np-236']
-        np236m = densities['np-236m']
-        np237 = densities['np-237']
-        np238 = densities['np-238']
-        np239 = densities['np-239']
-        np240 = densities['np-240']
-        np240m = densities['np-240m']
-        np241 = densities['np-241']
-        am239 = densities['am-239']
-        am240 = densities['am-240']
-        am241 = densities['am-241']
-        am242 = densities['am-242']
-        am242m = densities['am-242m']
-        am243 = densities['am-243']
-        am244 = densities['am-244']
-        am244m = densities['am-244m']
-        am245 = densities['am-245']
-        am246 = densities['am-246']
-        am246m = densities['am-246m']
-        am247 = densities['am-247']
-        cm240 = densities['cm-240']
-        cm241 = densities['cm-241']
-        cm242 = densities['cm-242']
-        cm243 = densities['cm-243']
-        cm244 = densities['cm-244']
-        cm245 = densities['cm-245']
-        cm246 = densities['cm-246']
-        cm247 = densities['cm-247']
-        cm248 = densities['cm-248']
-        cm249 = densities['cm-249']
-        cm250 = densities['cm-250']
-        cm251 = densities['cm-251']
-        es251 = densities['es-251']
-        es252 = densities['es-252']
-        es253 = densities['es-253']
-        es254 = densities['es-254']
-        es254m = densities['es-254m']
-        es255 = densities['es-255']
-        bk245 = densities['bk-245']
-        bk246 = densities['bk-246']
-        bk247 = densities['bk-247']
-        bk248 = densities['bk-248']
-        bk249 = densities['bk-249']
-        bk250 = densities['bk-250']
-        bk251 = densities['bk-251']
-        cf246 = densities['cf-246']
-        cf248 = densities['cf-248']
-        cf249 = densities['cf-249']
-        cf250 = densities['cf-250']
-        cf251 = densities['cf-251']
-        cf252 = densities['cf-252']
-        cf253 = densities['cf-253']
-        cf254 = densities['cf-254']
-        cf255 = densities['cf-255']
-
-
-        HMs = (u231 + u232 + u233 + u234 + u235 + u235m + u236 + u237 + u238 + u239 + th226 + th227 + th228 + th229 + th230 + th231 + th232
-        + th233 + th234 + pa228 + pa229 + pa230 + pa231 + pa232 + pa233 + pa234 + pa234m + pa235 + pu236 + pu237 + pu237m + pu238 + pu239
-        + pu240 + pu241 + pu242 + pu243 + pu244 + pu245 + pu246 + pu247 + np234 + np235 + np236 + np236m + np237 + np238 + np239 + np240
-        + np240m + np241 + am239 + am240 + am241 + am242 + am242m + am243 + am244 + am244m + am245 + am246 + am246m + am247 + cm240 + cm241
-        + cm242 + cm243 + cm244 + cm245 + cm246 + cm247 + cm248 + cm249 + cm250 + cm251 + es251 + es252 + es253 + es254 + es254m + es255
-        + bk245 + bk246 + bk247 + bk248 + bk249 + bk250 + bk251 + cf246 + cf248 + cf249 + cf250 + cf251 + cf252 + cf253 + cf254 + cf255)   # Total heavy metal mass in grams
-
-        MTHMs = HMs*1e-6     # Convert HMs mass in grams to MTHMs
-
-        return MTHMs
-    
-    def get_refuel_MTHM(self, iter):
-        refuel_wf = self.get_refuel_wf()             # Isotopic weight fraction list for refuel salt
-        refuel_dens = self.get_refuel_den()          # Density of refuel salt in g/cm3
-        rvol = self.get_crit_refuel(iter)            # Critical refuel amount added in cm3
-        total_refuel_mass = rvol*refuel_dens         # Total mass of refuel salt in grams
-        # Calculate mass of each isotope in the refuel:
-        iso_mass = [i * total_refuel_mass for i in refuel_wf]
-        u234 = iso_mass[4]    # U-234 mass in grams
-        u235 = iso_mass[5]    # U-235 mass in grams
-        u236 = iso_mass[6]    # U-236 mass in grams
-        u238 = iso_mass[7]    # U-238 mass in grams
-        refuel_HM = (u234 + u235 + u236 + u238)      # Total refuel mass of HMs in grams
-        refuel_MTHM = refuel_HM*1e-6                 # Total refuel MTHM
-        return refuel_MTHM
-    
-    def write_MTiHM_file(self,iter):
-        'Finds the new MTiHM value for the current depletion step and saves it to a .out file to be read in the next depletion step.'
-        # ADD: Something that references self.vol_doubled variable and checks whether it is True or False. If True, it halves the MTiHM value.
-        main_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
-        if iter == 1:
-            os.chdir(self.BOC_f71_path)
-        else:
-            last_dep_step = iter - 1
-            last_dep_step_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(last_dep_step))
-            os.chdir(last_dep_step_path)
-        bs_MTHM = self.get_burned_salt_MTHM()
-        os.chdir(main_path)
-        refuel_MTHM = self.get_refuel_MTHM(iter)
-
-        if iter == 1:
-            true_bs_MTHM = bs_MTHM*self.init_MTiHM
-            os.chdir(main_path)
-            tot_MTiHM = true_bs_MTHM + refuel_MTHM
-            f = open("MTiHM_dep_step_{}.out".format(iter), 'w')
-            f.write("{}".format(tot_MTiHM))
-            f.close()
-        else:
-            os.chdir(last_dep_step_path)
-            filename = "MTiHM_dep_step_{}.out".format(iter-1)
-            data = genfromtxt("{}".format(filename), delimiter='')
-            true_bs_MTHM = bs_MTHM*data
-            tot_MTiHM = true_bs_MTHM + refuel_MTHM
-            if self.vol_doubled == True:
-                new_tot_MTiHM = tot_MTiHM/2
-            else:
-                new_tot_MTiHM = tot_MTiHM
-            os.chdir(main_path)
-            f = open("MTiHM_dep_step_{}.out".format(iter), 'w')
-            f.write("{}".format(new_tot_MTiHM))
-            f.close()
-
-    #################################
-    #        Add in Refuel
-    #################################
-            
-    def write_fuel_salt_volume(self, rvol, iter, main_path):
-        'Writes a .out file with the total fuel salt volume for the current depletion step.'
-        current_dep_step_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
-        last_dep_step_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter-1))
-        self.vol_doubled = False  # Check parameter; changed to True if the volume has doubled. Used for halving the MTiHM value if the volume has doubled (add line to MTiHM file writing function that does this.)
-        if iter == 1:
-            volume = self.V0
-            total_vol = volume + rvol    # Total fuel salt volume in cm^3
-            if total_vol >= 2*self.V0:
-                self.vol_doubled = True
-                new_vol = total_vol/2
-            else:
-                new_vol = total_vol
-            f = open("Salt_volume_dep_step_{}.out".format(iter), 'w')
-            f.write("{}".format(new_vol))
-            f.close()
-        else:
-            os.chdir(last_dep_step_path)
-            filename = "Salt_volume_dep_step_{}.out".format(iter-1)
-            volume = genfromtxt("{}".format(filename), delimiter='')
-            total_vol = volume + rvol
-            if total_vol >= 2*self.V0:
-                self.vol_doubled = True
-                new_vol = total_vol/2
-            else:
-                new_vol = total_vol
-              
-            os.chdir(current_dep_step_path)
-            os.chdir(main_path)
-            f = open("Salt_volume_dep_step_{}.out".format(iter), 'w')
-            f.write("{}".format(new_vol))
-            f.close()
-
-    def add_refuel_volume(self, iter):
-        'Returns h, the total fuel salt height in the gas plenum after refuel salt has been added.'
-        'The V0 variable is the initial volume from the BOC core.'
-        filename = "Salt_volume_dep_step_{}.out".format(iter)
-        volume = genfromtxt("{}".format(filename), delimiter='')   # Total fuel salt volume for current depletion step
-        total_refuel_vol = volume - self.V0
-        h = (total_refuel_vol)/(math.pi*200**2)
-        return h
+    def read_burned_densities(self, iter):
+        'Reads {nuclide: atoms/barn-cm} of the burned salt depletion step iter starts from out of the previous .f71 file.'
+        with self.timer.stage('obiwan', iter):
+            return scale_output.read_f71_densities(self.burned_f71(iter), self.end_position(iter-1))
     
     ########################################
     #      Write Parallel KENO Decks
@@ -1640,8 +872,7 @@ class Refuel_Deck(object):
 
     def write_qsub_file(self, iter):
         'Writes a single qsub file outside of the refuel directories.'
-        deck_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
-        os.chdir(deck_path)
+        deck_path = self.step_path(iter)
         shell_content = '''
 #!/bin/bash
 
@@ -1662,34 +893,281 @@ export DATA=/opt/scale6.3_data
 export HDF5_USE_FILE_LOCKING=FALSE
 
 scalerte -m -N 32 EIRENE.inp'''
-        s = open(self.qsub_name, 'w')
+        s = open(os.path.join(deck_path, self.qsub_name), 'w')
         s.write(shell_content)
         s.close()
 
-    def write_KENO_decks(self, iter):
-        'Creates a directory for each refuel amount and writes a KENO deck there.'
-        run_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))            # Make the depletion step directory
-        os.mkdir(run_path)
-#        os.chdir(run_path)
-        for x in range(len(self.rvols)):
-#            os.chdir('.')
-            #########################################################################################
-            #  Change directory to the location of the .f71 in order to read the .f71 file properly
-            #########################################################################################
-            if iter == 1:
-                os.chdir(self.BOC_f71_path)
-            else:
-                last_dep_step_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter-1))
-                os.chdir(last_dep_step_path)
-            scale_fuel = self.write_scale_mat(self.rvols[x],iter)
-            os.chdir(run_path)
-            path_KENO = f'refuel_{self.rvols[x]:5.01f}'
+    def read_TRITON_keff(self, iter):
+        'Returns the k-eff trajectory and its uncertainties from the TRITON output of a depletion step (BOC for step 0).'
+        return scale_output.read_triton_keff(os.path.join(self.step_path(iter), 'EIRENE.out'))
+
+    def refuel_needed(self, iter):
+        '''Decides from the previous TRITON step whether this step needs a refuel search at all.
+           When it does not, a critical refuel of 0 is saved and the KENO batch can be skipped.'''
+        if not self.skip_search or iter == 1:
+            return True
+        last_dep_step_path = self.step_path(iter-1)
+        m = self.get_run_state().get(iter-1, 'fit_slope')
+        b = self.get_run_state().get(iter-1, 'fit_intercept')
+        if m is None or not os.path.exists(last_dep_step_path + '/EIRENE.out'):
+            return True
+        keff, kerr = self.read_TRITON_keff(iter-1)
+        if len(keff) == 0:
+            return True
+        skip, pred = refuel_search.predict_no_refuel(keff, kerr[-1], m, self.skip_nsig, self.skip_margin, self.rvol_min)
+        if not skip:
+            return True
+        print("Predicted critical refuel for depletion step {} is {:.0f} cm3; skipping the KENO search.".format(iter, pred))
+        main_path = self.step_path(iter)
+        if not os.path.isdir(main_path):
+            os.mkdir(main_path)
+        self.crit_refuel = 0
+        self.get_run_state().set(iter, crit_refuel=self.crit_refuel, fit_slope=m, fit_intercept=b)   # Carry the last slope forward for the next step
+        return False
+
+    def get_surrogate(self):
+        'Returns the surrogate k-eff model, loading it from surrogate_file on first use.'
+        if self.surrogate is None:
+            self.surrogate = keff_surrogate.SurrogateKeff(FUEL_ISOTOPES, self.surrogate_file)
+        return self.surrogate
+
+    def train_surrogate(self, iter):
+        'Adds the finished KENO refuel search of this depletion step to the surrogate k-eff model.'
+        if not self.use_surrogate:
+            return
+        data = genfromtxt(os.path.join(self.step_path(iter), 'data-temp.out'), delimiter='')
+        mixed = self.mix_salts_batch(data[:,0], iter)
+        model = self.get_surrogate()
+        model.add_step(mixed, data[:,1], data[:,2])
+        model.save()
+
+    def keno_needed(self, iter):
+        '''Predicts the critical refuel with the surrogate k-eff model. When the confidence interval at the
+           predicted root is within surrogate_tol, saves it like get_crit_refuel does and returns False.'''
+        if not self.use_surrogate:
+            return True
+        model = self.get_surrogate()
+        if model.nsteps < self.surrogate_min_steps or self.surrogate_skips(iter) >= self.surrogate_max_skips:
+            self.get_run_state().set(iter, surrogate_skip=0)
+            return True
+        grid = np.linspace(0.0, max(self.rvols), self.surrogate_npts)
+        mixed = self.mix_salts_batch(grid, iter)
+        pred = model.predict_crit_refuel(grid, mixed)     # k-eff std. dev. includes the held-out model discrepancy
+        if pred is None or self.surrogate_nsig * pred[1] > self.surrogate_tol:
+            self.get_run_state().set(iter, surrogate_skip=0)
+            return True
+        crit, kstd, m = pred
+        print("Surrogate critical refuel for depletion step {}: {:.0f} cm3 (k-eff std. dev. {:.5f}); skipping KENO.".format(iter, crit, kstd))
+        main_path = self.step_path(iter)
+        if not os.path.isdir(main_path):
+            os.mkdir(main_path)
+        self.crit_refuel = crit if crit >= 1 else 0
+        self.get_run_state().set(iter, crit_refuel=self.crit_refuel, fit_slope=m, fit_intercept=1.0 - m*crit, surrogate_skip=1)
+        return False
+
+    def surrogate_skips(self, iter) -> int:
+        'Returns the number of depletion steps right before iter whose critical refuel came from the surrogate (saved in the run-state database).'
+        n = 0
+        while iter-1-n >= 1 and self.get_run_state().get(iter-1-n, 'surrogate_skip'):
+            n += 1
+        return n
+
+    def get_burned_salt_adens(self, iter):
+        'Returns the atom density vector (atoms/barn-cm) of the burned salt that depletion step iter starts from.'
+        return np.array(self.get_burned_salt_atoms(iter)) * 1e-24 / self.read_salt_volume(iter-1)
+
+    def can_speculate(self, iter) -> bool:
+        '''Checks whether the refuel search of depletion step iter can start before the previous step's .f71 exists.
+           Needs two earlier .f71 files to extrapolate from and the previous step's salt volume; the multi-fidelity,
+           skip and surrogate modes all decide from the previous step's output, so they do not speculate.'''
+        if not self.speculative or iter < 3 or self.multifidelity or self.skip_search or self.use_surrogate:
+            return False
+        if self.speculated(iter) or self.keno_jobs(iter)[0] > 0:
+            return False
+        return self.get_run_state().get(iter-1, 'salt_volume') is not None
+
+    def speculated(self, iter) -> bool:
+        'Checks whether depletion step iter has speculative KENO decks that were not validated yet.'
+        return os.path.exists(os.path.join(self.step_path(iter), self.speculative_file))
+
+    def extrapolate_burned_adens(self, iter):
+        'Linearly extrapolates the burned salt that depletion step iter starts from out of the .f71 files of the two steps before.'
+        a1 = self.get_burned_salt_adens(iter-1)
+        a2 = self.get_burned_salt_adens(iter-2)
+        return np.clip(2*a1 - a2, 0.0, None)
+
+    def write_speculative_decks(self, iter):
+        '''Writes and submits the refuel KENO decks of depletion step iter from the extrapolated burned salt,
+           while the previous step's TRITON run is still going. Returns the refuel volumes.'''
+        main_path = self.step_path(iter)
+        if not os.path.isdir(main_path):
+            os.mkdir(main_path)
+        adens = self.extrapolate_burned_adens(iter)
+        np.save(os.path.join(main_path, self.speculative_file), adens)   # Saved first: decks found after a crash still get validated
+        rvols = self.get_search_rvols(iter)
+        self.speculative_adens[iter] = adens
+        try:
+            self.write_KENO_decks(iter, rvols)
+        finally:
+            del self.speculative_adens[iter]
+        self.write_conv_data(iter)
+        self.add_shell_permission_cd(iter)
+        return rvols
+
+    def validate_speculation(self, iter) -> bool:
+        '''Compares the speculative burned salt of depletion step iter with the real .f71 file. The KENO decks are kept
+           if no major nuclide deviates by more than speculative_tol; otherwise their unfinished jobs are cancelled and
+           they are moved into rejected_* directories so the search reruns. Returns True if the speculative decks are kept.'''
+        main_path = self.step_path(iter)
+        spec_file = os.path.join(main_path, self.speculative_file)
+        spec = np.load(spec_file)
+        real = self.get_burned_salt_adens(iter)
+        major = real >= self.speculative_min_frac * real.sum()
+        dev = np.max(np.abs(spec[major] - real[major]) / real[major])
+        if dev <= self.speculative_tol:
+            print("Speculative burned salt of depletion step {} is within {:.2e} (max deviation {:.2e}); keeping its KENO runs.".format(iter, self.speculative_tol, dev))
+            os.replace(spec_file, os.path.join(main_path, 'accepted_' + self.speculative_file))
+            return True
+        print("Speculative burned salt of depletion step {} is off by {:.2e}; rerunning its KENO search.".format(iter, dev))
+        for d in os.listdir(main_path):
+            if d.startswith('refuel_'):
+                run_dir = os.path.join(main_path, d)
+                if not scale_output.run_finished(run_dir):     # Frees the cluster for the rerun
+                    self.get_keno_monitor().cancel_job(run_dir)
+                os.rename(run_dir, os.path.join(main_path, 'rejected_' + d[len('refuel_'):]))
+        os.replace(spec_file, os.path.join(main_path, 'rejected_' + self.speculative_file))
+        return False
+
+    def get_refine_rvols(self, iter):
+        'Returns the pair of screened refuel volumes that bracket k-eff = 1, to be rerun at full statistics.'
+        data = self.read_outfile(iter, 'screen-data.out')
+        return refuel_search.bracketing_pair(data[:,0], data[:,1])
+
+    def keno_jobs(self, iter, stage='refuel'):
+        '''Returns the number of KENO decks written in the {stage}_* directories of a depletion step and how many of them
+           have finished (or were cancelled).'''
+        run_path = self.step_path(iter)
+        submitted = 0
+        finished = 0
+        if not os.path.isdir(run_path):
+            return submitted, finished
+        for d in os.listdir(run_path):
+            if not d.startswith(stage + '_') or not os.path.exists(os.path.join(run_path, d, self.deck_name)):
+                continue
+            submitted += 1
+            if scale_output.run_finished(os.path.join(run_path, d)):   # Final k-eff summary is only printed at the end of the run
+                finished += 1
+            elif os.path.exists(os.path.join(run_path, d, keno_monitor.CANCELLED_FILE)):
+                finished += 1
+        return submitted, finished
+
+    def wait_for_keno(self, iter, stage='refuel'):
+        'Waits until every KENO deck written in the {stage}_* directories of a depletion step has finished.'
+        with self.timer.stage('idle', iter, cores=0):
+            while True:
+                self.monitor_keno_runs(iter, stage)      # Stops runs that already have enough statistics
+                submitted, done = self.keno_jobs(iter, stage)
+                if submitted > 0 and done == submitted:
+                    return
+                print("The atoms are still working; please stand by...")
+                time.sleep(self.poll_wait)
+
+    def monitor_keno_runs(self, iter, stage='refuel'):
+        'Stops the running KENO decks of a depletion step that already have the statistics they need (monitor_keno mode).'
+        if not self.monitor_keno:
+            return []
+        return self.get_keno_monitor().poll(self.step_path(iter), stage)
+
+    def get_keno_monitor(self):
+        'Returns the KenoMonitor of the driver, creating it on first use.'
+        if self.keno_monitor is None:
+            self.keno_monitor = keno_monitor.KenoMonitor(self.sig, self.monitor_sig_far, self.monitor_near_dk,
+                                                         self.monitor_nsig, self.monitor_min_gen)
+        return self.keno_monitor
+
+    @timed('archive')
+    def archive_step(self, iter):
+        '''Saves the end-of-step nuclide vector of a finished depletion step to the run-state database, then prunes
+           and compresses its raw outputs according to self.retention.'''
+        main_path = self.step_path(iter)
+        self.get_run_state().set_nuclides(iter, scale_output.read_f71_densities(os.path.join(main_path, self.f71_name), self.end_position(iter)))
+        compressed, pruned, saved = self.retention.apply(main_path)
+        self.get_run_state().set(iter, archived=1)
+        print("Archived depletion step {}: {} files compressed, {} deleted, {:.1f} MB freed.".format(iter, compressed, pruned, saved/1e6))
+
+    def archive_steps(self, upto, ready=None):
+        'Archives every finished depletion step up to upto that is not archived yet and, if given, for which ready(step) is True.'
+        if not self.archive_outputs:
+            return
+        for i in range(1, upto+1):
+            if self.get_run_state().get(i, 'archived') or (ready is not None and not ready(i)):
+                continue
+            self.archive_step(i)
+
+    def record_keno_jobs(self, iter, stage='refuel'):
+        'Records the queue wait and run time of the finished KENO runs in the {stage}_* directories of a depletion step.'
+        run_path = self.step_path(iter)
+        for d in os.listdir(run_path):
+            run_dir = os.path.join(run_path, d)
+            out_file = os.path.join(run_dir, 'EIRENE.out')
+            if not d.startswith(stage + '_') or not os.path.exists(out_file) or run_dir in self.recorded_jobs:
+                continue
+            result = scale_output.read_keno_run(run_dir)
+            if result is None:
+                continue
+            self.recorded_jobs.add(run_dir)
+            submitted = self.submit_time(run_dir)
+            self.timer.record_job('keno', iter, submitted, os.path.getmtime(out_file), result.runtime, self.ppn)
+
+    def record_triton_job(self, iter):
+        'Records the queue wait and run time of the finished TRITON run of a depletion step.'
+        main_path = self.step_path(iter)
+        f71_file = os.path.join(main_path, self.f71_name)
+        runtime = scale_output.read_runtime(os.path.join(main_path, 'EIRENE.out'))
+        self.timer.record_job('triton', iter, self.submit_time(main_path), os.path.getmtime(f71_file), runtime, self.ppn)
+
+    def submit_time(self, path):
+        'Returns when the job of a run directory was submitted (when its job ID, or else its deck, was written).'
+        for name in [keno_monitor.JOB_ID_FILE, self.deck_name]:
+            filename = os.path.join(path, name)
+            if os.path.exists(filename):
+                return os.path.getmtime(filename)
+        return time.time()
+
+    def keno_dir(self, iter, rvol, stage='refuel'):
+        'Returns the {stage}_* run directory of the KENO deck of refuel volume rvol in a depletion step.'
+        return os.path.join(self.step_path(iter), f'{stage}_{rvol:5.01f}')
+
+    def unwritten_rvols(self, iter, rvols, stage='refuel'):
+        'Returns the refuel volumes of rvols whose KENO deck is not written in a depletion step yet.'
+        return [v for v in rvols if not os.path.exists(os.path.join(self.keno_dir(iter, v, stage), self.deck_name))]
+
+    @timed('keno_decks')
+    def write_KENO_decks(self, iter, rvols=None, stage='refuel'):
+        '''Creates a directory for each refuel amount and writes a KENO deck there.
+           stage='screen' writes cheap low-statistics decks into screen_* directories instead.'''
+        run_path = self.step_path(iter)            # Make the depletion step directory
+        if rvols is None:
+            rvols = self.get_search_rvols(iter)
+        if stage == 'screen':
+            npg, gen = self.screen_npg, self.screen_gen
+        else:
+            npg, gen = self.npg, self.gen
+            self.search_rvols = rvols
+        if not os.path.isdir(run_path):       # Already there when the adaptive search falls back to the wide bracket
+            os.mkdir(run_path)
+        scale_fuels = None        # Material blocks of all refuel volumes, mixed at once when the first deck is needed
+        for x in range(len(rvols)):
+            path_KENO = self.keno_dir(iter, rvols[x], stage)
+            if os.path.exists(os.path.join(path_KENO, self.deck_name)):
+                continue        # Written and submitted before a restart; do not submit it twice
+            if scale_fuels is None:
+                scale_fuels = self.write_scale_mats(rvols, iter)
+            scale_fuel = scale_fuels[x]
             if not os.path.isdir(path_KENO):
                 os.mkdir(path_KENO)
-            os.chdir(path_KENO)
-            self.write_fuel_salt_volume(self.rvols[x],iter, path_KENO)
-            h = 440.5 + self.add_refuel_volume(iter)
-            keno_deck = f'''=csas6 parm=(   )
+            h = 440.5 + self.add_refuel_volume(self.new_salt_volume(rvols[x], iter))
+            keno_deck = self.get_template('keno', '''=csas6 parm=(   )
 EIRENE SCALE/CSAS model, UF4 mol% = {self.UF4molpct} and refuel enrichment {self.renrich}
 ce_v7.1
 
@@ -1721,7 +1199,7 @@ wtptHastelloy 2 8.89 5
 end comp
 
 read parameters
- npg={self.npg} nsk={self.nsk} gen={self.gen} sig={self.sig}
+ npg={npg} nsk={self.nsk} gen={gen} sig={self.sig}
  htm=no
  fdn=no
  pms=no
@@ -1989,11 +1467,9 @@ end array
 end data
 
 end
-        '''
+        ''')
 
-            fout = open(self.deck_name, "w")  # Dump deck into file
-            fout.write(keno_deck)
-            fout.close()
+            keno_deck.write(os.path.join(path_KENO, self.deck_name), scale_fuel=scale_fuel, h=h, npg=npg, gen=gen)  # Dump deck into file
 
             shell_content = '''
 #!/bin/bash
@@ -2014,130 +1490,101 @@ export DATA=/opt/scale6.3_data
 export HDF5_USE_FILE_LOCKING=FALSE
 
 scalerte -m -N 32 EIRENE.inp'''
-            q = open(self.qsub_name, 'w')
+            q = open(os.path.join(path_KENO, self.qsub_name), 'w')
             q.write(shell_content)
             q.close()
 
-            os.system('qsub runEIRENE-Scale.sh')  # Submit job
-
-            os.chdir('..')
+            self.submit(path_KENO)  # Submit job
 
     def add_shell_permission(self, iter):
         'Gives permission to execute the shell script.'
-        main_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
-        os.chdir(main_path)
-        os.system('chmod +x runEIRENE-Scale.sh')
-
-    def write_conv_data(self, iter):
-        'Writes the shell script convert-data.sh that extracts k-eff data from the finished KENO runs and prints them to file data-temp.out.'
-        shell_main_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
-        content = '''
+        self.add_exec_permission(os.path.join(self.step_path(iter), self.qsub_name))
+
+    def write_conv_data(self, iter, stage='refuel'):
+        '''Writes the shell script convert-data.sh that extracts k-eff data from the finished KENO runs and prints them to file data-temp.out.
+           stage='screen' collects the screening runs into screen-data.out instead. In multi-fidelity mode the final
+           data-temp.out holds both the screening and the full-statistics points, to be fitted with 1/kerr weights.
+           The driver itself reads the outputs with convert_data; the script is kept for rerunning the extraction by hand.'''
+        shell_main_path = self.step_path(iter)
+        if stage == 'screen':
+            outs, outfile = 'screen_*/EIRENE.out', 'screen-data.out'
+        elif self.multifidelity:
+            outs, outfile = 'refuel_*/EIRENE.out screen_*/EIRENE.out', 'data-temp.out'
+        else:
+            outs, outfile = 'refuel_*/EIRENE.out', 'data-temp.out'
+        content = f'''
 #!/bin/bash
 
-grep 'best estimate' refuel_*/EIRENE.out | sed -E -e s/^refuel.//g -e 's/.EIRENE.*eff//g'  -e 's/\+ or \-//g' -e 's/\*\*\*//g' -e 's/\s+/ /g' | sort -g  > data-temp.out'''
-        os.chdir(shell_main_path)
-        f = open("convert-data.sh", 'w')
+grep 'best estimate' {outs} | sed -E -e 's/^(refuel|screen).//g' -e 's/.EIRENE.*eff//g'  -e 's/\+ or \-//g' -e 's/\*\*\*//g' -e 's/\s+/ /g' | sort -g  > {outfile}'''
+        f = open(os.path.join(shell_main_path, "convert-data.sh"), 'w')
         f.write(content)
         f.close()
 
     def add_shell_permission_cd(self, iter):
       'Gives permissino to execute the convert-data.sh shell script.'
-      main_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
-      os.chdir(main_path)
-      os.system('chmod +x convert-data.sh')
-
-    def convert_data(self, iter):
-        'Submits the convert-data.sh shell script to extract KENO k-eff data and print to data-temp.out file.'
-        os.system('/home/cmoss9/EIRENE11/SD7pct/dep_step_{}/./convert-data.sh'.format(iter))
+      self.add_exec_permission(os.path.join(self.step_path(iter), 'convert-data.sh'))
+
+    @timed('keno_parse')
+    def convert_data(self, iter, stage='refuel'):
+        '''Extracts the k-eff data of the finished KENO runs of a depletion step to the data-temp.out file, the same
+           table convert-data.sh writes. stage='screen' collects the screening runs into screen-data.out instead.'''
+        main_path = self.step_path(iter)
+        if stage == 'screen':
+            prefixes, outfile = ('screen',), 'screen-data.out'
+        elif self.multifidelity:
+            prefixes, outfile = ('refuel', 'screen'), 'data-temp.out'
+        else:
+            prefixes, outfile = ('refuel',), 'data-temp.out'
+        results = scale_output.read_keno_tree(main_path, prefixes)
+        scale_output.write_keno_table(results, os.path.join(main_path, outfile))
     
     def run_SCALE_KENO(self, iter):
         'Runs SCALE from laptop terminal.'
-        main_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
-        os.chdir(main_path)
-        for x in range(len(self.rvols)):
-            deckpath = f'refuel_{self.rvols[x]:5.01f}'
-            os.chdir(deckpath)
-            os.system('/home/cmoss9/EIRENE11/SD7pct/dep_step_{}/./runEIRENE-Scale.sh'.format(iter))
-            os.chdir('..')
-
-    def read_outfile(self, iter):
+        main_path = self.step_path(iter)
+        for x in range(len(self.search_rvols)):
+            deckpath = os.path.join(main_path, f'refuel_{self.search_rvols[x]:5.01f}')
+            subprocess.run([os.path.join(main_path, self.qsub_name)], cwd=deckpath)
+
+    def read_outfile(self, iter, filename="data-temp.out"):
         'Checks whether the run is finished and reads k-eff data.'
-        main_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
+        main_path = self.step_path(iter)
         check = False       # Initialize check
         while check == False:
-          if os.path.exists(main_path+'/data-temp.out'):
+          if os.path.exists(main_path+'/'+filename):
             check = True
             break
           else:                 
               check = False
               print("The atoms are still working; please stand by...")
-              time.sleep(10.0)
-        filename = "data-temp.out"
-        data = genfromtxt("{}".format(filename), delimiter='')
+              time.sleep(self.poll_wait)
+        data = genfromtxt(main_path+'/'+filename, delimiter='')
         return data
     
     def get_crit_refuel(self, iter):
         'Fits the k-eff data and returns the critical refuel amount.'
-        main_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
-        os.chdir(main_path)
         data = self.read_outfile(iter)
-        refuel = data[:,0]     # Refuel amounts in cm3
-        keff = data[:,1]       # k-eff data
-        kerr = data[:,2]       # k-eff error
-        # Fit the data:
-        m, b = np.polyfit(refuel, keff, 1)
-        self.crit_refuel = (1 - b)/m     # Refuel amount for which k-eff = 1
-        
-        ##### Check if critical refuel amount is negative #####
-
-        if self.crit_refuel < 1:
-            self.crit_refuel = 0
-        else:
-            pass        
+        return self.fit_crit_refuel(iter, data, weighted=self.multifidelity)   # Weighted by the k-eff errors of the mixed-statistics runs
 
-        f = open("crit_refuel_{}.out".format(iter), 'w')
-        f.write("{}".format(self.crit_refuel))
-        f.close()
-        
-        return self.crit_refuel
-    
         ##################################################################################################
         #   Write New TRITON Deck With Crit Refuel (May want to put this in a different module script)
         ##################################################################################################
     
-    def write_new_power_dens(self,iter):
-        'Uses the normalization factor from the previous depletion step to convert the normalized MTHM mass to true MTiHM mass, then calculates the new power density.'
-        path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
-        os.chdir(path)
-        filename = "MTiHM_dep_step_{}.out".format(iter)
-        MTiHM = genfromtxt("{}".format(filename), delimiter='')   # New MTiHM value calculated and written to .out file for current depletion step
-        new_power_dens = self.power/MTiHM
-        return new_power_dens
-    
+    @timed('triton_deck')
     def write_new_TRITON_deck(self, iter):
         'Writes a new TRITON deck for the current depletion step AND a KENO deck for the end-of-cycle depletion.'
-        rvol = self.get_crit_refuel(iter)
-        if iter == 1:
-            os.chdir(self.BOC_f71_path)
-        else:
-            last_dep_step = iter - 1
-            last_dep_step_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(last_dep_step))
-            os.chdir(last_dep_step_path)
-    
+        rvol = self.read_crit_refuel(iter)
         new_scale_fuel = self.write_scale_mat(rvol, iter)
-        main_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
-        os.chdir(main_path)
-        self.write_fuel_salt_volume(rvol,iter, main_path)
-        h = 440.5 + self.add_refuel_volume(iter)
-        # Save Height to .out File
-        f = open("TRITON_height_step_{}.out".format(iter), 'w')
-        f.write("{}".format(h))
-        f.close()
+        main_path = self.step_path(iter)
+        fed = self.plan_feed_volume(iter)       # Refuel fed through the timetable during the step (feed_mode 'continuous')
+        salt_volume = self.write_fuel_salt_volume(rvol, iter, fed)
+        h = 440.5 + self.add_refuel_volume(salt_volume)
+        feed_mat, feed_mix, feed_flow = self.write_feed(iter, fed, salt_volume)
+        self.get_run_state().set(iter, triton_height=h)     # Read back by the EOC KENO pass
 
         self.write_MTiHM_file(iter)
         
         new_power_dens = self.write_new_power_dens(iter)    # New power density in MW/MTiHM
-        new_triton_deck = f'''=t6-depl parm=(addnux=4)
+        new_triton_deck = self.get_template('triton', '''=t6-depl parm=(addnux=4)
 EIRENE SCALE/TRITON model, UF4 mol% = {self.UF4molpct}
 ce_v7.1
 
@@ -2171,16 +1618,16 @@ wtptHastelloy 2 8.89 5
 'Dummy composition for noble metals
   xe-135     12    0    1.00000E-20    300    end
   kr-85      12    0    1.00000E-20    300    end
-end comp
+{feed_mat}end comp
 
 ' Mixtures to deplete
 read depletion
-  1 decayonly 11 12 end
+  1 decayonly 11 12{feed_mix} end
 end depletion
 
 ' Burnup values. Power in MW/MTiHM
 read burndata
-   power={new_power_dens} burn=7 nlib=1 end
+   power={new_power_dens} burn={step_days} nlib={nlib} end
 end burndata
 
 read timetable
@@ -2214,7 +1661,7 @@ read timetable
     time       0.0 end
     multiplier 1.0 end
   end flow
-end timetable
+{feed_flow}end timetable
 
 read model
 
@@ -2484,29 +1931,25 @@ end data
 end model
 
 end
-'''
+''')
           
-        main_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
+        main_path = self.step_path(iter)
         try:
-#            os.makedirs(self.deck_path, exist_ok=True)
-            os.chdir(main_path)
-            fh = open(self.deck_name, 'w')
-            fh.write(new_triton_deck)
-            fh.close()
+            new_triton_deck.write(os.path.join(main_path, self.deck_name), new_scale_fuel=new_scale_fuel, h=h, new_power_dens=new_power_dens,
+                              step_days=self.get_step_days(iter), nlib=self.choose_nlib(iter), feed_mat=feed_mat, feed_mix=feed_mix, feed_flow=feed_flow)
         except IOError as e:
             print("[ERROR] Unable to write to file: ")
             print(e)
 
     def write_run_TRITON(self, iter):
         'Writes the shell script runEIRENE-SCALE.sh to run new KENO deck.'
-        shell_main_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
+        shell_main_path = self.step_path(iter)
         shell_content = '''
 #!/bin/bash
 
 scalerte EIRENE.inp'''
         try:                # Write the deck
-            os.chdir(shell_main_path)
-            f = open("runEIRENE-SCALE.sh", 'w')
+            f = open(os.path.join(shell_main_path, "runEIRENE-SCALE.sh"), 'w')
             f.write(shell_content)
             f.close()
         except IOError as e:
@@ -2515,15 +1958,11 @@ scalerte EIRENE.inp'''
 
     def add_shell_permission_run_TRITON(self, iter):
       'Gives permission to execute the convert-data.sh shell script.'
-      shell_main_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))
-      os.chdir(shell_main_path)
-      os.system('chmod +x runEIRENE-SCALE.sh')
+      self.add_exec_permission(os.path.join(self.step_path(iter), 'runEIRENE-SCALE.sh'))
 
     def run_SCALE(self, iter):
       'Submits SCALE job.'
-      run_path = os.path.expanduser('~/EIRENE11/SD7pct/dep_step_{}'.format(iter))            # Make the depletion step directory
-      os.chdir(run_path)
-      os.system('qsub runEIRENE-Scale.sh')
+      self.submit(self.step_path(iter))
 
 ###################################################################################################################################
 
@@ -0,0 +1,116 @@
+# ******************************************************************************************************
+#
+#                       Sourdough Campaign Run-State Database
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  One SQLite (WAL mode) file per campaign with a typed row per depletion step. It replaces the
+#  Salt_volume_dep_step_N.out, MTiHM_dep_step_N.out, crit_refuel_N.out and TRITON_height_step_N.out
+#  files that used to carry scalar state between steps. Campaigns run before the database existed
+#  are still readable: get() falls back to those files when a step has no row.
+#
+# *******************************************************************************************************
+
+import os
+import sqlite3
+import numpy as np
+from numpy import genfromtxt
+
+# Per-step columns and their SQLite types
+COLUMNS = {'salt_volume': 'REAL',        # Total fuel salt volume after refuel (and halving) in cm^3
+           'vol_doubled': 'INTEGER',     # 1 if the salt volume doubled and was halved this step
+           'mtihm': 'REAL',              # True MTiHM after refuel
+           'crit_refuel': 'REAL',        # Critical refuel volume in cm^3
+           'fit_slope': 'REAL',          # dk/dV of the critical refuel fit
+           'fit_intercept': 'REAL',      # k-eff at zero refuel from the critical refuel fit
+           'triton_height': 'REAL',      # Fuel salt height in the plenum used in the TRITON deck
+           'step_days': 'REAL',          # Length of the depletion step in days (step_control.py)
+           'nlib': 'INTEGER',            # TRITON cross section libraries of the step (one per lib_days of burn or less)
+           'feed_rate': 'REAL',          # Continuous refuel feed rate in cm^3/day
+           'feed_volume': 'REAL',        # Refuel volume fed continuously during the step in cm^3
+           'surrogate_skip': 'INTEGER',  # 1 if the critical refuel came from the surrogate k-eff model instead of KENO
+           'removed_volume': 'REAL',     # Fuel salt volume taken out when the salt was halved in cm^3
+           'hm_burned': 'REAL',          # True MTHM of the burned salt the step starts from (hm_ledger.py)
+           'power_dens': 'REAL',         # TRITON power density in MW/MTiHM
+           'archived': 'INTEGER'}        # 1 once the raw outputs of the step were compressed by retention.py
+
+# Per-step files the columns used to live in (EIRENE uses .out, Th-EIRENE .txt for some of them)
+LEGACY_FILES = {'salt_volume': ['Salt_volume_dep_step_{}.out'],
+                'mtihm': ['MTiHM_dep_step_{}.out', 'MTiHM_dep_step_{}.txt'],
+                'crit_refuel': ['crit_refuel_{}.out'],
+                'triton_height': ['TRITON_height_step_{}.out', 'TRITON_height_step_{}.txt']}
+
+
+class RunStateDB(object):
+    'SQLite store of the scalar per-step state of a Sourdough campaign.'
+    def __init__(self, db_file: str):
+        self.db_file:str = db_file
+        self.conn = sqlite3.connect(db_file, timeout=60.0)
+        self.conn.execute('PRAGMA journal_mode=WAL')       # Readers (EOC pass, exporters) never block the driver
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        cols = ', '.join('{} {}'.format(k, v) for k, v in COLUMNS.items())
+        self.conn.execute('CREATE TABLE IF NOT EXISTS steps (step INTEGER PRIMARY KEY, {})'.format(cols))
+        have = [row[1] for row in self.conn.execute('PRAGMA table_info(steps)')]
+        for k, v in COLUMNS.items():
+            if k not in have:          # Database of a campaign started before the column existed
+                self.conn.execute('ALTER TABLE steps ADD COLUMN {} {}'.format(k, v))
+        # End-of-step burned salt nuclide vector, so archived .f71 files do not have to be read again
+        self.conn.execute('CREATE TABLE IF NOT EXISTS nuclides (step INTEGER, nuclide TEXT, adens REAL, PRIMARY KEY (step, nuclide))')
+        self.conn.commit()
+
+    def set(self, step, **values):
+        'Sets one or more columns of a depletion step row, creating the row if needed.'
+        for k in values:
+            if k not in COLUMNS:
+                raise ValueError("Unknown run-state column: " + k)
+        keys = ', '.join(values)
+        marks = ', '.join('?' for k in values)
+        update = ', '.join('{0}=excluded.{0}'.format(k) for k in values)
+        self.conn.execute('INSERT INTO steps (step, {}) VALUES (?, {}) ON CONFLICT(step) DO UPDATE SET {}'.format(keys, marks, update),
+                          [int(step)] + [float(v) for v in values.values()])
+        self.conn.commit()
+
+    def get(self, step, column: str, step_dir: str = None):
+        '''Returns one column of a depletion step. If the database has no value and step_dir is given,
+           reads it from the per-step file older campaigns wrote there. Returns None if neither exists.'''
+        row = self.conn.execute('SELECT {} FROM steps WHERE step=?'.format(column), (int(step),)).fetchone()
+        if row is not None and row[0] is not None:
+            return row[0]
+        if step_dir is not None:
+            for name in LEGACY_FILES.get(column, []):
+                filename = os.path.join(step_dir, name.format(step))
+                if os.path.exists(filename):
+                    return float(genfromtxt(filename, delimiter=''))
+        return None
+
+    def table(self, *columns):
+        'Returns an array with the step number and the requested columns for every step, ordered by step.'
+        rows = self.conn.execute('SELECT step, {} FROM steps ORDER BY step'.format(', '.join(columns))).fetchall()
+        return np.array(rows, dtype=float)
+
+    def set_nuclides(self, step, densities):
+        'Saves the end-of-step atom densities {nuclide: atoms/barn-cm} of a depletion step.'
+        self.conn.executemany('INSERT OR REPLACE INTO nuclides (step, nuclide, adens) VALUES (?, ?, ?)',
+                              [(int(step), k, float(v)) for k, v in densities.items()])
+        self.conn.commit()
+
+    def get_nuclides(self, step):
+        'Returns the end-of-step atom densities {nuclide: atoms/barn-cm} saved for a depletion step, or None.'
+        rows = self.conn.execute('SELECT nuclide, adens FROM nuclides WHERE step=?', (int(step),)).fetchall()
+        return dict(rows) if rows else None
+
+    def nuclide_matrix(self):
+        '''Returns (steps, nuclides, atom density matrix with a row per step) of every saved end-of-step nuclide vector.
+           Nuclides missing from a step are zero.'''
+        rows = self.conn.execute('SELECT step, nuclide, adens FROM nuclides ORDER BY step').fetchall()
+        steps = sorted({r[0] for r in rows})
+        nuclides = list(dict.fromkeys(r[1] for r in rows))
+        srow = {s: i for i, s in enumerate(steps)}
+        ncol = {n: i for i, n in enumerate(nuclides)}
+        adens = np.zeros((len(steps), len(nuclides)))
+        for step, nuclide, value in rows:
+            adens[srow[step], ncol[nuclide]] = value
+        return steps, nuclides, adens
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,184 @@
+# ******************************************************************************************************
+#
+#                       SCALE KENO/TRITON Output Parser
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  Reads k-eff results straight out of SCALE .out files, replacing the grep/sed/sort pipeline of
+#  convert-data.sh and the awk of plot-bu.sh. Files are memory mapped, so a multi-MB output is never
+#  read into Python as a whole: a KENO output is searched backwards for its final k-eff summary, and a
+#  TRITON output is scanned once for the k-eff of each transport calculation.
+#
+# *******************************************************************************************************
+
+import os
+import re
+import mmap
+import subprocess
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import retention
+
+SCALE_bin_path: str = os.getenv('SCALE_BIN', '/opt/scale6.3.1/bin/')
+
+KEFF_LINE = b'best estimate system k-eff'    # Final k-eff summary line, only printed at the end of a KENO run
+KEFF_RE = re.compile(rb'best estimate system k-eff\s+([-+.0-9Ee]+)\s+\+ or -\s+([-+.0-9Ee]+)')
+GENERATIONS_RE = re.compile(rb'generations\s+run\D{0,60}?(\d+)')
+RUNTIME_RE = re.compile(rb'finished\.\s+used\s+([-+.0-9Ee]+)\s+seconds')    # One line per SCALE module
+# Row of the KENO generation table: generation, k-eff, elapsed time, average k-eff, deviation
+GENERATION_RE = re.compile(rb'^\s*(\d+)\s+([.0-9]+)\s+([.0-9]+)\s+([.0-9]+)\s+([.0-9]+)\s*$', re.M)
+ESTIMATE_FILE = 'keno-estimate.out'      # Running k-eff of a run stopped early by keno_monitor.py (k sigma generations reason)
+
+# Result of one finished KENO run: k-eff, its standard deviation, generations run and SCALE run time in s
+KenoResult = namedtuple('KenoResult', ['k', 'sigma', 'generations', 'runtime'])
+
+
+@contextmanager
+def _map(out_file):
+    '''Yields a read-only memory map of a file (None if it is missing or empty).
+       A file archived by retention.py is decompressed into memory instead.'''
+    if not os.path.exists(out_file) and retention.archived_path(out_file) is not None:
+        yield retention.read_bytes(out_file)
+        return
+    try:
+        with open(out_file, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):      # Missing file, or an empty one that cannot be mapped yet
+        yield None
+        return
+    with mm:
+        yield mm
+
+
+def keno_finished(out_file) -> bool:
+    'Checks whether a KENO output file has its final k-eff summary.'
+    with _map(out_file) as mm:
+        return mm is not None and mm.rfind(KEFF_LINE) >= 0
+
+
+def read_keno(out_file):
+    '''Returns the KenoResult of a KENO output file, or None if the run has not finished.
+       generations and runtime are None if the output does not report them.'''
+    with _map(out_file) as mm:
+        if mm is None:
+            return None
+        pos = mm.rfind(KEFF_LINE)
+        if pos < 0:
+            return None
+        eol = mm.find(b'\n', pos)
+        m = KEFF_RE.search(mm[pos:eol if eol >= 0 else len(mm)])
+        if m is None:
+            return None
+        tail = mm[pos:]                 # Everything else of interest is printed after the summary
+        gens = GENERATIONS_RE.findall(mm[max(pos - 20000, 0):pos]) or GENERATIONS_RE.findall(tail)
+        times = RUNTIME_RE.findall(tail)
+        return KenoResult(float(m.group(1)), float(m.group(2)),
+                          int(gens[-1]) if gens else None,
+                          sum(float(t) for t in times) if times else None)
+
+
+def read_estimate(run_dir):
+    'Returns the KenoResult saved for a KENO run that was stopped early, or None.'
+    filename = os.path.join(run_dir, ESTIMATE_FILE)
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'r') as f:
+        data = f.read().split()
+    return KenoResult(float(data[0]), float(data[1]), int(data[2]), None)
+
+
+def read_keno_run(run_dir, out_name='EIRENE.out'):
+    'Returns the KenoResult of a KENO run directory: its final summary, or the estimate saved when it was stopped early.'
+    return read_keno(os.path.join(run_dir, out_name)) or read_estimate(run_dir)
+
+
+def end_position(nlib: int = 1, mixture: int = 1) -> int:
+    '''Returns the .f71 position of the end-of-step composition of the mixture-th depleted mixture of a TRITON step
+       with nlib libraries. Each depleted mixture takes nlib + 1 positions: its start and the end of every library.'''
+    return mixture*(int(nlib) + 1)
+
+
+def read_f71_densities(f71_file, position: int = 2):
+    '''Returns {nuclide: atom density in atoms/barn-cm} at one position of a .f71 file (2 is the end of a one-library
+       TRITON step, see end_position), read with obiwan like the drivers do. Works on .f71 files archived by retention.py.'''
+    with retention.local_copy(f71_file) as f71:
+        output = subprocess.run([f"{SCALE_bin_path}/obiwan", "view", "-format=csv", "-prec=10", "-units=atom", "-idform='{:Ee}{:AAA}{:m}'", f71], capture_output=True)
+    densities = {}
+    skip = ["case", "step", "time", "power", "flux", "volume"]
+    regexp = re.compile(r"(?P<elem>[a-zA-Z]+)(?P<num>\d+)(?P<meta>m)?")
+    for line in output.stdout.decode().split("\n"):
+        data = line.split(',')
+        if data[0].strip() in skip or len(data) <= position:
+            continue
+        dummy = re.search(regexp, data[0].strip())
+        nuclide = dummy.group("elem").lower() + "-" + str(int(dummy.group("num")))
+        if dummy.group("meta"):
+            nuclide += "m"        # Metastable isotopes
+        densities[nuclide] = float(data[position])
+    return densities
+
+
+def run_finished(run_dir, out_name='EIRENE.out') -> bool:
+    'Checks whether a KENO run directory has a final k-eff summary or an early-stop estimate.'
+    return keno_finished(os.path.join(run_dir, out_name)) or os.path.exists(os.path.join(run_dir, ESTIMATE_FILE))
+
+
+def read_generations(data: bytes):
+    'Returns (generation, average k-eff, deviation) of the last KENO generation table row in data, or None.'
+    rows = GENERATION_RE.findall(data)
+    if not rows:
+        return None
+    gen, k, time, avg_k, dev = rows[-1]
+    return int(gen), float(avg_k), float(dev)
+
+
+def read_runtime(out_file):
+    'Returns the run time in seconds SCALE reports for all modules of an output file, or None if it reports none.'
+    with _map(out_file) as mm:
+        if mm is None:
+            return None
+        times = RUNTIME_RE.findall(mm)
+    return sum(float(t) for t in times) if times else None
+
+
+def read_triton_keff(out_file):
+    'Returns arrays of the k-eff and its standard deviation of every transport calculation in a TRITON output file.'
+    keff = []
+    kerr = []
+    with _map(out_file) as mm:
+        if mm is None:
+            return np.array(keff), np.array(kerr)
+        for m in KEFF_RE.finditer(mm):
+            keff.append(float(m.group(1)))
+            kerr.append(float(m.group(2)))
+    return np.array(keff), np.array(kerr)
+
+
+def read_keno_tree(path, prefixes=('refuel',), out_name='EIRENE.out', nproc=8):
+    '''Reads the KENO runs in the {prefix}_{value} directories under path in parallel.
+       Returns {(prefix, value): KenoResult} for the runs that have finished (or were stopped early) so far.'''
+    runs = {}
+    for d in os.listdir(path):
+        prefix, _, value = d.partition('_')
+        if prefix in prefixes and value:
+            try:
+                runs[(prefix, float(value))] = os.path.join(path, d)
+            except ValueError:
+                continue
+    with ThreadPoolExecutor(max_workers=nproc) as pool:
+        results = dict(zip(runs, pool.map(lambda run_dir: read_keno_run(run_dir, out_name), runs.values())))
+    return {key: r for key, r in results.items() if r is not None}
+
+
+def keno_table(results):
+    'Returns the (value, k-eff, sigma) rows of read_keno_tree results, sorted by value like data-temp.out.'
+    rows = sorted([v, r.k, r.sigma] for (prefix, v), r in results.items())
+    return np.array(rows, dtype=float).reshape(-1, 3)
+
+
+def write_keno_table(results, filename):
+    'Writes read_keno_tree results in the data-temp.out format (value k-eff sigma per line).'
+    with open(filename, 'w') as f:
+        f.write(''.join('{} {} {}\n'.format(*row) for row in keno_table(results)))
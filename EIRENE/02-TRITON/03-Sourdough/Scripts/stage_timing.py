@@ -0,0 +1,144 @@
+# ******************************************************************************************************
+#
+#                       Sourdough Stage Timing and Resource Instrumentation
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  The drivers append one JSON line per stage of a depletion step to stage_timing.jsonl in the
+#  campaign directory: {stage, step, campaign, start, end, cores, peak_rss_mb}. Driver-side stages
+#  (deck writing, obiwan, output parsing, idle sleeps) are timed as they run; the queue wait and run
+#  time of the KENO/TRITON jobs are reconstructed from the job files once the jobs have finished.
+#
+#  Run this script on one or more stage_timing.jsonl files for the critical path and cluster
+#  utilisation of each campaign:  python stage_timing.py ~/EIRENE13/*/stage_timing.jsonl
+#
+# *******************************************************************************************************
+
+import sys
+import json
+import time
+import resource
+import functools
+from contextlib import contextmanager
+
+def peak_rss_mb() -> float:
+    'Returns the peak resident memory in MB of the driver and of the child processes it has waited for (obiwan, scripts).'
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(self_kb, child_kb) / 1024.0
+
+
+class StageTimer(object):
+    'Appends timing events of one Sourdough campaign to a JSON-lines file.'
+    def __init__(self, log_file: str, campaign: str):
+        self.log_file:str = log_file       # stage_timing.jsonl of the campaign
+        self.campaign:str = campaign       # Campaign name written into every event
+
+    def record(self, stage: str, step, start: float, end: float, cores: int = 1, driver: bool = True):
+        'Appends one event; start and end are UNIX times in seconds. Peak RSS is only known for driver-side stages.'
+        event = {'stage': stage, 'step': int(step), 'campaign': self.campaign, 'start': start, 'end': end,
+                 'cores': cores, 'peak_rss_mb': peak_rss_mb() if driver else None}
+        with open(self.log_file, 'a') as f:
+            f.write(json.dumps(event) + '\n')
+
+    @contextmanager
+    def stage(self, stage: str, step, cores: int = 1):
+        'Times the block inside the with statement as one event.'
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(stage, step, start, time.time(), cores)
+
+    def sleep(self, seconds: float, step):
+        'Sleeps and records the time as an idle event.'
+        with self.stage('idle', step, cores=0):
+            time.sleep(seconds)
+
+    def record_job(self, stage: str, step, submitted: float, end: float, runtime, cores: int):
+        '''Records a finished cluster job as its queue wait plus its run time. If SCALE did not report the run time,
+           the whole span from submission to end is recorded as the job stage.'''
+        start = end - runtime if runtime is not None else submitted
+        start = min(max(start, submitted), end)
+        if start > submitted:
+            self.record('queue_wait', step, submitted, start, cores, driver=False)
+        self.record(stage, step, start, end, cores, driver=False)
+
+
+def timed(stage: str):
+    'Decorator timing a driver method called as method(self, iter, ...) with the self.timer StageTimer.'
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, iter, *args, **kwargs):
+            with self.timer.stage(stage, iter):
+                return method(self, iter, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+#####################################################
+#         Critical Path and Utilisation Summary
+#####################################################
+
+def read_events(log_files):
+    'Reads the events of one or more stage_timing.jsonl files, grouped by campaign.'
+    campaigns = {}
+    for log_file in log_files:
+        with open(log_file, 'r') as f:
+            for line in f:
+                if line.strip():
+                    event = json.loads(line)
+                    campaigns.setdefault(event['campaign'], []).append(event)
+    return campaigns
+
+
+def critical_path(events):
+    '''Splits the wall time of a campaign into the stage it was waiting on. At every moment the innermost running
+       event (the one that started last) is charged, an idle sleep only if nothing else runs; time with no event
+       running is charged to untracked. Returns {stage: seconds}.'''
+    edges = sorted([(e['start'], 1, n) for n, e in enumerate(events)] + [(e['end'], 0, n) for n, e in enumerate(events)])
+    active = set()           # Events running between the last edge and the next one
+    path = {}
+    last = edges[0][0]
+    for t, starts, n in edges:
+        if t > last:
+            stage = events[max(active, key=lambda m: (events[m]['stage'] != 'idle', events[m]['start']))]['stage'] if active else 'untracked'
+            path[stage] = path.get(stage, 0.0) + (t - last)
+            last = t
+        if starts:
+            active.add(n)
+        else:
+            active.discard(n)
+    return path
+
+
+def summarize(events):
+    'Returns the summary numbers of one campaign.'
+    start = min(e['start'] for e in events)
+    end = max(e['end'] for e in events)
+    wall = end - start
+    jobs = [e for e in events if e['stage'] in ['keno', 'triton']]
+    core_seconds = sum(e['cores'] * (e['end'] - e['start']) for e in jobs)
+    return {'wall': wall,
+            'steps': len({e['step'] for e in events}),
+            'critical_path': critical_path(events),
+            'mean_cores': core_seconds / wall if wall > 0 else 0.0,
+            'peak_rss_mb': max([e['peak_rss_mb'] for e in events if e['peak_rss_mb'] is not None] or [0.0])}
+
+
+def print_summary(campaigns):
+    'Prints the critical path and utilisation of every campaign.'
+    for campaign, events in sorted(campaigns.items()):
+        s = summarize(events)
+        print("Campaign {}: {} steps, {:.1f} h wall time, {:.1f} cores busy on average, driver peak RSS {:.0f} MB".format(
+              campaign, s['steps'], s['wall']/3600, s['mean_cores'], s['peak_rss_mb']))
+        for stage, seconds in sorted(s['critical_path'].items(), key=lambda x: -x[1]):
+            print("    {:12s} {:10.2f} h  {:5.1f} %".format(stage, seconds/3600, 100*seconds/s['wall'] if s['wall'] > 0 else 0.0))
+
+#################################################################################################
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python stage_timing.py campaign/stage_timing.jsonl [...]")
+        sys.exit(1)
+    print_summary(read_events(sys.argv[1:]))
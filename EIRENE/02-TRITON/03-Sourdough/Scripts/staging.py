@@ -0,0 +1,103 @@
+# ******************************************************************************************************
+#
+#                       Sourdough Read-Only Input Staging
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  Places read-only inputs (the .f71 file of the previous depletion step that every KENO candidate
+#  and ORIGEN run loads) into run directories without copying their bytes when the filesystem allows
+#  it: a hard link first, then a reflink (copy-on-write clone), then a symbolic link, and a plain copy
+#  only if none of those work. Links are checked to point at the source; reflinks and copies are
+#  checked by size and SHA-256 against the source. Only stage files nothing writes to afterwards:
+#  a hard link shares the data with the source.
+#
+# *******************************************************************************************************
+
+import os
+import shutil
+import hashlib
+try:
+    import fcntl
+except ImportError:      # Not on Windows; reflinks are skipped there
+    fcntl = None
+
+FICLONE: int = 0x40049409      # Linux ioctl cloning a whole file (Btrfs, XFS, ...)
+METHODS = ['hardlink', 'reflink', 'symlink', 'copy']      # Staging methods, in the order they are tried
+
+HASHES = {}     # HASHES[(path, size, mtime_ns)] = SHA-256 of the file, so each source is hashed once
+
+
+def file_hash(filename) -> str:
+    'Returns the SHA-256 of a file (cached for as long as its size and modification time stay the same).'
+    st = os.stat(filename)
+    key = (os.path.abspath(filename), st.st_size, st.st_mtime_ns)
+    if key not in HASHES:
+        h = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        HASHES[key] = h.hexdigest()
+    return HASHES[key]
+
+
+def _reflink(src, dst):
+    'Clones src into dst with the FICLONE ioctl; raises OSError where the filesystem cannot.'
+    if fcntl is None:
+        raise OSError("No reflinks on this platform")
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+
+def _place(method, src, dst):
+    'Creates dst from src with one staging method.'
+    if method == 'hardlink':
+        os.link(src, dst)
+    elif method == 'reflink':
+        _reflink(src, dst)
+    elif method == 'symlink':
+        os.symlink(src, dst)
+    else:
+        shutil.copyfile(src, dst)
+
+
+def verify(src, dst, method) -> bool:
+    'Checks that a staged file holds the same data as its source.'
+    if method in ('hardlink', 'symlink'):
+        return os.path.samefile(src, dst)
+    return os.path.getsize(src) == os.path.getsize(dst) and file_hash(src) == file_hash(dst)
+
+
+def stage(src, dst, methods=None) -> str:
+    '''Stages the read-only file src at dst (a file path, or a directory to put it in under the same name).
+       Tries the methods in order (default METHODS) and returns the one used. Raises OSError if none works
+       and RuntimeError if the staged file does not match the source.'''
+    methods = METHODS if methods is None else methods
+    src = os.path.abspath(src)
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    if os.path.lexists(dst):
+        if os.path.exists(dst) and os.path.samefile(src, dst):
+            return 'hardlink' if not os.path.islink(dst) else 'symlink'    # Already staged
+        os.remove(dst)
+    tmp = dst + '.staging'
+    error = None
+    for method in methods:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        try:
+            _place(method, src, tmp)
+        except OSError as e:
+            error = e
+            continue
+        if not verify(src, tmp, method):
+            os.remove(tmp)
+            raise RuntimeError("Staged {} does not match {} ({})".format(dst, src, method))
+        os.replace(tmp, dst)
+        return method
+    raise OSError("Could not stage {} at {}: {}".format(src, dst, error))
+
@@ -0,0 +1,52 @@
+# ******************************************************************************************************
+#
+#                       Sourdough Adaptive Depletion Step Length
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  Picks the length of the next depletion step from the last few steps instead of a fixed dep_step.
+#  A step's critical refuel makes up for the burnup of the step before it, so the refuel rate
+#  (cm^3/day) of step j is crit_refuel(j)/days(j-1) and its reactivity change is the k-eff drift
+#  over the TRITON run of step j-1. While the refuel rate is steady and k-eff hardly drifts the steps
+#  get longer; after a large refuel they get shorter again. Every step that is not needed saves a
+#  KENO search and a TRITON run.
+#
+# *******************************************************************************************************
+
+import numpy as np
+
+
+class StepController(object):
+    'Chooses depletion step lengths in days from the refuel rates and k-eff drifts of the last steps.'
+    def __init__(self, min_days: float = 3.5, max_days: float = 56.0, grow: float = 1.5, shrink: float = 0.5,
+                 window: int = 3, rate_tol: float = 0.05, keff_tol: float = 0.003, refuel_jump: float = 1.5,
+                 max_refuel_frac: float = 0.01):
+        self.min_days:float = min_days              # Shortest step in days
+        self.max_days:float = max_days              # Longest step in days
+        self.grow:float = grow                      # Step length factor when the last steps were quiet
+        self.shrink:float = shrink                  # Step length factor after a large refuel
+        self.window:int = window                    # Number of steps looked back at
+        self.rate_tol:float = rate_tol              # Largest relative spread (std/mean) of the refuel rates to grow
+        self.keff_tol:float = keff_tol              # Largest k-eff drift over a TRITON step to grow
+        self.refuel_jump:float = refuel_jump        # Shrink if the last refuel rate is this many times the mean of the window
+        self.max_refuel_frac:float = max_refuel_frac    # Shrink if the last refuel is more than this fraction of the salt volume
+
+    def next_days(self, days, refuels, drifts, salt_volume: float) -> float:
+        '''Returns the length of the next depletion step. days[j] is the length of the step that refuels[j]
+           (cm^3) made up for and drifts[j] the |k-eff drift| over its TRITON run, oldest first; the last
+           entry is the step just finished. salt_volume is the fuel salt volume in cm^3.'''
+        days = np.asarray(days, dtype=float)
+        refuels = np.asarray(refuels, dtype=float)
+        drifts = np.asarray(drifts, dtype=float)
+        last = days[-1]
+        rates = refuels / days
+        if refuels[-1] > self.max_refuel_frac * salt_volume or \
+           (len(rates) > 1 and rates[-1] > self.refuel_jump * rates[:-1].mean() > 0):
+            return max(last * self.shrink, self.min_days)
+        if len(days) < self.window:
+            return last
+        rates = rates[-self.window:]
+        steady = rates.mean() == 0 or rates.std() <= self.rate_tol * rates.mean()
+        if steady and np.all(drifts[-self.window:] <= self.keff_tol):
+            return min(last * self.grow, self.max_days)
+        return last
@@ -0,0 +1,41 @@
+# ******************************************************************************************************
+#
+#                       Sourdough Test Settings
+#
+#  Dry-run campaigns run with near-zero fake latencies, so that their time goes into the drivers.
+#  Tests marked slow replay the default latencies and only run with --runslow.
+#
+#      python -m pytest EIRENE/02-TRITON/03-Sourdough/Scripts/tests --runslow
+#
+# *******************************************************************************************************
+
+import pytest
+
+# Fake latencies in seconds, read by dry_run.latency in the test process and in every campaign it starts
+FAST_LATENCY = {'DRY_RUN_QUEUE': '0.001', 'DRY_RUN_KENO': '0.001', 'DRY_RUN_TRITON': '0.001', 'DRY_RUN_POLL': '0.01'}
+
+
+def pytest_addoption(parser):
+    parser.addoption('--runslow', action='store_true', default=False, help='also run the tests marked slow')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'slow: dry-run tests at the default fake latencies (run with --runslow)')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--runslow'):
+        return
+    skip = pytest.mark.skip(reason='slow; run with --runslow')
+    for item in items:
+        if 'slow' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def fast_latency():
+    'Sets the fake dry-run latencies near zero for the whole test session.'
+    with pytest.MonkeyPatch.context() as mp:
+        for name, value in FAST_LATENCY.items():
+            mp.setenv(name, value)
+        yield
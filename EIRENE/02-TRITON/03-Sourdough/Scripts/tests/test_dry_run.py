@@ -0,0 +1,300 @@
+# ******************************************************************************************************
+#
+#                       Sourdough Restart Tests (Dry Run)
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  Runs a two-step dry-run campaign with master_cluster.py, once straight through and once crashed
+#  (DRY_RUN_CRASH) right after each CampaignState stage of the second step and then resumed. The
+#  resumed campaign has to finish with the same run-state rows and the same final fuel salt.
+#  A campaign of 14-day steps checks that long steps get one TRITON library per lib_days.
+#  A continuous-feed campaign checks that steps keeping the feed rate get longer. The speculation tests
+#  launch the KENO decks of a third step on a copy of the reference campaign and validate them against
+#  its real burned salt, keeping them or cancelling them for a rerun. Two orchestrated campaigns check
+#  the shared job budget while their adaptive brackets widen. The campaigns run with
+#  the near-zero fake latencies of conftest.py, except the slow one at the default latencies.
+#
+#      python -m pytest EIRENE/02-TRITON/03-Sourdough/Scripts/tests
+#
+# *******************************************************************************************************
+
+import os
+import re
+import sys
+import glob
+import json
+import shutil
+import sqlite3
+import subprocess
+import numpy as np
+import pytest
+
+SCRIPTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SALTS_WF = os.path.join(SCRIPTS, '..', '..', '..', '..', 'ThEIRENE', '10-refuleburn')   # salts_wf.py used by the drivers
+sys.path.insert(0, SCRIPTS)
+sys.path.insert(1, SALTS_WF)
+
+import dry_run
+import keno_monitor
+import scale_output
+from conftest import FAST_LATENCY
+
+SPEC = {'burn': {'horizon_days': 14}}        # Two 7-day depletion steps
+CRASH_STEP = 2
+SPEC_STEP = 3              # Step the speculation tests launch early, from the reference campaign
+COLUMNS = ['crit_refuel', 'fit_slope', 'salt_volume', 'mtihm', 'triton_height', 'step_days']
+
+
+def run_campaign(root, crash=None, spec=SPEC):
+    'Runs master_cluster.py --dry-run on a campaign root (crashing at step:stage if given) and returns its exit code.'
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, 'campaign_spec.json'), 'w') as f:
+        json.dump(spec, f)
+    env = dict(os.environ)      # Fake latencies from conftest.py, or the test
+    env['PYTHONPATH'] = os.pathsep.join([SCRIPTS, SALTS_WF, env.get('PYTHONPATH', '')])
+    env.pop('DRY_RUN_CRASH', None)
+    if crash is not None:
+        env['DRY_RUN_CRASH'] = crash
+    result = subprocess.run([sys.executable, os.path.join(SCRIPTS, 'master_cluster.py'), root, '--dry-run'],
+                            cwd=root, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=600)
+    return result.returncode, result.stdout.decode()
+
+
+def results(root):
+    'Returns the run-state rows and the last fake .f71 file of a finished campaign.'
+    conn = sqlite3.connect(os.path.join(root, 'run_state.db'))
+    rows = conn.execute('SELECT step, {} FROM steps ORDER BY step'.format(', '.join(COLUMNS))).fetchall()
+    conn.close()
+    with open(os.path.join(root, 'dep_step_{}'.format(CRASH_STEP), 'EIRENE.f71'), 'r') as f:
+        f71 = json.load(f)
+    return rows, dict(zip(f71['nuclides'], f71['positions'][-1]))
+
+
+@pytest.fixture(scope='module')
+def reference_root(tmp_path_factory):
+    'Root of the campaign run straight through.'
+    root = str(tmp_path_factory.mktemp('reference'))
+    code, log = run_campaign(root)
+    assert code == 0, log
+    return root
+
+
+@pytest.fixture(scope='module')
+def reference(reference_root):
+    'Results of the campaign run straight through.'
+    return results(reference_root)
+
+
+@pytest.fixture
+def fake_scale(monkeypatch):
+    'Lets a test call dry_run.enable in this process: the environment and SCALE paths it changes are put back afterwards.'
+    pytest.importorskip('salts_wf')
+    for name in ['PATH', 'SCALE_BIN', 'DRY_RUN_DIR', 'DRY_RUN_QUEUE', 'DRY_RUN_KENO', 'DRY_RUN_TRITON', 'DRY_RUN_POLL']:
+        monkeypatch.setenv(name, os.environ.get(name, ''))
+    import run_sourdough, EOC_deck
+    for module in [run_sourdough, EOC_deck, scale_output]:
+        monkeypatch.setattr(module, 'SCALE_bin_path', module.SCALE_bin_path)
+    return dry_run
+
+
+@pytest.fixture
+def speculation(tmp_path, reference_root, fake_scale):
+    '''Driver of a copy of the reference campaign in speculative mode, with the fake SCALE of this test process and
+       slow fake KENO runs, so that its speculative decks for step 3 are still running when they are validated.'''
+    import run_sourdough
+    root = str(tmp_path / 'campaign')
+    shutil.copytree(reference_root, root, ignore=shutil.ignore_patterns('dry_run_bin'))
+    decks = run_sourdough.Refuel_Deck(root)
+    dry_run.enable(root, decks, keno=60.0)
+    decks.speculative = True
+    yield decks
+    for run_dir in glob.glob(os.path.join(decks.step_path(SPEC_STEP), 'refuel_*')):
+        if not scale_output.run_finished(run_dir):
+            decks.get_keno_monitor().stop_job(run_dir)
+
+
+def qdel_log(decks):
+    'Returns the job IDs removed with the fake qdel of a dry-run campaign.'
+    filename = os.path.join(dry_run.stub_dir(decks.campaign_root), dry_run.QDEL_LOG)
+    if not os.path.exists(filename):
+        return []
+    with open(filename, 'r') as f:
+        return f.read().split()
+
+
+def job_id(run_dir):
+    'Returns the job ID saved in a KENO run directory.'
+    with open(os.path.join(run_dir, keno_monitor.JOB_ID_FILE), 'r') as f:
+        return f.read().strip()
+
+
+@pytest.mark.parametrize('stage', ['decks_written', 'keno_done', 'crit_found', 'triton_submitted'])
+def test_resume_after_crash(tmp_path, reference, stage):
+    'A campaign crashed right after a stage of step 2 resumes and finishes like an uninterrupted one.'
+    root = str(tmp_path / 'campaign')
+    code, log = run_campaign(root, '{}:{}'.format(CRASH_STEP, stage))
+    assert code == dry_run.CRASH_EXIT, log
+    with open(os.path.join(root, 'campaign_state.json'), 'r') as f:
+        assert json.load(f)[str(CRASH_STEP)] == stage
+    code, log = run_campaign(root)
+    assert code == 0, log
+    assert "Resuming depletion step {} after stage '{}'".format(CRASH_STEP, stage) in log
+    rows, salt = results(root)
+    ref_rows, ref_salt = reference
+    assert len(rows) == len(ref_rows)
+    for row, ref_row in zip(rows, ref_rows):
+        assert row == pytest.approx(ref_row, rel=1e-12, nan_ok=True)
+    assert salt == pytest.approx(ref_salt, rel=1e-12)
+
+
+def test_long_steps_get_more_libraries(tmp_path):
+    'A step longer than lib_days is burned with one TRITON library per lib_days, and the next step starts from its end.'
+    root = str(tmp_path / 'campaign')
+    code, log = run_campaign(root, spec={'burn': {'horizon_days': 28, 'dep_step': 14, 'lib_days': 7}})
+    assert code == 0, log
+    with open(os.path.join(root, 'dep_step_1', 'EIRENE.inp'), 'r') as f:
+        assert 'burn=14 nlib=2 end' in f.read()
+    with open(os.path.join(root, 'dep_step_1', 'EIRENE.f71'), 'r') as f:
+        f71 = json.load(f)
+    assert len(f71['positions']) == 3
+    conn = sqlite3.connect(os.path.join(root, 'run_state.db'))
+    assert conn.execute('SELECT nlib FROM steps WHERE step=1').fetchone()[0] == 2
+    burned = dict(conn.execute('SELECT nuclide, adens FROM nuclides WHERE step=1').fetchall())
+    conn.close()
+    end = dict(zip(f71['nuclides'], f71['positions'][-1]))
+    assert burned == pytest.approx({n: end[n] for n in burned}, rel=1e-9)
+
+
+def test_critical_feed_steps_grow(tmp_path):
+    'With continuous feed, a step after a TRITON run that ended critical keeps the feed rate and burns longer.'
+    root = str(tmp_path / 'campaign')
+    code, log = run_campaign(root, spec={'burn': {'horizon_days': 42}, 'refuel': {'feed_mode': 'continuous'}})
+    assert code == 0, log
+    conn = sqlite3.connect(os.path.join(root, 'run_state.db'))
+    rows = {r[0]: r[1:] for r in conn.execute('SELECT step, step_days, feed_rate FROM steps')}
+    conn.close()
+    kept = [int(n) for n in re.findall(r'depletion step (\d+) keeps feeding', log)]
+    assert kept, log
+    for step in kept:
+        assert rows[step][0] > rows[step-1][0]
+        assert rows[step][1] == rows[step-1][1]
+        assert not os.path.exists(os.path.join(root, 'dep_step_{}'.format(step), 'data-temp.out'))    # No KENO search
+
+
+
+def test_speculative_decks(speculation):
+    'Step 3 speculates from the linear extrapolation of the burned salts of steps 1 and 2, once.'
+    decks = speculation
+    assert not decks.can_speculate(SPEC_STEP - 1)
+    assert decks.can_speculate(SPEC_STEP)
+    a1, a2 = decks.get_burned_salt_adens(SPEC_STEP - 2), decks.get_burned_salt_adens(SPEC_STEP - 1)
+    adens = decks.extrapolate_burned_adens(SPEC_STEP)
+    grown = 2*a2 - a1 >= 0
+    assert (adens - a2)[grown] == pytest.approx((a2 - a1)[grown], rel=1e-9, abs=1e-30)
+    assert np.all(adens[~grown] == 0.0)
+    rvols = decks.write_speculative_decks(SPEC_STEP)
+    runs = glob.glob(os.path.join(decks.step_path(SPEC_STEP), 'refuel_*'))
+    assert len(runs) == len(rvols)
+    for run_dir in runs:
+        assert os.path.exists(os.path.join(run_dir, decks.deck_name))
+        assert os.path.exists(os.path.join(run_dir, keno_monitor.JOB_ID_FILE))
+    assert decks.speculated(SPEC_STEP)
+    assert np.load(os.path.join(decks.step_path(SPEC_STEP), decks.speculative_file)) == pytest.approx(adens)
+    assert not decks.can_speculate(SPEC_STEP)
+
+
+def test_speculation_accepted(speculation):
+    'Speculative decks close enough to the real burned salt keep running.'
+    decks = speculation
+    decks.write_speculative_decks(SPEC_STEP)
+    decks.speculative_tol = 0.05       # The toy depletion of the dry run is not quite linear
+    assert decks.validate_speculation(SPEC_STEP)
+    main_path = decks.step_path(SPEC_STEP)
+    assert os.path.exists(os.path.join(main_path, 'accepted_' + decks.speculative_file))
+    assert not decks.speculated(SPEC_STEP)
+    assert decks.keno_jobs(SPEC_STEP)[0] > 0
+    assert not glob.glob(os.path.join(main_path, 'rejected_*'))
+    assert qdel_log(decks) == []
+
+
+def test_speculation_rejected(speculation, monkeypatch):
+    'Rejected speculative decks have their jobs removed with qdel, and the resumed campaign reruns the search under refuel_*.'
+    decks = speculation
+    decks.write_speculative_decks(SPEC_STEP)
+    decks.speculative_tol = 0.0
+    assert not decks.validate_speculation(SPEC_STEP)
+    main_path = decks.step_path(SPEC_STEP)
+    assert not glob.glob(os.path.join(main_path, 'refuel_*'))
+    rejected = glob.glob(os.path.join(main_path, 'rejected_*.0'))
+    assert rejected and decks.keno_jobs(SPEC_STEP, 'rejected') == (len(rejected), len(rejected))
+    assert sorted(qdel_log(decks)) == sorted(job_id(run_dir) for run_dir in rejected)
+    for run_dir in rejected:
+        assert os.path.exists(os.path.join(run_dir, keno_monitor.CANCELLED_FILE))
+    monkeypatch.setenv('DRY_RUN_KENO', FAST_LATENCY['DRY_RUN_KENO'])
+    code, log = run_campaign(decks.campaign_root, spec={'burn': {'horizon_days': 21}})
+    assert code == 0, log
+    runs = glob.glob(os.path.join(main_path, 'refuel_*'))
+    assert len(runs) == len(rejected)
+    for run_dir in runs:
+        assert scale_output.run_finished(run_dir)
+    assert os.path.exists(os.path.join(main_path, decks.f71_name))
+
+
+
+def test_orchestrator_budget(tmp_path, fake_scale, monkeypatch, capsys):
+    '''Two campaigns sharing a budget smaller than their brackets never have more than max_jobs jobs out. Their adaptive
+       brackets are too narrow to always hold the critical refuel, and a step that widens its bracket does so once.'''
+    import orchestrator
+    campaigns = []
+    for enrich in [5, 7]:
+        root = str(tmp_path / str(enrich))
+        os.makedirs(root)
+        with open(os.path.join(root, 'campaign_spec.json'), 'w') as f:
+            json.dump({'burn': {'horizon_days': 21}, 'refuel': {'search_mode': 'adaptive'}}, f)
+        campaigns.append(orchestrator.Campaign(enrich, root))
+        campaigns[-1].decks.adaptive_nsig = 0.0
+        campaigns[-1].decks.adaptive_min_width = 500.0
+    dry_run.enable(str(tmp_path), *[c.decks for c in campaigns])
+    for c in campaigns:
+        dry_run.seed_boc(c.decks)
+    max_jobs = len(campaigns[0].decks.rvols) + 1
+    in_use = []
+    advance = orchestrator.Campaign.advance
+
+    def advance_and_count(campaign, free_jobs):
+        n = advance(campaign, free_jobs)
+        in_use.append(sum(c.running_jobs() for c in campaigns))      # Jobs out as the campaign directories show them
+        return n
+    monkeypatch.setattr(orchestrator.Campaign, 'advance', advance_and_count)
+    orchestrator.Orchestrator(campaigns, max_jobs=max_jobs, poll=dry_run.latency('poll')).run()
+    assert all(c.steps_done() for c in campaigns)
+    assert max(in_use) <= max_jobs
+    widened = re.findall(r'\[(\d+)%\] Critical refuel escaped the adaptive bracket; .* depletion step (\d+)', capsys.readouterr().out)
+    assert widened and len(set(widened)) == len(widened)
+    for enrich, step in widened:           # What a restarted orchestrator finds, instead of widening again
+        decks = campaigns[[5, 7].index(int(enrich))].decks
+        assert decks.unwritten_rvols(int(step), decks.rvols) == []
+
+
+def test_latency_settings(monkeypatch):
+    'Fake latencies come from the argument, then the environment, then DEFAULT_LATENCY.'
+    monkeypatch.delenv('DRY_RUN_KENO', raising=False)
+    assert dry_run.latency('keno') == dry_run.DEFAULT_LATENCY['keno']
+    monkeypatch.setenv('DRY_RUN_KENO', '0.01')
+    assert dry_run.latency('keno') == 0.01
+    assert dry_run.latency('keno', 2) == 2.0
+
+
+@pytest.mark.slow
+def test_default_latencies(tmp_path, monkeypatch):
+    'At the default fake latencies, every job the stage timing records waits and runs at least as long as the fakes do.'
+    for name, value in dry_run.DEFAULT_LATENCY.items():
+        monkeypatch.setenv('DRY_RUN_' + name.upper(), str(value))
+    root = str(tmp_path / 'campaign')
+    code, log = run_campaign(root)
+    assert code == 0, log
+    with open(os.path.join(root, 'stage_timing.jsonl'), 'r') as f:
+        events = [json.loads(line) for line in f]
+    for stage, name in [('queue_wait', 'queue'), ('keno', 'keno'), ('triton', 'triton')]:
+        spans = [e['end'] - e['start'] for e in events if e['stage'] == stage]
+        assert spans and min(spans) >= 0.9*dry_run.DEFAULT_LATENCY[name]
@@ -0,0 +1,45 @@
+# ******************************************************************************************************
+#
+#                       Sourdough Heavy Metal Ledger Tests
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  Checks the heavy metal grams the ledger takes from atom densities against the gram basis of the
+#  salt weight fractions (salts_wf.py, molmass atomic masses), which is what obiwan -units=gram
+#  gives too, and against the BOC MTiHM of the EIRENE driver.
+#
+#      python -m pytest EIRENE/02-TRITON/03-Sourdough/Scripts/tests
+#
+# *******************************************************************************************************
+
+import os
+import sys
+import tempfile
+import pytest
+
+SCRIPTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SALTS_WF = os.path.join(SCRIPTS, '..', '..', '..', '..', 'ThEIRENE', '10-refuleburn')   # salts_wf.py used by the drivers
+sys.path.insert(0, SCRIPTS)
+sys.path.insert(1, SALTS_WF)
+
+import hm_ledger
+
+
+def test_weights_use_atomic_masses():
+    'Heavy metal nuclides weigh their AME2016 atomic mass, others nothing; unlisted actinides fall back to the mass number.'
+    w = hm_ledger.hm_weights(['u-235', 'f-19', 'am-242m', 'es-254'])
+    assert list(w) == [hm_ledger.MOLAR_MASS['u-235'], 0.0, hm_ledger.MOLAR_MASS['am-242'], 254*(1.0 + hm_ledger.MASS_EXCESS)]
+
+
+def test_boc_salt_grams_match_weight_fractions():
+    'The BOC salt, turned into atom densities, gives back the uranium grams of its weight fractions and about init_MTiHM.'
+    salts_wf = pytest.importorskip('salts_wf')
+    run_sourdough = pytest.importorskip('run_sourdough')
+    decks = run_sourdough.Refuel_Deck(tempfile.mkdtemp())
+    salt = salts_wf.Salt(decks.refuelsaltmix(decks.UF4molpct), decks.Uenrichpct/100.0)
+    wf = dict(zip(['u-234', 'u-235', 'u-236', 'u-238'], salt.wf_gen()[4:8]))
+    dens = float(salt.densityK(decks.fs_tempK))
+    adens = {n: f*dens/salt.ELEMENTS['U'].isotopes[int(n[2:])].mass*hm_ledger.AVOGADRO for n, f in wf.items()}
+    grams = sum(wf.values())*dens*decks.V0
+    assert hm_ledger.hm_grams(adens, decks.V0) == pytest.approx(grams, rel=1e-6)
+    assert hm_ledger.hm_grams(adens, decks.V0)*1e-6 == pytest.approx(decks.init_MTiHM, rel=5e-3)
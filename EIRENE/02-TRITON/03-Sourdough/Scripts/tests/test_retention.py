@@ -0,0 +1,47 @@
+# ******************************************************************************************************
+#
+#                       Sourdough Step Output Retention Tests
+#
+#  By: C. Erika Moss and Dr. Ondrej Chvala
+#
+#  Archives a step directory holding KENO runs in every state and checks that only the runs whose
+#  job is over are pruned or compressed.
+#
+#      python -m pytest EIRENE/02-TRITON/03-Sourdough/Scripts/tests
+#
+# *******************************************************************************************************
+
+import os
+import sys
+
+SCRIPTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS)
+
+import retention
+import keno_monitor
+import scale_output
+
+
+def write_run(run_dir, *names):
+    'Writes a KENO run directory with a deck, a job ID, a large message file and the given extra files.'
+    os.makedirs(run_dir)
+    for name in ['EIRENE.inp', keno_monitor.JOB_ID_FILE] + list(names):
+        with open(os.path.join(run_dir, name), 'w') as f:
+            f.write('x\n')
+    with open(os.path.join(run_dir, 'EIRENE.msg'), 'wb') as f:
+        f.write(b'x' * 100000)
+
+
+def test_running_jobs_are_left_alone(tmp_path):
+    'Rejected and refuel runs are archived once finished or cancelled; runs whose job is still going are not touched.'
+    step_dir = str(tmp_path)
+    write_run(os.path.join(step_dir, 'rejected_1000.0'))
+    write_run(os.path.join(step_dir, 'rejected_2000.0'), keno_monitor.CANCELLED_FILE)
+    write_run(os.path.join(step_dir, 'refuel_1000.0'))
+    write_run(os.path.join(step_dir, 'refuel_2000.0'), scale_output.ESTIMATE_FILE)
+    retention.RetentionPolicy().apply(step_dir)
+    assert os.path.exists(os.path.join(step_dir, 'rejected_1000.0', 'EIRENE.msg'))
+    assert not os.path.exists(os.path.join(step_dir, 'rejected_2000.0', 'EIRENE.msg'))
+    assert os.path.exists(os.path.join(step_dir, 'refuel_1000.0', 'EIRENE.msg'))
+    assert not os.path.exists(os.path.join(step_dir, 'refuel_2000.0', 'EIRENE.msg'))
+    assert os.path.exists(os.path.join(step_dir, 'refuel_2000.0', scale_output.ESTIMATE_FILE))
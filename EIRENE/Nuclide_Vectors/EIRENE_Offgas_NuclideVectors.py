@@ -19,7 +19,12 @@ import numpy as np
 import os
 import subprocess
 import sys, re
-from numpy import genfromtxt
+
+# run_state.py is one of the shared Sourdough scripts in EIRENE/02-TRITON/03-Sourdough/Scripts
+SOURDOUGH_SCRIPTS = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '02-TRITON', '03-Sourdough', 'Scripts'))
+if SOURDOUGH_SCRIPTS not in sys.path:
+    sys.path.append(SOURDOUGH_SCRIPTS)
+from run_state import RunStateDB
 
 SCALE_bin_path = '/home/sigma/codes/SCALE/SCALE-6.3.1/bin/'
 
@@ -35,10 +40,12 @@ enr = 3.5    # Refuel salt enrichment level
 
 ################################################################################
 
+run_state = None    # Campaign run-state database, opened on first read
+
 def read_fuel_salt_volume(iter):
     'Reads the fuel salt volume at the current depletion step.'
     
-    # Change to directory for the specified refuel salt enrichment level:
+    # Depletion step directory for the specified refuel salt enrichment level:
     if enr == 3.5:
         dep_path = os.path.expanduser('~/EIRENE13/3.5/dep_step_{}'.format(iter))
     elif enr == 5:
@@ -60,10 +67,10 @@ def read_fuel_salt_volume(iter):
     else:
         print('Invalid enrichment entry')
         
-    os.chdir(dep_path)
-    
-    filename = 'Salt_volume_dep_step_{}.out'.format(iter)
-    volume = genfromtxt(filename)
+    global run_state
+    if run_state is None:
+        run_state = RunStateDB(os.path.join(os.path.dirname(dep_path), 'run_state.db'))
+    volume = run_state.get(iter, 'salt_volume', dep_path)   # Falls back to Salt_volume_dep_step_N.out for older campaigns
     
     return volume
 
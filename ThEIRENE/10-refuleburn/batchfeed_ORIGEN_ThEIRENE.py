@@ -7,28 +7,41 @@
 #
 #     By: C. Erika Moss, Ondrej Chvala
 #
-#
+#     Needs the shared Sourdough scripts (refuel_search, staging, campaign_state,
+#     run_state, refuel_engine, step_control, ...) from
+#     EIRENE/02-TRITON/03-Sourdough/Scripts; that directory is added to the
+#     module search path below, relative to this file.
 #
 ###############################################################################
 
 
 import time
 import os
-import shutil
-import salts_wf
 import numpy as np
 from numpy import genfromtxt
-import math
 import sys, re
 import subprocess
 
+# Shared Sourdough scripts of the EIRENE driver
+SOURDOUGH_SCRIPTS: str = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                       '..', '..', 'EIRENE', '02-TRITON', '03-Sourdough', 'Scripts'))
+if SOURDOUGH_SCRIPTS not in sys.path:
+    sys.path.append(SOURDOUGH_SCRIPTS)
+
+import salt_blend
+import staging       # Shared with the EIRENE Sourdough driver
+import tank_decay
+from campaign_state import CampaignState
+from refuel_engine import RefuelBurnEngine     # Shared with the EIRENE Sourdough driver
+from step_control import StepController
+
 #SCALE_bin_path: str = os.getenv('SCALE_BIN', '/home/sigma/codes/SCALE/SCALE-6.3.1/bin/')
 
 SCALE_bin_path: str = os.getenv('SCALE_BIN', '/opt/scale6.3.1/bin/')
 
-class ThEIRENE_Deck():
+class ThEIRENE_Deck(RefuelBurnEngine):
     'Class for defining parameters for use in the EIRENE TRITON decks.'
-    def __init__(self):
+    def __init__(self, campaign_root: str = None, spec=None):
         # ************************
         #   Set Material Params.
         # ************************
@@ -54,6 +67,12 @@ class ThEIRENE_Deck():
         self.renrich = 0.195                                    # Refuel enrichment fraction
         self.rvols = [100, 7000, 15000, 30000, 60000, 120000]      # Refuel volumes in cm^3
         self.V0 = 10680600.0
+        self.search_mode:str = 'fixed'     # 'fixed' runs every volume in rvols; 'adaptive' brackets the last step's critical refuel
+        self.adaptive_npts:int = 3         # Number of KENO points in the adaptive bracket
+        self.adaptive_nsig:float = 3.0     # Bracket half-width in KENO standard deviations of k-eff
+        self.adaptive_min_width:float = 1500.0   # Minimum bracket half-width in cm^3
+        self.rvol_min:float = 100.0        # Smallest refuel volume the adaptive bracket may place in cm^3
+        self.search_rvols = self.rvols     # Refuel volumes used in the current step's KENO search
 
         # ************************
         #    Set TRITON Params.
@@ -62,7 +81,14 @@ class ThEIRENE_Deck():
         self.nsk:float = 20              # Number of skipped generations (nsk)
         self.gen:float = 5020            # Number of generations (gen)
         self.sig:float = 150e-5           # Error (sig)
-        self.dep_step:float = 7          # Length of single depletion step in days
+        self.dep_step:float = 7          # Length of single depletion step in days (first step, or every step without adaptive_steps)
+        self.adaptive_steps:bool = False # Lengthen/shorten the steps with the refuel rate and k-eff drift (see step_control.py)
+        self.step_control = StepController()    # Step length limits and tolerances of adaptive_steps
+        self.lib_days:float = 7          # Longest burn per TRITON cross section library in days (nlib grows with the step)
+        self.horizon_days = None         # Simulated days after which the run stops (None: run every step)
+        self.feed_mode:str = 'discrete'  # 'discrete' blends the critical refuel in; 'continuous' also feeds it through the TRITON timetable (with adaptive step lengths)
+        self.feed_keff_tol:float = 0.002 # With 'continuous', keep the feed rate (no KENO search) while TRITON ends this close to critical
+        self.feed_tank_factor:float = 20.0    # Feed tank contents as a multiple of the refuel fed over a step
 #        self.dep_length:float = 10       # Total length of depletion simulation in days
 
         # ************************
@@ -71,6 +97,12 @@ class ThEIRENE_Deck():
         self.fuel_f71_name:str = 'updated_core_salt.f71'   # Mixed salt .f71 name
         self.gfp_f71_name:str = 'noble_gases.f71'          # GFP .f71 name
         self.noblemetal_f71_name:str = 'noble_metals.f71'  # Noble metals .f71 name
+        self.blend_engine:str = 'numpy'     # 'numpy' blends burned salt and refuel in Python (salt_blend.py); 'origen' runs mixsalts.inp
+        self.origen_batch:bool = True       # With 'origen', blend every KENO candidate of a step in one ORIGEN run
+        self.batch_inp_name:str = 'mixsalts_batch.inp'          # ORIGEN input blending all KENO candidates
+        self.batch_f71_name:str = 'refuel_candidates.f71'       # One position per candidate, in the order of the input
+        self.tank_decay_hours:float = 1e-6  # Decay of the holding tanks with 'numpy' (tank_decay.py), same as the ORIGEN cases
+        self.f71_tables = {}                # f71_tables[iter] = (salt_blend.read_f71 table, volumes) of the .f71 file step iter starts from
 
         # **************************
         #   Cluster Running Params.
@@ -80,11 +112,15 @@ class ThEIRENE_Deck():
         self.deck_name:str = 'ThEIRENE.inp'           # Input file name
         self.f71_name:str = 'ThEIRENE.f71'            # Name of .f71 TRITON file to read
         self.qsub_name:str = 'runThEIRENE-Scale.sh'   # Name of each qsub file
-        self.qsub_path:str = os.getcwd() + '/' + self.qsub_name
-        self.deck_path:str = os.getcwd()
-        self.BOC_f71_path:str = os.getcwd() + '/BOC/'
+        self.deck_path:str = os.path.abspath(os.path.expanduser(campaign_root or os.getcwd()))   # Campaign root; every file path is built from it
+        self.qsub_path:str = self.deck_path + '/' + self.qsub_name
+        self.BOC_f71_path:str = self.deck_path + '/BOC/'
+        self.run_state_file:str = self.deck_path + '/run_state.db'     # Per-step salt volume, MTiHM, crit. refuel, height
+        self.run_state = None         # RunStateDB, opened on first use
+        self.ledger = None            # hm_ledger.HeavyMetalLedger, made on first use
         self.power:float = 400.0      # TRITON power in MW (used for calculating power density)
         self.init_MTiHM:float = 10.2647529843048        # Initial MTiHM for BOC core
+        self.apply_spec(spec)         # Campaign spec (dict or JSON file; default campaign_spec.json in the campaign root)
 
 
     ################################
@@ -107,37 +143,6 @@ class ThEIRENE_Deck():
             print("Molar percent sum: ", mBe + mLi + mU + mTh)
         return mysalt
 
-    ################################
-    #     Write the Refuel Salt
-    ################################
-
-    def refuelsaltmix(self, mU: float = 5) -> str:
-        """Calculates salt mixture, assuming the MSRR salt is a melt of two salts,
-        UF4 salt and a 66.6% LiF 33.3%BeF2 eutectic FLiBe.
-        input: UF4 mol%
-        output: salt name string"""
-
-        mLi: float = (100.0 - mU) * 2.0 / 3.0
-        mBe: float = mLi / 2.0
-        mysalt = f'{mLi:5.3f}%LiF + {mBe:5.3f}%BeF2 + {mU:5.3f}%UF4'
-        if True:
-            print("Salt: ", mysalt)
-            print("Molar percent sum: ", mBe + mLi + mU)
-        return mysalt
-
-
-    def get_refuel_wf(self):
-        'Returns the weight fractions of each isotope component of the refuel salt.'
-        s = salts_wf.Salt(self.refuelsaltmix(self.refuelUF4molpct), self.renrich)
-        iso_list = s.wf_gen()
-        return iso_list
-
-    def get_refuel_den(self):
-        'Returns the density of the refuel salt.'
-        s = salts_wf.Salt(self.refuelsaltmix(self.refuelUF4molpct), self.renrich)
-        dens = float(s.densityK(self.fs_tempK))
-        return dens
-
     ##########################################
     #    Write New Salt Fuel with ORIGEN
     ##########################################
@@ -155,7 +160,7 @@ class ThEIRENE_Deck():
         '''Writes the first part of the ORIGEN input file for the current
            depletion step.
 
-           NOTE: Assumes nlib is set to 1 (need for case position values).
+           The .f71 positions follow the nlib of the previous step (set_f71_positions).
 
            '''
 
@@ -169,7 +174,7 @@ class ThEIRENE_Deck():
 
         content = '''
 =shell
-    cp ${INPDIR}/ThEIRENE.f71 ThEIRENE.f71
+    ln -sf ${INPDIR}/ThEIRENE.f71 ThEIRENE.f71 || cp ${INPDIR}/ThEIRENE.f71 ThEIRENE.f71
 end
 
 =origen
@@ -177,7 +182,7 @@ end
 ' Read burned salt:
 case(burnedSalt){
     lib{ file="end7dec" pos=1 }
-    mat{ load{ file="ThEIRENE.f71" pos=2 }}
+    mat{ load{ file="ThEIRENE.f71" pos=burned_pos }}
     flux=[0.0]
     time{ t=[0.000001] units=hours }
     print{}
@@ -186,7 +191,7 @@ case(burnedSalt){
 ' Read noble gas data:
 case(noble_gases){
     lib{ file="end7dec" pos=1 }
-    mat{ load{ file="ThEIRENE.f71" pos=4 }}
+    mat{ load{ file="ThEIRENE.f71" pos=noble_gas_pos }}
     flux=[0.0]
     time{ t=[0.000001] units=hours }
     save{ file="noble_gases.f71" steps=[0] }
@@ -195,7 +200,7 @@ case(noble_gases){
 ' Read noble metal data:
 case(noble_metals){
     lib{ file="end7dec" pos=1 }
-    mat{ load{ file="ThEIRENE.f71" pos=6 }}
+    mat{ load{ file="ThEIRENE.f71" pos=noble_metal_pos }}
     flux=[0.0]
     time{ t=[0.000001] units=hours }
     save{ file="noble_metals.f71" steps=[0] }
@@ -258,9 +263,7 @@ end
         if iter == 1:
             norm_factor = self.init_MTiHM
         else:
-            os.chdir(last_dep_step_path)
-            filename = "MTiHM_dep_step_{}.txt".format(iter-1)
-            norm_factor = genfromtxt("{}".format(filename), delimiter='')
+            norm_factor = self.get_run_state().get(iter-1, 'mtihm', last_dep_step_path)
 
         norm_iso_mass = [i / norm_factor for i in iso_mass]
 
@@ -309,25 +312,22 @@ end
 
         content9 = content8.replace('norm_refuel_vol', volstr)
 
-        # Write the ORIGEN file in the directory of the previous depletion step
-        # so that the burned salt may be read in from the .f71 file
+        # Update file with the .f71 positions of the burned salt and tanks:
 
-        if iter==1:
-            BOC_path = self.deck_path + '/BOC'
-            os.chdir(BOC_path)
-        else:
-            os.chdir(last_dep_step_path)
+        content10 = self.set_f71_positions(content9, iter)
 
+        # Write the ORIGEN file in the directory of the previous depletion step
+        # so that the burned salt may be read in from the .f71 file
 
-        s = open('mixsalts.inp', "w")
-        s.write(content9)
+        s = open(os.path.join(self.step_path(iter-1), 'mixsalts.inp'), "w")
+        s.write(content10)
         s.close()
 
     def write_ORIGEN_KENO(self, rvol, iter, path):
         '''Writes the first part of the ORIGEN input file for the current
            depletion step.
 
-           NOTE: Assumes nlib is set to 1 (need for case position values).
+           The .f71 positions follow the nlib of the previous step (set_f71_positions).
 
            '''
 
@@ -341,7 +341,7 @@ end
 
         content = '''
 =shell
-    cp ${INPDIR}/ThEIRENE.f71 ThEIRENE.f71
+    ln -sf ${INPDIR}/ThEIRENE.f71 ThEIRENE.f71 || cp ${INPDIR}/ThEIRENE.f71 ThEIRENE.f71
 end
 
 =origen
@@ -349,7 +349,7 @@ end
 ' Read burned salt:
 case(burnedSalt){
     lib{ file="end7dec" pos=1 }
-    mat{ load{ file="ThEIRENE.f71" pos=2 }}
+    mat{ load{ file="ThEIRENE.f71" pos=burned_pos }}
     flux=[0.0]
     time{ t=[0.000001] units=hours }
     print{}
@@ -358,7 +358,7 @@ case(burnedSalt){
 ' Read noble gas data:
 case(noble_gases){
     lib{ file="end7dec" pos=1 }
-    mat{ load{ file="ThEIRENE.f71" pos=4 }}
+    mat{ load{ file="ThEIRENE.f71" pos=noble_gas_pos }}
     flux=[0.0]
     time{ t=[0.000001] units=hours }
     save{ file="noble_gases.f71" steps=[0] }
@@ -367,7 +367,7 @@ case(noble_gases){
 ' Read noble metal data:
 case(noble_metals){
     lib{ file="end7dec" pos=1 }
-    mat{ load{ file="ThEIRENE.f71" pos=6 }}
+    mat{ load{ file="ThEIRENE.f71" pos=noble_metal_pos }}
     flux=[0.0]
     time{ t=[0.000001] units=hours }
     save{ file="noble_metals.f71" steps=[0] }
@@ -435,9 +435,7 @@ end
             norm_factor = self.init_MTiHM
             norm_iso_mass = [float(i) / norm_factor for i in iso_mass]
         else:
-            os.chdir(last_dep_step_path)
-            filename = "MTiHM_dep_step_{}.txt".format(iter-1)
-            norm_factor = genfromtxt("{}".format(filename), delimiter='')
+            norm_factor = self.get_run_state().get(iter-1, 'mtihm', last_dep_step_path)
             norm_iso_mass = [float(i) / norm_factor for i in iso_mass]
 
         # Normalized masses:
@@ -485,23 +483,88 @@ end
 
         content9 = content8.replace('norm_refuel_vol', volstr)
 
-        os.chdir(path)
+        # Update file with the .f71 positions of the burned salt and tanks:
+
+        content10 = self.set_f71_positions(content9, iter)
+
+        s = open(os.path.join(path, 'mixsalts.inp'), "w")
+        s.write(content10)
+        s.close()
+
+    def write_ORIGEN_batch(self, rvols, iter, path):
+        '''Writes one ORIGEN input blending the burned salt with every refuel volume in rvols: a refuelSalt_i/blendSalt_i
+           case pair per candidate, each blend saved as the next position of batch_f71_name.
+
+           The burned salt position follows the nlib of the previous step.
+        '''
+        content = '''
+=shell
+    ln -sf ${INPDIR}/ThEIRENE.f71 ThEIRENE.f71 || cp ${INPDIR}/ThEIRENE.f71 ThEIRENE.f71
+end
+
+=origen
+
+' Read burned salt:
+case(burnedSalt){
+    lib{ file="end7dec" pos=1 }
+    mat{ load{ file="ThEIRENE.f71" pos=burned_pos }}
+    flux=[0.0]
+    time{ t=[0.000001] units=hours }
+}
+'''
+        for i, rvol in enumerate(rvols, 1):
+            grams, volume = self.get_refuel_grams(rvol, iter)
+            isos = "\n               ".join("{}={}".format(n, m) for n, m in grams.items())
+            content += f'''
+' Refuel candidate {i}: {rvol} cm3
+case(refuelSalt_{i}){{
+    lib{{ file="end7dec" pos=1 }}
+    mat{{
+        iso=[  {isos}
+            ]
+        units=GRAMS
+        volume={volume}
+    }}
+    flux=[0.0]
+    time{{ t=[0.000001] units=hours }}
+}}
 
-        s = open('mixsalts.inp', "w")
-        s.write(content9)
+case(blendSalt_{i}){{
+    lib{{ file=end7dec pos=1}}
+    mat{{
+        blend=[
+            burnedSalt(0)=1
+            refuelSalt_{i}(0)=1
+        ]
+    }}
+    time{{ t=[0.000001] units=hours }}
+    save{{ file="{self.batch_f71_name}" steps=[0] }}
+}}
+'''
+        content += "\nend\n"
+        s = open(os.path.join(path, self.batch_inp_name), "w")
+        s.write(self.set_f71_positions(content, iter))
         s.close()
 
+    def f71_pos(self, iter, pos=salt_blend.BURNED_POS):
+        'Returns where the one-library position pos (salt_blend.BURNED_POS by default) is in the .f71 file depletion step iter starts from.'
+        return salt_blend.end_pos(pos, self.get_nlib(iter-1))
+
+    def set_f71_positions(self, content, iter):
+        'Fills the burned salt and tank positions of the .f71 file depletion step iter starts from into an ORIGEN input.'
+        content = content.replace('pos=burned_pos', 'pos={}'.format(self.f71_pos(iter)))
+        content = content.replace('pos=noble_gas_pos', 'pos={}'.format(self.f71_pos(iter, salt_blend.NOBLE_GAS_POS)))
+        return content.replace('pos=noble_metal_pos', 'pos={}'.format(self.f71_pos(iter, salt_blend.NOBLE_METAL_POS)))
+
     def write_ORIGEN_zerocrit(self, iter):
         'Creates an ORIGEN file specific for instances where the critical refuel rate/amount is returned as 0 (special circumstance requiring a special file!).'
-        'NOTE: As before, this assumed that the nlib is set to 1 (for case positionsl; need to change assigned pos values if nlib other than 1 is used)'
-        last_dep_step = iter - 1
-        last_dep_step_path = self.deck_path + '/dep_step_{}'.format(last_dep_step)
+        'The .f71 positions follow the nlib of the previous step (set_f71_positions).'
 
         # --- Write the initial ORIGEN input string: ---
 
         content = '''
 =shell
-    cp ${INPDIR}/ThEIRENE.f71 EIRENE.f71
+    ln -sf ${INPDIR}/ThEIRENE.f71 EIRENE.f71 || cp ${INPDIR}/ThEIRENE.f71 EIRENE.f71
 end
 
 =origen
@@ -509,7 +572,7 @@ end
 ' Read burned salt:
 case(burnedSalt){
     lib{ file="end7dec" pos=1 }
-    mat{ load{ file="ThEIRENE.f71" pos=2 }}
+    mat{ load{ file="ThEIRENE.f71" pos=burned_pos }}
     flux=[0.0]
     time{ t=[0.000001] units=hours }
     save{ file="updated_core_salt.f71" steps=[0] }
@@ -518,7 +581,7 @@ case(burnedSalt){
 ' Read noble gas data:
 case(noble_gases){
     lib{ file="end7dec" pos=1 }
-    mat{ load{ file="ThEIRENE.f71" pos=4 }}
+    mat{ load{ file="ThEIRENE.f71" pos=noble_gas_pos }}
     flux=[0.0]
     time{ t=[0.000001] units=hours }
     save{ file="noble_gases.f71" steps=[0] }
@@ -527,7 +590,7 @@ case(noble_gases){
 ' Read noble metal data:
 case(noble_metals){
     lib{ file="end7dec" pos=1 }
-    mat{ load{ file="ThEIRENE.f71" pos=6 }}
+    mat{ load{ file="ThEIRENE.f71" pos=noble_metal_pos }}
     flux=[0.0]
     time{ t=[0.000001] units=hours }
     save{ file="noble_metals.f71" steps=[0] }
@@ -540,22 +603,15 @@ end
         # Write the ORIGEN file in the directory of the previous depletion step
         # so that the burned salt may be read in from the .f71 file
 
-        if iter==1:
-            BOC_path = self.deck_path + 'BOC'
-            os.chdir(BOC_path)
-        else:
-            os.chdir(last_dep_step_path)
-
-
-        s = open('mixsalts.inp', "w")
-        s.write(content)
+        s = open(os.path.join(self.step_path(iter-1), 'mixsalts.inp'), "w")
+        s.write(self.set_f71_positions(content, iter))
         s.close()
 
     ##########################################
     #   Execute ORIGEN Script and Read .f71
     ##########################################
 
-    def run_ORIGEN_locally(self, iter):
+    def run_ORIGEN_locally(self, iter, path=None):
         '''Executes the ORIGEN script to create 3 .f71 files: one for the new
            mixed salt (burned salt + fresh refuel), one for gaseous fission
            products that have been removed (tracked in the holding tank), and
@@ -566,10 +622,10 @@ end
 
         filename = 'mixsalts.inp'
 
-        subprocess.run([''f"{SCALE_bin_path}/scalerte", filename])
+        subprocess.run([''f"{SCALE_bin_path}/scalerte", filename], cwd=path or self.step_path(iter-1))
 
-    def write_ORIGEN_qsub(self):
-        '''Writes single submission shell script for running the ORIGEN file
+    def write_ORIGEN_qsub(self, path, filename='mixsalts.inp'):
+        '''Writes single submission shell script for running the ORIGEN file in directory path
            on the UTK NE Cluster.
            (file runs within seconds, though do not want to run from head node)
             '''
@@ -599,19 +655,35 @@ export DATA=/opt/scale6.3_data
 
 export HDF5_USE_FILE_LOCKING=FALSE
 
-scalerte -m -N 1 mixsalts.inp'''
-        s = open('runORIGEN.sh', 'w')
+scalerte -m -N 1 ''' + filename
+        s = open(os.path.join(path, 'runORIGEN.sh'), 'w')
         s.write(shell_content)
         s.close()
 
-    def run_ORIGEN_cluster(self):
-      'Submits ORIGEN job.'
-      os.system('qsub runORIGEN.sh')
-
-    def read_newsalt_ORIGEN_f71(self):
-        '''Reads the new mixed fuel salt .f71 file produced by ORIGEN'''
-
-        output = subprocess.run([f"{SCALE_bin_path}/obiwan", "view", "-format=csv", "-prec=10", "-units=atom", "-idform='{:Ee}{:AAA}{:m}'", self.fuel_f71_name], capture_output=True)
+    def run_ORIGEN_cluster(self, path):
+      'Submits ORIGEN job from directory path.'
+      subprocess.run(['qsub', 'runORIGEN.sh'], cwd=path)
+
+    def wait_for_ORIGEN(self, path):
+      'Waits for the ORIGEN job in directory path to write its last .f71 file.'
+      while not os.path.exists(os.path.join(path, self.noblemetal_f71_name)):
+          print("ORIGEN still running...")
+          time.sleep(5.0)
+
+    def read_ORIGEN_batch(self, path, n):
+        '''Returns the mixed salt {nuclide: atoms/barn-cm} of each of the n candidates in the batch_f71_name file
+           in directory path, or None while ORIGEN has not saved all of them yet.'''
+        f71_file = os.path.join(path, self.batch_f71_name)
+        if not os.path.exists(f71_file):
+            return None
+        table, volumes = salt_blend.read_f71(f71_file)
+        if not table or len(next(iter(table.values()))) < n:
+            return None
+        return [salt_blend.position(table, i) for i in range(1, n+1)]
+
+    def read_ORIGEN_f71(self, f71_file):
+        'Returns {nuclide: atom density in atoms/barn-cm} of the single position of an .f71 file saved by ORIGEN.'
+        output = subprocess.run([f"{SCALE_bin_path}/obiwan", "view", "-format=csv", "-prec=10", "-units=atom", "-idform='{:Ee}{:AAA}{:m}'", f71_file], capture_output=True)
         output = output.stdout.decode().split("\n")
         densities = {} # densities[nuclide] = (density at position 0 of f71 file)
         skip = ["case", "step", "time", "power", "flux", "volume"]
@@ -629,6 +701,14 @@ scalerte -m -N 1 mixsalts.inp'''
                 else:
                     nuclide = elem + "-" + str(num)
                 densities[nuclide] = float(data[1])  # Position 0 is isotope names, 1 is data)
+        return densities
+
+    def read_newsalt_ORIGEN_f71(self, path, densities=None):
+        '''Reads the new mixed fuel salt .f71 file produced by ORIGEN in directory path.
+           densities ({nuclide: atoms/barn-cm}, from blend_salts) stands in for the .f71 file when it is given.'''
+
+        if densities is None:
+            densities = self.read_ORIGEN_f71(os.path.join(path, self.fuel_f71_name))
 
         # **** Extract Everything Listed Below: ****
 
@@ -1205,7 +1285,7 @@ scalerte -m -N 1 mixsalts.inp'''
         return new_salt_vector
 
 
-    def read_noblegas_ORIGEN_f71(self):
+    def read_noblegas_ORIGEN_f71(self, path, densities=None):
         '''Reads the gaseous fission product .f71 file produced by ORIGEN.
            Current gaseous fission products tracked include:
 
@@ -1216,26 +1296,12 @@ scalerte -m -N 1 mixsalts.inp'''
 
            NOTE: If user desires to track more gaseous fission products, add
                  them to the list below.
+
+           densities ({nuclide: atoms/barn-cm}, from read_tank) stands in for the .f71 file when it is given.
         '''
 
-        output = subprocess.run([f"{SCALE_bin_path}/obiwan", "view", "-format=csv", "-prec=10", "-units=atom", "-idform='{:Ee}{:AAA}{:m}'", self.gfp_f71_name], capture_output=True)
-        output = output.stdout.decode().split("\n")
-        densities = {} # densities[nuclide] = (density at position 0 of f71 file)
-        skip = ["case", "step", "time", "power", "flux", "volume"]
-        regexp = re.compile(r"(?P<elem>[a-zA-Z]+)(?P<num>\d+)(?P<meta>m)?")
-        for line in output:
-            data = line.split(',')
-            if data[0].strip() in skip:
-                continue
-            elif len(data) > 1:
-                dummy = re.search(regexp, data[0].strip())
-                elem = dummy.group("elem").lower() # convert to all lower cases
-                num = int(dummy.group("num")) # to cut off leading zeros
-                if dummy.group("meta"):
-                    nuclide = elem + "-" + str(num) + "m"   # for metastable isotopes
-                else:
-                    nuclide = elem + "-" + str(num)
-                densities[nuclide] = float(data[1])  # Position 0 is isotope names, 1 is data)
+        if densities is None:
+            densities = self.read_ORIGEN_f71(os.path.join(path, self.gfp_f71_name))
 
         # **** Extract Everything Listed Below: ****
 
@@ -1287,7 +1353,7 @@ scalerte -m -N 1 mixsalts.inp'''
         return noble_gas_vector
 
 
-    def read_noblemetal_ORIGEN_f71(self):
+    def read_noblemetal_ORIGEN_f71(self, path, densities=None):
         '''Reads the noble metal .f71 file produced by ORIGEN.
            Current noble metals tracked include:
 
@@ -1314,26 +1380,12 @@ scalerte -m -N 1 mixsalts.inp'''
 
                  Some other elements (medically relevant isotopes) are currently tracked even though
                  they aren't part of the noble metal list.
+
+           densities ({nuclide: atoms/barn-cm}, from read_tank) stands in for the .f71 file when it is given.
         '''
 
-        output = subprocess.run([f"{SCALE_bin_path}/obiwan", "view", "-format=csv", "-prec=10", "-units=atom", "-idform='{:Ee}{:AAA}{:m}'", self.noblemetal_f71_name], capture_output=True)
-        output = output.stdout.decode().split("\n")
-        densities = {} # densities[nuclide] = (density at position 0 of f71 file)
-        skip = ["case", "step", "time", "power", "flux", "volume"]
-        regexp = re.compile(r"(?P<elem>[a-zA-Z]+)(?P<num>\d+)(?P<meta>m)?")
-        for line in output:
-            data = line.split(',')
-            if data[0].strip() in skip:
-                continue
-            elif len(data) > 1:
-                dummy = re.search(regexp, data[0].strip())
-                elem = dummy.group("elem").lower() # convert to all lower cases
-                num = int(dummy.group("num")) # to cut off leading zeros
-                if dummy.group("meta"):
-                    nuclide = elem + "-" + str(num) + "m"   # for metastable isotopes
-                else:
-                    nuclide = elem + "-" + str(num)
-                densities[nuclide] = float(data[1])  # Position 0 is isotope names, 1 is data)
+        if densities is None:
+            densities = self.read_ORIGEN_f71(os.path.join(path, self.noblemetal_f71_name))
 
         # **** Extract Everything Listed Below: ****
 
@@ -1444,14 +1496,66 @@ scalerte -m -N 1 mixsalts.inp'''
 
         return noble_metal_vector
 
+    ##########################################
+    #   Blend New Salt Fuel Without ORIGEN
+    ##########################################
+
+    def get_norm_factor(self, iter):
+        'Returns the MTiHM the .f71 file of the previous depletion step is normalised to.'
+        if iter == 1:
+            return self.init_MTiHM
+        return self.get_run_state().get(iter-1, 'mtihm', self.step_path(iter-1))
+
+    def get_refuel_grams(self, rvol, iter):
+        '''Returns the refuel masses {nuclide: g} and volume in cm3 for a refuel volume rvol, normalised per MTiHM
+           like the refuelSalt case of the ORIGEN input.'''
+        nuclides = ['li-6', 'li-7', 'be-9', 'f-19', 'u-234', 'u-235', 'u-236', 'u-238']   # Order of get_refuel_wf
+        refuel_dens = self.get_refuel_den()               # Density of refuel salt in g/cm3
+        norm_factor = self.get_norm_factor(iter)
+        norm_total_mass = rvol*refuel_dens/norm_factor    # Normalized total mass of refuel
+        grams = {n: float(wf)*norm_total_mass for n, wf in zip(nuclides, self.get_refuel_wf())}
+        return grams, norm_total_mass/refuel_dens
+
+    def read_burned_f71(self, iter):
+        'Returns the salt_blend.read_f71 table and volumes of the .f71 file depletion step iter starts from (read once).'
+        if iter not in self.f71_tables:
+            self.f71_tables[iter] = salt_blend.read_f71(os.path.join(self.step_path(iter-1), self.f71_name))
+        return self.f71_tables[iter]
+
+    def get_burned_volume(self, iter):
+        '''Returns the volume of the burned salt in the .f71 file, which the refuel volume is added to. It is the
+           volume obiwan prints for the burned salt position, or else the salt volume per MTiHM, plus the refuel fed
+           continuously during the previous step.'''
+        table, volumes = self.read_burned_f71(iter)
+        fed = self.get_feed_volume(iter-1)/self.get_norm_factor(iter)     # Refuel fed continuously during the previous step
+        if volumes is not None and len(volumes) >= self.f71_pos(iter):
+            return volumes[self.f71_pos(iter)-1] + fed
+        return self.triton_salt_volume(iter-1)/self.get_norm_factor(iter) + fed
+
+    def blend_salts(self, rvol, iter):
+        'Returns {nuclide: atoms/barn-cm} of the burned salt mixed with the refuel volume rvol, the same as the ORIGEN blend.'
+        table, volumes = self.read_burned_f71(iter)
+        burned = salt_blend.position(table, self.f71_pos(iter))
+        if rvol == 0:
+            return burned
+        grams, refuel_volume = self.get_refuel_grams(rvol, iter)
+        return salt_blend.blend(burned, self.get_burned_volume(iter), grams, salt_blend.molar_masses(grams), refuel_volume)
+
+    def read_tank(self, iter, pos):
+        '''Returns {nuclide: atoms/barn-cm} of the noble gas (pos 4) or noble metal (pos 6, both of a one-library step) tank in the .f71 file step iter
+           starts from, decayed for tank_decay_hours on the reduced chains of the tank like the noble_gases/noble_metals ORIGEN cases.'''
+        table, volumes = self.read_burned_f71(iter)
+        tank = tank_decay.NOBLE_GASES if pos == salt_blend.NOBLE_GAS_POS else tank_decay.NOBLE_METALS
+        return tank_decay.decay(salt_blend.position(table, self.f71_pos(iter, pos)), self.tank_decay_hours*3600.0, tank)
+
     ##########################################
     #   Write New SCALE Material Blocks
     ##########################################
 
-    def write_SCALE_fuel(self):
-        'Returns a SCALE material composition block for the refuel salt mixed in with the burned salt.'
+    def write_SCALE_fuel(self, path, densities=None):
+        'Returns a SCALE material composition block for the refuel salt mixed in with the burned salt (ORIGEN run in directory path, or the densities of blend_salts).'
         enrich_percent = self.renrich*100    # Enrichment percent for refuel
-        mixed_salt_adens = self.read_newsalt_ORIGEN_f71()  # New mixed salt atom density vector (atoms/barn-cm)
+        mixed_salt_adens = self.read_newsalt_ORIGEN_f71(path, densities)  # New mixed salt atom density vector (atoms/barn-cm)
         isotopes = ["li-6", "li-7", "be-9", "f-19", "u-234", "u-235", "u-236", "u-238", "h-1", "h-2", "h-3", "he-3", "he-4", "be-7",
                     "b-10", "b-11", "n-14", "n-15", "o-16", "o-17", "na-23", "mg-24", "mg-25", "mg-26",
                     "al-27", "si-28", "si-29", "si-30", "p-31", "s-32", "s-33", "cl-35", "cl-37",
@@ -1492,277 +1596,37 @@ scalerte -m -N 1 mixsalts.inp'''
             scale_mat += "{:10s} 1 0  {:>5e} 923.15 end \n".format(isotopes[i], mixed_salt_adens[i])
         return scale_mat
 
-    def write_noblegas_mat(self):
+    def write_noblegas_mat(self, path, densities=None):
         'Returns a SCALE material composition block for the gaseous fission product storage tank.'
-        noble_gas_adens = self.read_noblegas_ORIGEN_f71()  # Gaseous fission product atom density vector in atoms/barn-cm
-        nobles = ["xe-123", "xe-124", "xe-126", "xe-128", "xe-129", "xe-130", "xe-131", "xe-132", "xe-133", "xe-134",
-                            "xe-135", "xe-136", "kr-78", "kr-80", "kr-82", "kr-83", "kr-84", "kr-85", "kr-86", "i-131",
-                            "sr-89", "sr-90", "mo-99", "pr-142", "pr-143", "pm-149"]
+        noble_gas_adens = self.read_noblegas_ORIGEN_f71(path, densities)  # Gaseous fission product atom density vector in atoms/barn-cm
+        nobles = tank_decay.NOBLE_GASES
         noble_mat = "' Gaseous fission product holding tank " + "\n"
         for i in range(26):
             noble_mat += "{:10s} 11 0  {:>5e} 923.15 end \n".format(nobles[i], noble_gas_adens[i])
         return noble_mat
 
-    def write_noblemetal_mat(self):
+    def write_noblemetal_mat(self, path, densities=None):
         'Returns a SCALE material composition block for the noble metal storage tank.'
-        noble_metal_adens = self.read_noblemetal_ORIGEN_f71()  # Noble metal atom density vector in atoms/barn-cm
-        metals = ["zn-64", "zn-65", "zn-66", "zn-67", "zn-68", "zn-69", "zn-70", "zn-71",
-                              "zn-72", "nb-93", "nb-94", "nb-95", "rh-103", "rh-105", "in-113", "in-115",
-                              "ga-69", "ga-71", "mo-92", "mo-94", "mo-95", "mo-96", "mo-97", "mo-98",
-                              "mo-99", "mo-100", "pd-102", "pd-104", "pd-105", "pd-106", "pd-107", "pd-108",
-                              "pd-110", "sn-112", "sn-113", "sn-114", "sn-115", "sn-116", "sn-117", "sn-118",
-                              "sn-119", "sn-120", "sn-122", "sn-123", "sn-124", "sn-125", "sn-126", "ge-70",
-                              "ge-72", "ge-73", "ge-74", "ge-76", "tc-99", "ag-107", "ag-109", "ag-111",
-                              "sb-121", "sb-123", "sb-124", "sb-125", "sb-126", "as-74", "as-75", "ru-96",
-                              "ru-98", "ru-99", "ru-100", "ru-101", "ru-102", "ru-103", "ru-104", "ru-105",
-                              "ru-106", "cd-106", "cd-108", "cd-110", "cd-111", "cd-112", "cd-113",
-                              "cd-114", "cd-116", "i-131", "sr-89", "sr-90", "pr-142", "pr-143", "pm-149"]
+        noble_metal_adens = self.read_noblemetal_ORIGEN_f71(path, densities)  # Noble metal atom density vector in atoms/barn-cm
+        metals = tank_decay.NOBLE_METALS
         metal_mat = "' Noble metal holding tank " + "\n"
         for i in range(87):
             metal_mat += "{:10s} 12 0  {:>5e} 923.15 end \n".format(metals[i], noble_metal_adens[i])
         return metal_mat
 
-    ##################################
-    #      Get New MTiHM Value
-    ##################################
-
-    def get_burned_salt_MTHM(self):
-        'Returns the masses in grams of MTHM actinides (excluding Actinium - SCALE does not consider Actinium as part of MTHM) in the burned salt.'
-        output = subprocess.run([f"{SCALE_bin_path}/obiwan", "view", "-format=csv", "-prec=10", "-units=gram", "-idform='{:Ee}{:AAA}{:m}'", self.f71_name], capture_output=True)
-        output = output.stdout.decode().split("\n")
-        densities = {} # densities[nuclide] = (density at position 0 of f71 file)
-        skip = ["case", "step", "time", "power", "flux", "volume"]
-        regexp = re.compile(r"(?P<elem>[a-zA-Z]+)(?P<num>\d+)(?P<meta>m)?")
-        for line in output:
-            data = line.split(',')
-            if data[0].strip() in skip:
-                continue
-            elif len(data) > 1:
-                dummy = re.search(regexp, data[0].strip())
-                elem = dummy.group("elem").lower() # convert to all lower cases
-                num = int(dummy.group("num")) # to cut off leading zeros
-                if dummy.group("meta"):
-                    nuclide = elem + "-" + str(num) + "m"   # for metastable isotopes
-                else:
-                    nuclide = elem + "-" + str(num)
-                densities[nuclide] = float(data[2])  # The [2] here is what causes the code to return only the densities at position 2 of the f71 file (position 0 is isotope names, 1 is BOC data)
-        # **** Sum all Actinide HM masses: ****
-        u231 = densities['u-231']
-        u232 = densities['u-232']
-        u233 = densities['u-233']
-        u234 = densities['u-234']
-        u235 = densities['u-235']
-        u235m = densities['u-235m']
-        u236 = densities['u-236']
-        u237 = densities['u-237']
-        u238 = densities['u-238']
-        u239 = densities['u-239']
-        th226 = densities['th-226']
-        th227 = densities['th-227']
-        th228 = densities['th-228']
-        th229 = densities['th-229']
-        th230 = densities['th-230']
-        th231 = densities['th-231']
-        th232 = densities['th-232']
-        th233 = densities['th-233']
-        th234 = densities['th-234']
-        pa228 = densities['pa-228']
-        pa229 = densities['pa-229']
-        pa230 = densities['pa-230']
-        pa231 = densities['pa-231']
-        pa232 = densities['pa-232']
-        pa233 = densities['pa-233']
-        pa234 = densities['pa-234']
-        pa234m = densities['pa-234m']
-        pa235 = densities['pa-235']
-        pu236 = densities['pu-236']
-        pu237 = densities['pu-237']
-        pu237m = densities['pu-237m']
-        pu238 = densities['pu-238']
-        pu239 = densities['pu-239']
-        pu240 = densities['pu-240']
-        pu241 = densities['pu-241']
-        pu242 = densities['pu-242']
-        pu243 = densities['pu-243']
-        pu244 = densities['pu-244']
-        pu245 = densities['pu-245']
-        pu246 = densities['pu-246']
-        pu247 = densities['pu-247']
-        np234 = densities['np-234']
-        np235 = densities['np-235']
-        np236 = densities['np-236']
-        np236m = densities['np-236m']
-        np237 = densities['np-237']
-        np238 = densities['np-238']
-        np239 = densities['np-239']
-        np240 = densities['np-240']
-        np240m = densities['np-240m']
-        np241 = densities['np-241']
-        am239 = densities['am-239']
-        am240 = densities['am-240']
-        am241 = densities['am-241']
-        am242 = densities['am-242']
-        am242m = densities['am-242m']
-        am243 = densities['am-243']
-        am244 = densities['am-244']
-        am244m = densities['am-244m']
-        am245 = densities['am-245']
-        am246 = densities['am-246']
-        am246m = densities['am-246m']
-        am247 = densities['am-247']
-        cm240 = densities['cm-240']
-        cm241 = densities['cm-241']
-        cm242 = densities['cm-242']
-        cm243 = densities['cm-243']
-        cm244 = densities['cm-244']
-        cm245 = densities['cm-245']
-        cm246 = densities['cm-246']
-        cm247 = densities['cm-247']
-        cm248 = densities['cm-248']
-        cm249 = densities['cm-249']
-        cm250 = densities['cm-250']
-        cm251 = densities['cm-251']
-        es251 = densities['es-251']
-        es252 = densities['es-252']
-        es253 = densities['es-253']
-        es254 = densities['es-254']
-        es254m = densities['es-254m']
-        es255 = densities['es-255']
-        bk245 = densities['bk-245']
-        bk246 = densities['bk-246']
-        bk247 = densities['bk-247']
-        bk248 = densities['bk-248']
-        bk249 = densities['bk-249']
-        bk250 = densities['bk-250']
-        bk251 = densities['bk-251']
-        cf246 = densities['cf-246']
-        cf248 = densities['cf-248']
-        cf249 = densities['cf-249']
-        cf250 = densities['cf-250']
-        cf251 = densities['cf-251']
-        cf252 = densities['cf-252']
-        cf253 = densities['cf-253']
-        cf254 = densities['cf-254']
-        cf255 = densities['cf-255']
-
-
-        HMs = (u231 + u232 + u233 + u234 + u235 + u235m + u236 + u237 + u238 + u239 + th226 + th227 + th228 + th229 + th230 + th231 + th232
-        + th233 + th234 + pa228 + pa229 + pa230 + pa231 + pa232 + pa233 + pa234 + pa234m + pa235 + pu236 + pu237 + pu237m + pu238 + pu239
-        + pu240 + pu241 + pu242 + pu243 + pu244 + pu245 + pu246 + pu247 + np234 + np235 + np236 + np236m + np237 + np238 + np239 + np240
-        + np240m + np241 + am239 + am240 + am241 + am242 + am242m + am243 + am244 + am244m + am245 + am246 + am246m + am247 + cm240 + cm241
-        + cm242 + cm243 + cm244 + cm245 + cm246 + cm247 + cm248 + cm249 + cm250 + cm251 + es251 + es252 + es253 + es254 + es254m + es255
-        + bk245 + bk246 + bk247 + bk248 + bk249 + bk250 + bk251 + cf246 + cf248 + cf249 + cf250 + cf251 + cf252 + cf253 + cf254 + cf255)   # Total heavy metal mass in grams
-
-        MTHMs = HMs*1e-6     # Convert HMs mass in grams to MTHMs
-
-        return MTHMs
-
-    def get_refuel_MTHM(self, rvol):
-        refuel_wf = self.get_refuel_wf()             # Isotopic weight fraction list for refuel salt
-        refuel_dens = self.get_refuel_den()          # Density of refuel salt in g/cm3
-
-        total_refuel_mass = rvol*refuel_dens  # Total mass of refuel added in depletion step
-
-        # Calculate mass of each isotope in the refuel:
-        iso_mass = [i * total_refuel_mass for i in refuel_wf]
-        u234 = iso_mass[4]    # U-234 mass in grams
-        u235 = iso_mass[5]    # U-235 mass in grams
-        u236 = iso_mass[6]    # U-236 mass in grams
-        u238 = iso_mass[7]    # U-238 mass in grams
-        refuel_HM = (u234 + u235 + u236 + u238)      # Total refuel mass of HMs in grams
-        refuel_MTHM = refuel_HM*1e-6                 # Total refuel MTHM
-
-        return refuel_MTHM
-
-    def write_MTiHM_file(self, iter):
-        '''Correct for .f71 mass normalization to find the new MTiHM value for the current depletion step and
-           saves it to a .out file to be read in the next depletion step.'''
-
-        main_path = self.deck_path + '/dep_step_{}'.format(iter)
-        if iter == 1:
-            os.chdir(self.BOC_f71_path)
-        else:
-            last_dep_step = iter - 1
-            last_dep_step_path = self.deck_path + '/dep_step_{}'.format(last_dep_step)
-            os.chdir(last_dep_step_path)
-        bs_MTHM = self.get_burned_salt_MTHM()
-        os.chdir(main_path)
-        refuel_MTHM = self.get_refuel_MTHM(iter)
-
-        if iter == 1:
-            true_bs_MTHM = bs_MTHM*self.init_MTiHM
-            os.chdir(main_path)
-            tot_MTiHM = true_bs_MTHM + refuel_MTHM
-            f = open("MTiHM_dep_step_{}.txt".format(iter), 'w')
-            f.write("{}".format(tot_MTiHM))
-            f.close()
-        else:
-            os.chdir(last_dep_step_path)
-            filename = "MTiHM_dep_step_{}.txt".format(iter-1)
-            data = genfromtxt("{}".format(filename), delimiter='')
-            true_bs_MTHM = bs_MTHM*data
-            tot_MTiHM = true_bs_MTHM + refuel_MTHM
-            if self.vol_doubled == True:
-                new_tot_MTiHM = tot_MTiHM/2
-            else:
-                new_tot_MTiHM = tot_MTiHM
-            os.chdir(main_path)
-            f = open("MTiHM_dep_step_{}.txt".format(iter), 'w')
-            f.write("{}".format(new_tot_MTiHM))
-            f.close()
-
-    #################################
-    #        Add in Refuel
-    #################################
-
-    def write_fuel_salt_volume(self, rvol, iter, main_path):
-        'Writes a .out file with the total fuel salt volume for the current depletion step.'
-        current_dep_step_path = self.deck_path + '/dep_step_{}'.format(iter)
-        last_dep_step_path = self.deck_path + '/dep_step_{}'.format(iter-1)
-        self.vol_doubled = False  # Check parameter; changed to True if the volume has doubled. Used for halving the MTiHM value if the volume has doubled (add line to MTiHM file writing function that does this.)
-        if iter == 1:
-            volume = self.V0
-            total_vol = volume + rvol    # Total fuel salt volume in cm^3
-            if total_vol >= 2*self.V0:
-                self.vol_doubled = True
-                new_vol = total_vol/2
-            else:
-                new_vol = total_vol
-            f = open("Salt_volume_dep_step_{}.out".format(iter), 'w')
-            f.write("{}".format(new_vol))
-            f.close()
-        else:
-            os.chdir(last_dep_step_path)
-            filename = "Salt_volume_dep_step_{}.out".format(iter-1)
-            volume = genfromtxt("{}".format(filename), delimiter='')
-            total_vol = volume + rvol
-            if total_vol >= 2*self.V0:
-                self.vol_doubled = True
-                new_vol = total_vol/2
-            else:
-                new_vol = total_vol
-
-            os.chdir(current_dep_step_path)
-            os.chdir(main_path)
-            f = open("Salt_volume_dep_step_{}.out".format(iter), 'w')
-            f.write("{}".format(new_vol))
-            f.close()
-
-    def add_refuel_volume(self, iter):
-        'Returns h, the total fuel salt height in the gas plenum after refuel salt has been added.'
-        'The V0 variable is the initial volume from the BOC core.'
-        filename = "Salt_volume_dep_step_{}.out".format(iter)
-        volume = genfromtxt("{}".format(filename), delimiter='')   # Total fuel salt volume for current depletion step
-        total_refuel_vol = volume - self.V0
-        h = (total_refuel_vol)/(math.pi*200**2)
-        return h
+    def read_burned_densities(self, iter):
+        'Returns {nuclide: atoms/barn-cm} of the burned salt depletion step iter starts from, out of the .f71 table read for blending.'
+        table, volumes = self.read_burned_f71(iter)
+        return salt_blend.position(table, self.f71_pos(iter))
 
     ########################################
     #      Write Parallel KENO Decks
     ########################################
 
     def copy_f71_to_dir(self, iter, targetpath):
-        'Copies the ThEIRENE.f71 file from the previous depletion step into the current directory (used for copying the ThEIRENE.f71 file into KENO directories)'
+        '''Stages the ThEIRENE.f71 file from the previous depletion step in the current directory (used for the KENO
+           and ORIGEN directories). It is hard-linked, reflinked or symlinked where the filesystem allows, and only
+           copied otherwise (see staging.py).'''
 
       # Define path to ThEIRENE.f71 file from previous depletion step:
 
@@ -1773,13 +1637,12 @@ scalerte -m -N 1 mixsalts.inp'''
 
         filename = 'ThEIRENE.f71'
 
-        shutil.copy(originpath+filename, targetpath)
+        return staging.stage(originpath+filename, targetpath)
 
 
     def write_qsub_file(self, iter):
         'Writes a single qsub file outside of the refuel directories.'
-        deck_path = self.deck_path + '/dep_step_{}'.format(iter)
-        os.chdir(deck_path)
+        deck_path = self.step_path(iter)
         shell_content = '''
 #!/bin/bash
 
@@ -1798,64 +1661,71 @@ export DATA=/opt/scale6.3_data
 export HDF5_USE_FILE_LOCKING=FALSE
 
 scalerte -m -N 32 ThEIRENE.inp'''
-        s = open(self.qsub_name, 'w')
+        s = open(os.path.join(deck_path, self.qsub_name), 'w')
         s.write(shell_content)
         s.close()
 
-    def write_KENO_decks(self, iter):
+    def run_ORIGEN_KENO(self, rvol, iter, path):
+        '''Blends the refuel volume rvol into the burned salt with ORIGEN in the KENO directory path and returns the
+           SCALE material block of the mixed salt.'''
+        self.write_ORIGEN_KENO(rvol, iter, path)   # Write ORIGEN for the refuel salt amount (for mixing with burned salt)
+        self.copy_f71_to_dir(iter, path)           # ORIGEN loads the burned salt from ThEIRENE.f71 next to it
+        self.write_ORIGEN_qsub(path)
+        self.run_ORIGEN_cluster(path)
+        self.wait_for_ORIGEN(path)
+        return self.write_SCALE_fuel(path)
+
+    def run_ORIGEN_batch(self, rvols, iter, path):
+        '''Blends every refuel volume in rvols into the burned salt with a single ORIGEN run in directory path and
+           returns the SCALE material block of each mixed salt.'''
+        self.write_ORIGEN_batch(rvols, iter, path)
+        self.copy_f71_to_dir(iter, path)           # ORIGEN loads the burned salt from ThEIRENE.f71 next to it
+        self.write_ORIGEN_qsub(path, self.batch_inp_name)
+        self.run_ORIGEN_cluster(path)
+        mixed = self.read_ORIGEN_batch(path, len(rvols))
+        while mixed is None:
+            print("ORIGEN still running...")
+            time.sleep(5.0)
+            mixed = self.read_ORIGEN_batch(path, len(rvols))
+        return [self.write_SCALE_fuel(path, densities) for densities in mixed]
+
+    def write_KENO_decks(self, iter, rvols=None):
         'Creates a directory for each refuel amount and writes a KENO deck there.'
         run_path = self.deck_path + '/dep_step_{}'.format(iter)            # Make the depletion step directory
-        os.mkdir(run_path)
-        os.chdir(run_path)
-        for x in range(len(self.rvols)):
+        if rvols is None:
+            rvols = self.get_search_rvols(iter)
+        self.search_rvols = rvols
+        if not os.path.isdir(run_path):       # Already there when the adaptive search falls back to the wide bracket
+            os.mkdir(run_path)
+        batch_fuel = {}     # SCALE fuel blocks of the candidates blended in one ORIGEN run
+        if self.blend_engine == 'origen' and self.origen_batch:
+            todo = [r for r in rvols if not os.path.exists(os.path.join(run_path, f'refuel_{r:5.01f}', self.deck_name))]
+            if todo:
+                batch_fuel = dict(zip(todo, self.run_ORIGEN_batch(todo, iter, run_path)))
+        for x in range(len(rvols)):
 #            os.chdir('.')
             #########################################################################################
             #         Write an ORIGEN File for Each of the Refuel Salt Amount Directories
             #########################################################################################
 
-            path_KENO = f'refuel_{self.rvols[x]:5.01f}'
+            path_KENO = os.path.join(run_path, f'refuel_{rvols[x]:5.01f}')
+            if os.path.exists(os.path.join(path_KENO, self.deck_name)):
+                while not os.path.exists(os.path.join(path_KENO, 'keffdata.out')):    # Submitted before a restart; only wait for it to finish
+                    print("KENO still running...")
+                    time.sleep(10.0)
+                continue
             if not os.path.isdir(path_KENO):
                 os.mkdir(path_KENO)
-            os.chdir(path_KENO)
-
-            self.write_ORIGEN_KENO(self.rvols[x], iter, os.getcwd())   # Write ORIGEN for each refuel salt amount (for mixing with burned salt)
 
-#           ----- ORIGEN file is written in each rvol directory; however, in order to properly read the .f71, it must be executed in the prevous dep_step directory
-
-#            self.run_ORIGEN_cluster(iter)    # Run ORIGEN from the previous dep_step directory
-
-          # Define path to ThEIRENE.f71 file from previous depletion step:
-
-            if iter == 1:
-                originpath = self.BOC_f71_path
+            if self.blend_engine == 'numpy':
+                scale_fuel = self.write_SCALE_fuel(path_KENO, self.blend_salts(rvols[x], iter))
+            elif rvols[x] in batch_fuel:
+                scale_fuel = batch_fuel[rvols[x]]
             else:
-                originpath = self.deck_path + '/dep_step_{}/'.format(iter-1)
-
-            filename = 'ThEIRENE.f71'
+                scale_fuel = self.run_ORIGEN_KENO(rvols[x], iter, path_KENO)
 
-            shutil.copy(originpath+filename, os.getcwd())
 
-            self.write_ORIGEN_qsub()
-
-            self.run_ORIGEN_cluster()
-
-            # Wait for ORIGEN to finish:
-
-            origencheck = False
-            while origencheck == False:
-              if os.path.exists('./noble_metals.f71'):
-                  origencheck = True
-                  break
-              else:
-                  origencheck = False
-                  print("ORIGEN still running...")
-                  time.sleep(5.0)
-
-            scale_fuel = self.write_SCALE_fuel()
-
-
-            self.write_fuel_salt_volume(self.rvols[x],iter, path_KENO)
-            h = 440.5 + self.add_refuel_volume(iter)
+            h = 440.5 + self.add_refuel_volume(self.new_salt_volume(rvols[x], iter))
             keno_deck = f'''=csas6 parm=(   )
 ThEIRENE SCALE/CSAS model, UF4 mol% = {self.UF4molpct}, ThUF4 mol% = {self.ThF4molpct}, and refuel UF4 mol% = {self.refuelUF4molpct} & enrichment {self.renrich}
 ce_v7.1
@@ -2155,7 +2025,7 @@ end data
 end
         '''
 
-            fout = open(self.deck_name, "w")  # Dump deck into file
+            fout = open(os.path.join(path_KENO, self.deck_name), "w")  # Dump deck into file
             fout.write(keno_deck)
             fout.close()
 
@@ -2179,17 +2049,17 @@ export HDF5_USE_FILE_LOCKING=FALSE
 scalerte -m -N 32 ThEIRENE.inp
 awk '/best est/{print $6" "$10}' ThEIRENE.out > keffdata.out
 '''
-            q = open(self.qsub_name, 'w')
+            q = open(os.path.join(path_KENO, self.qsub_name), 'w')
             q.write(shell_content)
             q.close()
 
-            os.system('qsub runThEIRENE-Scale.sh')  # Submit job
+            subprocess.run(['qsub', self.qsub_name], cwd=path_KENO)  # Submit job
 
             # Wait for the KENO job to finish:
 
             kenocheck = False
             while kenocheck == False:
-                if os.path.exists('./keffdata.out'):
+                if os.path.exists(os.path.join(path_KENO, 'keffdata.out')):
                   kenocheck = True
                   break
                 else:
@@ -2199,8 +2069,6 @@ awk '/best est/{print $6" "$10}' ThEIRENE.out > keffdata.out
 
           # When KENO job is finished, move on to next one
 
-            os.chdir('..')
-
     def write_conv_data(self, iter):
         'Writes the shell script convert-data.sh that extracts k-eff data from the finished KENO runs and prints them to file data-temp.out.'
         shell_main_path = self.deck_path + '/dep_step_{}'.format(iter)
@@ -2208,114 +2076,71 @@ awk '/best est/{print $6" "$10}' ThEIRENE.out > keffdata.out
 
 grep 'best estimate' refuel_*/ThEIRENE.out | sed -E -e s/^refuel.//g -e 's/.ThEIRENE.*eff//g'  -e 's/\+ or \-//g' -e 's/\*\*\*//g' -e 's/\s+/ /g' | sort -g  > data-temp.out
 '''
-        os.chdir(shell_main_path)
-        f = open("convert-data.sh", 'w')
+        f = open(os.path.join(shell_main_path, "convert-data.sh"), 'w')
         f.write(content)
         f.close()
 
     def add_shell_permission_cd(self, iter):
       'Gives permission to execute the convert-data.sh shell script.'
-      main_path = self.deck_path + '/dep_step_{}'.format(iter)
-      os.chdir(main_path)
-      os.system('chmod +x convert-data.sh')
+      self.add_exec_permission(os.path.join(self.step_path(iter), 'convert-data.sh'))
 
     def convert_data(self, iter):
         'Submits the convert-data.sh shell script to extract KENO k-eff data and print to data-temp.out file.'
-        os.system(self.deck_path + '/dep_step_{}/convert-data.sh'.format(iter))
+        main_path = self.step_path(iter)
+        subprocess.run([os.path.join(main_path, 'convert-data.sh')], cwd=main_path)   # The script greps paths relative to the step directory
 
     def get_crit_refuel(self, iter):
         'Fits the k-eff data and returns the critical refuel amount.'
-        main_path = self.deck_path + '/dep_step_{}'.format(iter)
-        os.chdir(main_path)
-
-        filename = "data-temp.out"
-        data = genfromtxt("{}".format(filename), delimiter='')
-
-        refuel = data[:,0]     # Refuel amounts in cm3
-        keff = data[:,1]       # k-eff data
-        kerr = data[:,2]       # k-eff error
-        # Fit the data:
-        m, b = np.polyfit(refuel, keff, 1)
-        self.crit_refuel = (1.0 - b) / m     # Refuel amount for which k-eff = 1
-
-        ##### Check if critical refuel amount is negative #####
-
-        if self.crit_refuel < 1:
-            self.crit_refuel = 0
-        else:
-            pass
-
-        f = open("crit_refuel_{}.out".format(iter), 'w')
-        f.write("{}".format(self.crit_refuel))
-        f.close()
-
-        return self.crit_refuel
+        filename = os.path.join(self.step_path(iter), "data-temp.out")
+        data = genfromtxt(filename, delimiter='')
+        return self.fit_crit_refuel(iter, data)
 
         #########################################################################
         #              Write New TRITON Deck With Crit Refuel
         #########################################################################
 
-    def write_new_power_dens(self,iter):
-        'Uses the normalization factor from the previous depletion step to convert the normalized MTHM mass to true MTiHM mass, then calculates the new power density.'
-        path = self.deck_path + '/dep_step_{}'.format(iter)
-        os.chdir(path)
-        filename = "MTiHM_dep_step_{}.txt".format(iter)
-        MTiHM = genfromtxt("{}".format(filename), delimiter='')   # New MTiHM value calculated and written to .out file for current depletion step
-        new_power_dens = self.power/MTiHM
-        return new_power_dens
-
     def write_new_TRITON_deck(self, iter):
         """Writes a new TRITON deck for the current depletion step."""
 
-        rvol = self.get_crit_refuel(iter)
+        rvol = self.read_crit_refuel(iter)      # Saved by get_crit_refuel (or reuse_feed_rate)
+        origen_path = self.step_path(iter-1)     # ORIGEN runs next to the previous step's .f71 file
 
-        if iter == 1:
-            os.chdir(self.BOC_f71_path)
+        if self.blend_engine == 'numpy':
+            # ----- Blend in NumPy and take the tanks straight from ThEIRENE.f71: -----
+            new_scale_fuel = self.write_SCALE_fuel(origen_path, self.blend_salts(rvol, iter))
+            new_noblegas_mat = self.write_noblegas_mat(origen_path, self.read_tank(iter, salt_blend.NOBLE_GAS_POS))
+            new_noblemetal_mat = self.write_noblemetal_mat(origen_path, self.read_tank(iter, salt_blend.NOBLE_METAL_POS))
         else:
-            last_dep_step = iter - 1
-            last_dep_step_path = self.deck_path + '/dep_step_{}'.format(last_dep_step)
-            os.chdir(last_dep_step_path)
+            # --- Write and execute ORIGEN file for ThEIRENE.f71 using critical refuel amount
 
-        # --- Write and execute ORIGEN file for ThEIRENE.f71 using critical refuel amount
+            # ---------- CHECK IF CRITICAL REFUEL IS ZERO: ----------
 
-        # ---------- CHECK IF CRITICAL REFUEL IS ZERO: ----------
-
-        if rvol == 0:
-            self.write_ORIGEN_zerocrit(iter)
-        else:
-            self.write_ORIGEN(rvol, iter)
+            if rvol == 0:
+                self.write_ORIGEN_zerocrit(iter)
+            else:
+                self.write_ORIGEN(rvol, iter)
 
-        self.write_ORIGEN_qsub()
+            self.write_ORIGEN_qsub(origen_path)
 
-        self.run_ORIGEN_cluster()
+            self.run_ORIGEN_cluster(origen_path)
 
-        # Wait for ORIGEN to finish:
+            # Wait for ORIGEN to finish:
 
-        origencheck = False
-        while origencheck == False:
-          if os.path.exists('./noble_metals.f71'):
-              origencheck = True
-              break
-          else:
-              origencheck = False
-              print("ORIGEN still running...")
-              time.sleep(5.0)
+            self.wait_for_ORIGEN(origen_path)
 
-        # ----- Write new material blocks: -----
+            # ----- Write new material blocks: -----
 
-        new_scale_fuel = self.write_SCALE_fuel()          # New fuel salt
-        new_noblegas_mat = self.write_noblegas_mat()      # New noble gas comp
-        new_noblemetal_mat = self.write_noblemetal_mat()  # New noble metal comp
+            new_scale_fuel = self.write_SCALE_fuel(origen_path)          # New fuel salt
+            new_noblegas_mat = self.write_noblegas_mat(origen_path)      # New noble gas comp
+            new_noblemetal_mat = self.write_noblemetal_mat(origen_path)  # New noble metal comp
 
 
-        main_path = self.deck_path + '/dep_step_{}'.format(iter)
-        os.chdir(main_path)
-        self.write_fuel_salt_volume(rvol, iter, main_path)
-        h = 440.5 + self.add_refuel_volume(iter)
-        # Save Height to .out File
-        f = open("TRITON_height_step_{}.txt".format(iter), 'w')
-        f.write("{}".format(h))
-        f.close()
+        main_path = self.step_path(iter)
+        fed = self.plan_feed_volume(iter)       # Refuel fed through the timetable during the step (feed_mode 'continuous')
+        salt_volume = self.write_fuel_salt_volume(rvol, iter, fed)
+        h = 440.5 + self.add_refuel_volume(salt_volume)
+        feed_mat, feed_mix, feed_flow = self.write_feed(iter, fed, salt_volume)
+        self.get_run_state().set(iter, triton_height=h)
 
         self.write_MTiHM_file(iter)
 
@@ -2353,16 +2178,16 @@ wtptHastelloy 2 8.89 5
 
 {new_noblemetal_mat}
 
-end comp
+{feed_mat}end comp
 
 ' Mixtures to deplete
 read depletion
-  1 decayonly 11 12 end
+  1 decayonly 11 12{feed_mix} end
 end depletion
 
 ' Burnup values. Power in MW/MTiHM
 read burndata
-   power={new_power_dens} burn={self.dep_step} nlib=1 end
+   power={new_power_dens} burn={self.get_step_days(iter)} nlib={self.choose_nlib(iter)} end
 end burndata
 
 read timetable
@@ -2396,7 +2221,7 @@ read timetable
     time       0.0 end
     multiplier 1.0 end
   end flow
-end timetable
+{feed_flow}end timetable
 
 read model
 
@@ -2672,8 +2497,7 @@ end
         main_path = self.deck_path + '/dep_step_{}'.format(iter)
         try:
 #            os.makedirs(self.deck_path, exist_ok=True)
-            os.chdir(main_path)
-            fh = open(self.deck_name, 'w')
+            fh = open(os.path.join(main_path, self.deck_name), 'w')
             fh.write(new_triton_deck)
             fh.close()
         except IOError as e:
@@ -2682,9 +2506,7 @@ end
 
     def run_SCALE(self, iter):
       """Submits SCALE job."""
-      run_path = self.deck_path + '/dep_step_{}'.format(iter)           # Make the depletion step directory
-      os.chdir(run_path)
-      os.system('qsub runThEIRENE-Scale.sh')
+      subprocess.run(['qsub', self.qsub_name], cwd=self.step_path(iter))
 
 
 ###################################################################################################################################
@@ -2692,60 +2514,59 @@ end
 if __name__ == '__main__':
     print("This is a Th-EIRENE refuel burn.")
     input("Press Ctrl+C to quit, or press enter to run it.")
-    decks = ThEIRENE_Deck()
+    decks = ThEIRENE_Deck(*sys.argv[1:2])    # Optional campaign root directory (default: current directory)
+    state = CampaignState(decks.deck_path + '/campaign_state.json')    # Resumes an interrupted campaign
     iter = np.arange(1, 366, 1)        # Depletion steps
     for i in iter:
-        decks.write_KENO_decks(i)
-        decks.write_conv_data(i)
-        decks.add_shell_permission_cd(i)
-        print("Extracting k-eff data for depletion step {}...".format(i))
-        decks.convert_data(i)
-        print("***** Writing TRITON deck...")
-        decks.write_new_TRITON_deck(i)
-        decks.write_qsub_file(i)
-        decks.run_SCALE(i)
-        print("Running TRITON deck...")
+        if decks.horizon_reached(i-1):
+            print("Reached {:g} days after depletion step {}.".format(decks.campaign_days(i-1), i-1))
+            break
+        if state.done(i, 'f71_ready'):
+            continue
+        if state.stage(i) is not None:
+            print("Resuming depletion step {} after stage '{}'...".format(i, state.stage(i)))
+        if not state.done(i, 'crit_found') and decks.reuse_feed_rate(i):
+            state.mark(i, 'crit_found')     # TRITON stayed critical on the last feed rate; no KENO search
+        if not state.done(i, 'keno_done'):
+            decks.write_KENO_decks(i)       # Waits for each KENO run; skips candidates finished before a restart
+            decks.write_conv_data(i)
+            decks.add_shell_permission_cd(i)
+            state.mark(i, 'decks_written')
+            print("Extracting k-eff data for depletion step {}...".format(i))
+            decks.convert_data(i)
+            state.mark(i, 'keno_done')
+        if not state.done(i, 'crit_found'):
+            decks.get_crit_refuel(i)
+            if decks.search_mode == 'adaptive' and not decks.crit_bracketed:
+                print("Critical refuel escaped the adaptive bracket; running the wide bracket for depletion step {}...".format(i))
+                decks.write_KENO_decks(i, decks.rvols)
+                decks.convert_data(i)
+                decks.get_crit_refuel(i)    # Refit with the wide bracket; replaces the extrapolated root
+            state.mark(i, 'crit_found')
+        if not state.done(i, 'triton_submitted'):
+            print("***** Writing TRITON deck...")
+            decks.write_new_TRITON_deck(i)
+            decks.write_qsub_file(i)
+            decks.run_SCALE(i)
+            state.mark(i, 'triton_submitted')
+            print("Running TRITON deck...")
 
       # ----- Check to see if TRITON is finished running. Wait for it to finish if not. -----
 
-        main_path = decks.deck_path + '/dep_step_{}'.format(i)
-        os.chdir(main_path)
         check = False       # Initialize check
         while check == False:
-          if os.path.exists('./ThEIRENE.f71'):
+          if os.path.exists(os.path.join(decks.step_path(i), decks.f71_name)):
             check = True
             break
           else:
               check = False
               print("The atoms are still working; please stand by...")
               time.sleep(10.0)
+        state.mark(i, 'f71_ready')
 
     print("*******************************************")
     print("All done! The atoms are very happy now :D")
     print("*******************************************")
 
 
-if False:  # old main
-    print("This module generates and runs parallel KENO decks for different refuel volume additions.")
-    input("Press Ctrl+C to quit, or press enter to test it.")
-    iter = int(input("Enter the depletion step : "))
-    decks = EIRENE_Deck()
-    print("***** Writing and running ORIGEN...")
-#    decks.write_ORIGEN(iter)
-#    decks.write_ORIGEN_qsub()
-#    decks.run_ORIGEN_locally(iter)
-#    newsalt = decks.read_newsalt_ORIGEN_f71()      # Check
-#    noblegases = decks.read_noblegas_ORIGEN_f71()  # Check
-#    nobmetal = decks.read_noblemetal_ORIGEN_f71()  # Check
-    print("***** Writing KENO decks...")
-    decks.write_KENO_decks(iter)
-    decks.write_conv_data(iter)
-    decks.add_shell_permission_cd(iter)
-    print("Extracting k-eff data for depletion step {}...".format(iter))
-    decks.convert_data(iter)
-    print("***** Writing TRITON deck...")
-    decks.write_new_TRITON_deck(iter)
-    decks.write_qsub_file(iter)
-    decks.run_SCALE(iter)
-
 ###################################################################################################################################
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#
+#              Th-EIRENE Fuel Salt Blending Without ORIGEN
+#
+#     By: C. Erika Moss, Ondrej Chvala
+#
+#     The ORIGEN input of write_ORIGEN/write_ORIGEN_KENO only loads the
+#     burned salt, the noble gas and the noble metal tanks from ThEIRENE.f71
+#     (positions 2, 4 and 6), adds the refuel salt given in grams, and blends
+#     burned salt + refuel over a 1e-6 h decay. A blend is a mass balance:
+#     the atoms and the volumes of the two materials add up, so the mixed
+#     atom density of each nuclide is
+#
+#         N = (N_burned*V_burned + m_refuel/M*N_A) / (V_burned + V_refuel)
+#
+#     with the burned salt and refuel masses and volumes normalised per MTiHM
+#     like in the ORIGEN input. The functions below do that in NumPy from a
+#     single obiwan read of ThEIRENE.f71, so ORIGEN only runs when it is
+#     asked for.
+#
+#     Check against a step where ORIGEN did run (the directory with its
+#     mixsalts.inp, ThEIRENE.f71 and updated_core_salt.f71):
+#         python salt_blend.py ~/ThEIRENE_Batch/dep_step_4
+#
+###############################################################################
+
+import os
+import re
+import sys
+import subprocess
+import numpy as np
+
+SCALE_bin_path: str = os.getenv('SCALE_BIN', '/opt/scale6.3.1/bin/')
+
+AVOGADRO: float = 0.6022140857    # Avogadro's number times 1e-24: (mol/cm3) -> (atoms/barn-cm)
+BURNED_POS: int = 2               # Position of the burned fuel salt in ThEIRENE.f71 (one-library step, see end_pos)
+NOBLE_GAS_POS: int = 4            # Position of the noble gas tank in ThEIRENE.f71
+NOBLE_METAL_POS: int = 6          # Position of the noble metal tank in ThEIRENE.f71
+
+# Atomic masses (g/mol, AME2016) of the refuel salt nuclides
+MOLAR_MASS = {'li-6': 6.0151228874, 'li-7': 7.0160034366, 'be-9': 9.012183065, 'f-19': 18.99840316273,
+              'u-234': 234.0409523, 'u-235': 235.0439301, 'u-236': 236.0455682, 'u-238': 238.0507884}
+
+
+def read_f71(f71_file, units='atom'):
+    '''Reads every position of a .f71 file with one obiwan call.
+       Returns ({nuclide: array of the values at positions 1, 2, ...}, array of the volumes of each position
+       or None if obiwan does not print them).'''
+    output = subprocess.run([f"{SCALE_bin_path}/obiwan", "view", "-format=csv", "-prec=10", f"-units={units}", "-idform='{:Ee}{:AAA}{:m}'", f71_file], capture_output=True)
+    return parse_obiwan_csv(output.stdout.decode())
+
+
+def parse_obiwan_csv(text):
+    '''Parses the output of obiwan view -format=csv (saved obiwan output works too).
+       Returns ({nuclide: array of the values at positions 1, 2, ...}, array of the volumes or None), like read_f71.'''
+    densities = {}
+    volumes = None
+    skip = ["case", "step", "time", "power", "flux"]
+    regexp = re.compile(r"(?P<elem>[a-zA-Z]+)(?P<num>\d+)(?P<meta>m)?")
+    for line in text.split("\n"):
+        data = line.split(',')
+        name = data[0].strip()
+        if name in skip or len(data) < 2:
+            continue
+        values = np.array([float(x) for x in data[1:]])
+        if name == "volume":
+            volumes = values
+            continue
+        dummy = re.search(regexp, name)
+        nuclide = dummy.group("elem").lower() + "-" + str(int(dummy.group("num")))
+        if dummy.group("meta"):
+            nuclide += "m"        # Metastable isotopes
+        densities[nuclide] = values
+    return densities, volumes
+
+
+def molar_masses(nuclides):
+    'Returns {nuclide: g/mol} for nuclides, from MOLAR_MASS or else the mass number.'
+    return {n: MOLAR_MASS.get(n, float(n.split('-')[1].rstrip('m'))) for n in nuclides}
+
+
+def end_pos(pos: int, nlib: int = 1) -> int:
+    '''Returns where the one-library position pos (BURNED_POS, NOBLE_GAS_POS or NOBLE_METAL_POS) is in the
+       ThEIRENE.f71 of a TRITON step with nlib libraries: each depleted mixture takes nlib + 1 positions.'''
+    return pos//2*(int(nlib) + 1)
+
+
+def position(table, pos: int):
+    'Returns {nuclide: value} at one position (1-based, like pos= in ORIGEN) of a read_f71 table.'
+    return {nuclide: values[pos-1] for nuclide, values in table.items()}
+
+
+def blend(burned, burned_volume: float, refuel_grams, molar_mass, refuel_volume: float):
+    '''Blends burned salt and refuel like ORIGEN's blend=[burnedSalt(0)=1 refuelSalt(0)=1].
+       burned is {nuclide: atoms/barn-cm} in burned_volume, refuel_grams {nuclide: g} with molar masses
+       molar_mass {nuclide: g/mol} in refuel_volume. Returns {nuclide: atoms/barn-cm} of the mixed salt.'''
+    total_volume = burned_volume + refuel_volume
+    mixed = {nuclide: adens * burned_volume / total_volume for nuclide, adens in burned.items()}
+    for nuclide, grams in refuel_grams.items():
+        mixed[nuclide] = mixed.get(nuclide, 0.0) + grams / molar_mass[nuclide] * AVOGADRO / total_volume
+    return mixed
+
+
+def read_mixsalts_inp(inp_file):
+    'Returns the refuel masses {nuclide: g} and volume of the refuelSalt case of a mixsalts.inp file.'
+    with open(inp_file, 'r') as f:
+        text = f.read()
+    start = text.index('case(refuelSalt)')
+    case = text[start:text.index('flux=', start)]      # mat{} block of the refuel
+    grams = {m.group(1): float(m.group(2)) for m in re.finditer(r'([a-z]+-\d+m?)=([-+.0-9Ee]+)', case)}
+    volume = float(re.search(r'volume=([-+.0-9Ee]+)', case).group(1))
+    return grams, volume
+
+##################################################################################################
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python salt_blend.py dep_step_directory [burned salt volume per MTiHM in cm3]")
+        print("The directory needs mixsalts.inp, ThEIRENE.f71 and the updated_core_salt.f71 ORIGEN made from them.")
+        sys.exit(1)
+    path = os.path.expanduser(sys.argv[1])
+    table, volumes = read_f71(os.path.join(path, 'ThEIRENE.f71'))
+    if len(sys.argv) > 2:
+        burned_volume = float(sys.argv[2])
+    elif volumes is not None:
+        burned_volume = volumes[BURNED_POS-1]
+    else:
+        print("obiwan prints no volumes for this .f71 file; give the burned salt volume per MTiHM on the command line.")
+        sys.exit(1)
+    grams, refuel_volume = read_mixsalts_inp(os.path.join(path, 'mixsalts.inp'))
+    mixed = blend(position(table, BURNED_POS), burned_volume, grams, molar_masses(grams), refuel_volume)
+    origen = position(read_f71(os.path.join(path, 'updated_core_salt.f71'))[0], 1)
+    total = sum(origen.values())
+    major = [n for n in origen if origen[n] > 1e-6*total]    # Short-lived nuclides decay in the 1e-6 h step
+    dev = {n: abs(mixed.get(n, 0.0)/origen[n] - 1.0) for n in major}
+    worst = sorted(dev, key=dev.get, reverse=True)[:10]
+    print("Compared {} nuclides above 1e-6 of the total atom density.".format(len(major)))
+    for n in worst:
+        print("    {:10s} ORIGEN {:.6e}  NumPy {:.6e}  rel. dev. {:.2e}".format(n, origen[n], mixed.get(n, 0.0), dev[n]))
+    print("Largest relative deviation: {:.2e}".format(max(dev.values()) if dev else 0.0))
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#
+#              Th-EIRENE Holding Tank Decay (Reduced Chains)
+#
+#     By: C. Erika Moss, Ondrej Chvala
+#
+#     The noble_gases and noble_metals ORIGEN cases only decay the off-gas
+#     and noble metal tank inventories that go into SCALE mixtures 11 and 12.
+#     Only the nuclides of those mixtures are needed, so the decay here is
+#     solved on the reduced chains between them: decays to nuclides outside
+#     the tank set are losses. The decay matrix of a nuclide set is built once
+#     from the table below, and its matrix exponential is kept for every time
+#     step used, so each step after the first is a single matrix-vector
+#     product. scipy is used for the matrix exponential when it is installed.
+#
+#     Check against the tanks ORIGEN decayed (ThEIRENE.f71 positions 4 and 6):
+#         python tank_decay.py dep_step_directory [hours]
+#
+###############################################################################
+
+import os
+import sys
+import numpy as np
+try:
+    import scipy.sparse
+    import scipy.sparse.linalg
+except ImportError:      # NumPy matrix exponential is used instead
+    scipy = None
+
+YEAR: float = 3.15576e7      # Seconds in a year
+DAY: float = 86400.0         # Seconds in a day
+HOUR: float = 3600.0         # Seconds in an hour
+
+# Nuclides of the gaseous fission product tank (mixture 11), in the order of write_noblegas_mat
+NOBLE_GASES = ["xe-123", "xe-124", "xe-126", "xe-128", "xe-129", "xe-130", "xe-131", "xe-132", "xe-133", "xe-134",
+               "xe-135", "xe-136", "kr-78", "kr-80", "kr-82", "kr-83", "kr-84", "kr-85", "kr-86", "i-131",
+               "sr-89", "sr-90", "mo-99", "pr-142", "pr-143", "pm-149"]
+
+# Nuclides of the noble metal tank (mixture 12), in the order of write_noblemetal_mat
+NOBLE_METALS = ["zn-64", "zn-65", "zn-66", "zn-67", "zn-68", "zn-69", "zn-70", "zn-71",
+                "zn-72", "nb-93", "nb-94", "nb-95", "rh-103", "rh-105", "in-113", "in-115",
+                "ga-69", "ga-71", "mo-92", "mo-94", "mo-95", "mo-96", "mo-97", "mo-98",
+                "mo-99", "mo-100", "pd-102", "pd-104", "pd-105", "pd-106", "pd-107", "pd-108",
+                "pd-110", "sn-112", "sn-113", "sn-114", "sn-115", "sn-116", "sn-117", "sn-118",
+                "sn-119", "sn-120", "sn-122", "sn-123", "sn-124", "sn-125", "sn-126", "ge-70",
+                "ge-72", "ge-73", "ge-74", "ge-76", "tc-99", "ag-107", "ag-109", "ag-111",
+                "sb-121", "sb-123", "sb-124", "sb-125", "sb-126", "as-74", "as-75", "ru-96",
+                "ru-98", "ru-99", "ru-100", "ru-101", "ru-102", "ru-103", "ru-104", "ru-105",
+                "ru-106", "cd-106", "cd-108", "cd-110", "cd-111", "cd-112", "cd-113",
+                "cd-114", "cd-116", "i-131", "sr-89", "sr-90", "pr-142", "pr-143", "pm-149"]
+
+# Radioactive tank nuclides: half-life in s and (daughter, branching ratio) pairs (ENSDF).
+# Nuclides not listed are stable or too long-lived to matter (in-115, cd-113, cd-116, mo-100...).
+# Short-lived intermediates are folded into the decay: mo-99 -> tc-99m -> tc-99, ru-106 -> rh-106 -> pd-106.
+DECAY = {
+    'xe-123': (2.08*HOUR, [('i-123', 1.0)]),
+    'xe-133': (5.2475*DAY, [('cs-133', 1.0)]),
+    'xe-135': (9.14*HOUR, [('cs-135', 1.0)]),
+    'kr-85': (10.739*YEAR, [('rb-85', 1.0)]),
+    'i-131': (8.0252*DAY, [('xe-131', 1.0)]),
+    'sr-89': (50.563*DAY, [('y-89', 1.0)]),
+    'sr-90': (28.79*YEAR, [('y-90', 1.0)]),
+    'mo-99': (65.976*HOUR, [('tc-99', 1.0)]),
+    'pr-142': (19.12*HOUR, [('nd-142', 1.0)]),
+    'pr-143': (13.57*DAY, [('nd-143', 1.0)]),
+    'pm-149': (53.08*HOUR, [('sm-149', 1.0)]),
+    'zn-65': (243.93*DAY, [('cu-65', 1.0)]),
+    'zn-69': (56.4*60.0, [('ga-69', 1.0)]),
+    'zn-71': (2.45*60.0, [('ga-71', 1.0)]),
+    'zn-72': (46.5*HOUR, [('ga-72', 1.0)]),
+    'nb-94': (2.03e4*YEAR, [('mo-94', 1.0)]),
+    'nb-95': (34.991*DAY, [('mo-95', 1.0)]),
+    'rh-105': (35.36*HOUR, [('pd-105', 1.0)]),
+    'pd-107': (6.5e6*YEAR, [('ag-107', 1.0)]),
+    'sn-113': (115.09*DAY, [('in-113', 1.0)]),
+    'sn-123': (129.2*DAY, [('sb-123', 1.0)]),
+    'sn-125': (9.64*DAY, [('sb-125', 1.0)]),
+    'sn-126': (2.3e5*YEAR, [('sb-126', 1.0)]),
+    'tc-99': (2.111e5*YEAR, [('ru-99', 1.0)]),
+    'ag-111': (7.45*DAY, [('cd-111', 1.0)]),
+    'sb-124': (60.20*DAY, [('te-124', 1.0)]),
+    'sb-125': (2.7586*YEAR, [('te-125', 1.0)]),
+    'sb-126': (12.35*DAY, [('te-126', 1.0)]),
+    'as-74': (17.77*DAY, [('ge-74', 0.66), ('se-74', 0.34)]),
+    'ru-103': (39.26*DAY, [('rh-103', 1.0)]),
+    'ru-105': (4.44*HOUR, [('rh-105', 1.0)]),
+    'ru-106': (371.8*DAY, [('pd-106', 1.0)]),
+}
+
+
+def _expm(a):
+    'Returns the matrix exponential of a dense matrix by scaling and squaring a Taylor series.'
+    norm = np.abs(a).sum(axis=0).max()
+    s = max(int(np.ceil(np.log2(norm / 0.5))), 0) if norm > 0 else 0
+    a = a / 2.0**s
+    result = np.eye(len(a))
+    term = np.eye(len(a))
+    for k in range(1, 19):
+        term = term @ a / k
+        result = result + term
+    for _ in range(s):
+        result = result @ result
+    return result
+
+
+class ReducedChain(object):
+    'Decay of a fixed set of nuclides, with decays out of the set counted as losses.'
+    def __init__(self, nuclides):
+        self.nuclides = list(nuclides)      # Nuclides of the set, in the order of the composition vectors
+        self.index = {n: i for i, n in enumerate(self.nuclides)}
+        rows, cols, vals = [], [], []
+        for n, (half_life, daughters) in DECAY.items():
+            if n not in self.index:
+                continue
+            lam = np.log(2.0) / half_life
+            i = self.index[n]
+            rows.append(i); cols.append(i); vals.append(-lam)
+            for d, branch in daughters:
+                if d in self.index:
+                    rows.append(self.index[d]); cols.append(i); vals.append(lam*branch)
+        n = len(self.nuclides)
+        if scipy is not None:
+            self.matrix = scipy.sparse.csc_matrix((vals, (rows, cols)), shape=(n, n))
+        else:
+            self.matrix = np.zeros((n, n))
+            np.add.at(self.matrix, (rows, cols), vals)
+        self.propagators = {}               # propagators[seconds] = exp(matrix*seconds)
+
+    def propagator(self, seconds: float):
+        'Returns exp(matrix*seconds), computed once for each time step.'
+        if seconds not in self.propagators:
+            if scipy is not None:
+                self.propagators[seconds] = scipy.sparse.linalg.expm(self.matrix * seconds).toarray()
+            else:
+                self.propagators[seconds] = _expm(self.matrix * seconds)
+        return self.propagators[seconds]
+
+    def decay_vector(self, vector, seconds: float):
+        'Returns a composition vector (in the order of nuclides) after seconds of decay.'
+        return self.propagator(seconds) @ np.asarray(vector, dtype=float)
+
+
+CHAINS = {}     # CHAINS[tuple of nuclides] = ReducedChain, built on first use
+
+
+def get_chain(nuclides) -> ReducedChain:
+    'Returns the ReducedChain of a nuclide set, building it once.'
+    key = tuple(nuclides)
+    if key not in CHAINS:
+        CHAINS[key] = ReducedChain(key)
+    return CHAINS[key]
+
+
+def decay(densities, seconds: float, nuclides):
+    '''Returns a copy of {nuclide: atoms/barn-cm} with the nuclides of a tank set decayed for seconds.
+       Nuclides of the set missing from densities count as zero; other nuclides are left as they are.'''
+    chain = get_chain(nuclides)
+    decayed = chain.decay_vector([densities.get(n, 0.0) for n in chain.nuclides], seconds)
+    result = dict(densities)
+    result.update(zip(chain.nuclides, decayed))
+    return result
+
+##################################################################################################
+
+if __name__ == '__main__':
+    import salt_blend
+    if len(sys.argv) < 2:
+        print("Usage: python tank_decay.py dep_step_directory [hours, default 1e-6 like the ORIGEN input]")
+        print("The directory needs ThEIRENE.f71 and the noble_gases.f71 and noble_metals.f71 ORIGEN made from it.")
+        sys.exit(1)
+    path = os.path.expanduser(sys.argv[1])
+    hours = float(sys.argv[2]) if len(sys.argv) > 2 else 1e-6
+    table, volumes = salt_blend.read_f71(os.path.join(path, 'ThEIRENE.f71'))
+    for pos, f71_name, tank in [(salt_blend.NOBLE_GAS_POS, 'noble_gases.f71', NOBLE_GASES),
+                                (salt_blend.NOBLE_METAL_POS, 'noble_metals.f71', NOBLE_METALS)]:
+        mine = decay(salt_blend.position(table, pos), hours*HOUR, tank)
+        origen = salt_blend.position(salt_blend.read_f71(os.path.join(path, f71_name))[0], 1)
+        dev = {n: abs(mine[n]/origen[n] - 1.0) for n in tank if origen.get(n, 0.0) > 0}
+        worst = max(dev, key=dev.get) if dev else None
+        print("{}: largest relative deviation {:.2e} ({})".format(f71_name, dev[worst] if worst else 0.0, worst))
@@ -0,0 +1,87 @@
+###############################################################################
+#
+#              Th-EIRENE Fuel Salt Blending Tests
+#
+#     By: C. Erika Moss, Ondrej Chvala
+#
+#     data/blend_step holds one blend step as saved obiwan CSV output:
+#     ThEIRENE.csv (ThEIRENE.f71, burned salt at position 2), the
+#     mixsalts.inp the driver wrote for a 30000 cm3 refuel in step 1, and
+#     blend_reference.csv, the blended salt. The reference was worked out
+#     as an exact mole and volume balance (fractions.Fraction) of the same
+#     inputs, the balance ORIGEN's blend=[...] does; the 1e-6 h decay of
+#     the blend case is left out, so only nuclides above 1e-6 of the total
+#     atom density are compared. Replacing it with the obiwan output of an
+#     updated_core_salt.f71 from a real step checks the blend against
+#     ORIGEN itself (ThEIRENE.csv and mixsalts.inp of that step go with it).
+#
+#         python -m pytest ThEIRENE/10-refuleburn/tests
+#
+###############################################################################
+
+import os
+import sys
+import pytest
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'blend_step')
+sys.path.insert(0, HERE)
+
+import salt_blend
+
+TOL: float = 1e-6        # Largest relative deviation from the reference blend
+
+
+def read_csv(name):
+    'Returns the (table, volumes) of a saved obiwan CSV file of the fixture.'
+    with open(os.path.join(DATA, name), 'r') as f:
+        return salt_blend.parse_obiwan_csv(f.read())
+
+
+def test_blend_matches_reference():
+    'The NumPy blend of the stored step matches the stored blended salt.'
+    table, volumes = read_csv('ThEIRENE.csv')
+    grams, refuel_volume = salt_blend.read_mixsalts_inp(os.path.join(DATA, 'mixsalts.inp'))
+    burned_volume = volumes[salt_blend.BURNED_POS-1]
+    mixed = salt_blend.blend(salt_blend.position(table, salt_blend.BURNED_POS), burned_volume,
+                             grams, salt_blend.molar_masses(grams), refuel_volume)
+    ref_table, ref_volumes = read_csv('blend_reference.csv')
+    reference = salt_blend.position(ref_table, 1)
+    total = sum(reference.values())
+    major = [n for n in reference if reference[n] > 1e-6*total]
+    assert len(major) >= 10
+    for n in major:
+        assert mixed[n] == pytest.approx(reference[n], rel=TOL), n
+    assert burned_volume + refuel_volume == pytest.approx(ref_volumes[0], rel=TOL)
+
+
+def test_blend_conserves_atoms():
+    'Every nuclide keeps its atoms: burned salt atoms plus refuel atoms end up in the blended volume.'
+    burned = {'u-235': 1e-4, 'u-238': 4e-4, 'th-232': 1.4e-3, 'f-19': 4.9e-2}
+    grams = {'u-235': 300.0, 'f-19': 4000.0}
+    molar_mass = salt_blend.molar_masses(grams)
+    mixed = salt_blend.blend(burned, 1.0e6, grams, molar_mass, 2500.0)
+    for n in set(burned) | set(grams):
+        atoms = burned.get(n, 0.0)*1.0e6 + grams.get(n, 0.0)/molar_mass.get(n, 1.0)*salt_blend.AVOGADRO
+        assert mixed[n]*(1.0e6 + 2500.0) == pytest.approx(atoms, rel=1e-12), n
+
+
+def test_read_mixsalts_inp_matches_driver(tmp_path):
+    'read_mixsalts_inp returns the refuel masses and volume the driver writes into mixsalts.inp.'
+    batchfeed = pytest.importorskip('batchfeed_ORIGEN_ThEIRENE')
+    decks = batchfeed.ThEIRENE_Deck(str(tmp_path))
+    os.makedirs(decks.step_path(0))
+    decks.write_ORIGEN(30000, 1)
+    grams, volume = salt_blend.read_mixsalts_inp(os.path.join(decks.step_path(0), 'mixsalts.inp'))
+    driver_grams, driver_volume = decks.get_refuel_grams(30000, 1)
+    assert grams == pytest.approx(driver_grams, rel=1e-12)
+    assert volume == pytest.approx(driver_volume, rel=1e-12)
+
+
+def test_continuous_feed_needs_numpy_blend(tmp_path):
+    'Continuous feed with the ORIGEN blend is refused when the campaign spec is applied.'
+    batchfeed = pytest.importorskip('batchfeed_ORIGEN_ThEIRENE')
+    with pytest.raises(ValueError):
+        batchfeed.ThEIRENE_Deck(str(tmp_path), spec={'refuel': {'feed_mode': 'continuous'}, 'blend': 'origen'})
+    decks = batchfeed.ThEIRENE_Deck(str(tmp_path), spec={'refuel': {'feed_mode': 'continuous'}})
+    assert decks.blend_engine == 'numpy'
@@ -17,7 +17,12 @@ import numpy as np
 import os
 import subprocess
 import sys, re
-from numpy import genfromtxt
+
+# run_state.py is one of the shared Sourdough scripts in EIRENE/02-TRITON/03-Sourdough/Scripts
+SOURDOUGH_SCRIPTS = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'EIRENE', '02-TRITON', '03-Sourdough', 'Scripts'))
+if SOURDOUGH_SCRIPTS not in sys.path:
+    sys.path.append(SOURDOUGH_SCRIPTS)
+from run_state import RunStateDB
 
 SCALE_bin_path = '/home/sigma/codes/SCALE/SCALE-6.3.1/bin/'
 
@@ -25,14 +30,16 @@ f71_name = 'ThEIRENE.f71'     # Name of the .f71 file; change to ThEIRENE.f71 fo
 
 ################################################################################
 
+run_state = None    # Campaign run-state database, opened on first read
+
 def read_fuel_salt_volume(iter):
     'Reads the fuel salt volume at the current depletion step.'
-    # Change to directory for the specified refuel salt enrichment level:
+    # Depletion step directory for the specified refuel salt enrichment level:
     dep_path = os.path.expanduser('~/ThEIRENE_Batch/dep_step_{}'.format(iter))
-    os.chdir(dep_path)
-    
-    filename = 'Salt_volume_dep_step_{}.out'.format(iter)
-    volume = genfromtxt(filename)
+    global run_state
+    if run_state is None:
+        run_state = RunStateDB(os.path.join(os.path.dirname(dep_path), 'run_state.db'))
+    volume = run_state.get(iter, 'salt_volume', dep_path)   # Falls back to Salt_volume_dep_step_N.out for older campaigns
     
     return volume
 
@@ -99,6 +106,10 @@ def get_burned_salt_adens(iter):
     dep_path = os.path.expanduser('~/ThEIRENE_Batch/dep_step_{}'.format(iter))
     os.chdir(dep_path)
     
+    global run_state
+    if run_state is None:
+        run_state = RunStateDB(os.path.join(os.path.dirname(dep_path), 'run_state.db'))
+    pos = int(run_state.get(iter, 'nlib') or 1) + 1     # End of the fuel salt: each TRITON library adds a position
     output = subprocess.run([f"{SCALE_bin_path}/obiwan", "view", "-format=csv", "-prec=10", "-units=atom", "-idform='{:Ee}{:AAA}{:m}'", f71_name], capture_output=True)
     output = output.stdout.decode().split("\n")
     densities = {} # densities[nuclide] = (density at position 0 of f71 file)
@@ -116,7 +127,7 @@ def get_burned_salt_adens(iter):
                 nuclide = elem + "-" + str(num) + "m"   # for metastable isotopes
             else:
                 nuclide = elem + "-" + str(num)
-            densities[nuclide] = float(data[2])  # Position 0 is isotope names, 1 is BOC data, 2 is EOC data)
+            densities[nuclide] = float(data[pos])  # Position 0 is isotope names, 1 is BOC data, pos is EOC data)
             
             sorted_densities = {k: v for k, v in sorted(densities.items(), key=lambda item: -item[1])}
         